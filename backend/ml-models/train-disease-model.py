@@ -1,4 +1,6 @@
 
+import sys
+import argparse
 import numpy as np
 import pandas as pd
 import os
@@ -10,6 +12,11 @@ from sklearn.metrics import accuracy_score, classification_report
 import warnings
 warnings.filterwarnings('ignore')
 
+# Shared image shard and feature stages from the disease-detection trainers
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../ml-models/disease-detection'))
+from image_shards import has_image_splits, make_tf_dataset, prepare_image_splits
+from image_features import DEFAULT_EXTRACTOR, EXTRACTORS
+
 TENSORFLOW_AVAILABLE = False
 try:
     import tensorflow as tf
@@ -34,6 +41,7 @@ class DiseaseDetectionModel:
         self.classes = []
         self.img_size = 224
         self.use_tensorflow = TENSORFLOW_AVAILABLE
+        self.image_features = None
         
     def create_tensorflow_model(self, num_classes):
         """Create CNN model for disease detection (TensorFlow)"""
@@ -114,12 +122,15 @@ class DiseaseDetectionModel:
         
         return X, y, classes
     
-    def train(self, epochs=30, batch_size=16):
-        """Train the model"""
+    def train(self, epochs=30, batch_size=16, data_dir=None):
+        """Train the model on data_dir/train and data_dir/val when given, else on synthetic data"""
         print("=" * 60)
         print("Training Disease Detection Model")
         print("=" * 60)
         
+        if has_image_splits(data_dir):
+            return self.train_on_images(data_dir, epochs, batch_size)
+        
         X, y, classes = self.create_synthetic_data(num_samples=2000)
         
         if self.use_tensorflow:
@@ -175,6 +186,38 @@ class DiseaseDetectionModel:
         print("\n✅ Model training completed successfully!")
         return True
     
+    def train_on_images(self, data_dir, epochs=30, batch_size=16):
+        """Train from class-per-folder photos, decoded once into uint8 shards"""
+        train_images, val_images = prepare_image_splits(data_dir)
+        self.classes = train_images.classes
+        
+        print(f"Training samples: {len(train_images)}")
+        print(f"Validation samples: {len(val_images)}")
+        print(f"Number of classes: {len(self.classes)}")
+        
+        if self.use_tensorflow:
+            self.model = self.create_tensorflow_model(len(self.classes))
+            train_ds = make_tf_dataset(train_images, batch_size, shuffle=True)
+            val_ds = make_tf_dataset(val_images, batch_size)
+            self.model.fit(train_ds, validation_data=val_ds, epochs=epochs, verbose=1)
+            val_loss, val_accuracy = self.model.evaluate(val_ds, verbose=0)
+        else:
+            # Compact colour/texture features instead of 150k raw pixels per photo
+            self.image_features = DEFAULT_EXTRACTOR
+            extract = EXTRACTORS[DEFAULT_EXTRACTOR]
+            self.model = self.create_sklearn_model(len(self.classes))
+            
+            print("Training Random Forest model...")
+            self.model.fit(train_images.features(extract), train_images.labels)
+            y_pred = self.model.predict(val_images.features(extract))
+            val_accuracy = accuracy_score(val_images.labels, y_pred)
+        
+        print(f"\n✅ Validation Accuracy: {val_accuracy:.4f}")
+        self.save_model()
+        
+        print("\n✅ Model training completed successfully!")
+        return True
+    
     def save_model(self):
         """Save the trained model"""
         model_dir = os.path.join(os.path.dirname(__file__), 'plant-disease')
@@ -199,7 +242,8 @@ class DiseaseDetectionModel:
             'classes': self.classes,
             'num_classes': len(self.classes),
             'img_size': self.img_size,
-            'tensorflow_available': self.use_tensorflow
+            'tensorflow_available': self.use_tensorflow,
+            'image_features': self.image_features
         }
         metadata_path = os.path.join(model_dir, 'model_metadata.json')
         with open(metadata_path, 'w') as f:
@@ -207,20 +251,25 @@ class DiseaseDetectionModel:
         print(f"✅ Model metadata saved to {metadata_path}")
 
 def main():
+    parser = argparse.ArgumentParser(description='Train the backend disease detection model')
+    parser.add_argument('--data', type=str, help='Folder with train/ and val/ class subfolders (synthetic data if omitted)')
+    args = parser.parse_args()
+    
     print("\n" + "=" * 60)
     print("Disease Detection Model Training")
     print("=" * 60)
     
     disease_model = DiseaseDetectionModel()
     
-    success = disease_model.train(epochs=30, batch_size=16)
+    success = disease_model.train(epochs=30, batch_size=16, data_dir=args.data)
     
     if success:
         print("\n" + "=" * 60)
         print("✅ Training Complete!")
         print("=" * 60)
-        print("\n💡 Note: This model was trained on synthetic data.")
-        print("   For production use, replace with real PlantVillage dataset.")
+        if not args.data:
+            print("\n💡 Note: This model was trained on synthetic data.")
+            print("   For production use, replace with real PlantVillage dataset.")
         print("\n📁 Model saved to: backend/ml-models/plant-disease/")
     else:
         print("\n❌ Training failed. Check errors above.")
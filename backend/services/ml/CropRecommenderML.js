@@ -1,13 +1,21 @@
-const { spawn } = require('child_process');
 const path = require('path');
 const fs = require('fs');
 const logger = require('../../utils/logger');
+const PythonWorker = require('./PythonWorker');
 
 class CropRecommenderML {
   constructor() {
     this.modelPath = path.join(__dirname, '../../models');
     this.pythonScriptPath = path.join(__dirname, 'predict_crop.py');
     this.isPythonAvailable = this.checkPythonAvailability();
+    this.workers = new Map();
+  }
+
+  getWorker(scriptPath = this.pythonScriptPath) {
+    if (!this.workers.has(scriptPath)) {
+      this.workers.set(scriptPath, new PythonWorker(scriptPath));
+    }
+    return this.workers.get(scriptPath);
   }
 
   checkPythonAvailability() {
@@ -40,44 +48,14 @@ class CropRecommenderML {
   }
 
   async predictWithEnhancedModel(features, scriptPath) {
-    return new Promise((resolve) => {
-      const pythonProcess = spawn('python3', [scriptPath, JSON.stringify(features)], {
-        cwd: path.dirname(scriptPath),
-        env: { ...process.env, PYTHONUNBUFFERED: '1' }
-      });
-      
-      let stdout = '';
-      let stderr = '';
-      
-      pythonProcess.stdout.on('data', (data) => {
-        stdout += data.toString();
-      });
-      
-      pythonProcess.stderr.on('data', (data) => {
-        stderr += data.toString();
-      });
-      
-      pythonProcess.on('close', (code) => {
-        if (code === 0 && stdout.trim()) {
-          try {
-            const result = JSON.parse(stdout.trim());
-            logger.info('✅ Enhanced ML model prediction successful');
-            resolve(result);
-          } catch (e) {
-            logger.warn('Failed to parse enhanced ML model output, using fallback');
-            resolve(this.predictWithJavaScript(features));
-          }
-        } else {
-          logger.warn(`Enhanced ML model script exited with code ${code}: ${stderr.substring(0, 200)}`);
-          resolve(this.predictWithJavaScript(features));
-        }
-      });
-      
-      pythonProcess.on('error', (error) => {
-        logger.warn(`Failed to run enhanced ML model script: ${error.message}`);
-        resolve(this.predictWithJavaScript(features));
-      });
-    });
+    try {
+      const result = await this.getWorker(scriptPath).request(features);
+      logger.info('✅ Enhanced ML model prediction successful');
+      return result;
+    } catch (error) {
+      logger.warn(`Enhanced ML model worker failed: ${error.message}`);
+      return this.predictWithJavaScript(features);
+    }
   }
 
   async predictWithPython(features) {
@@ -86,45 +64,12 @@ class CropRecommenderML {
       return await this.predictWithEnhancedModel(features, enhancedScriptPath);
     }
     
-    return new Promise((resolve) => {
-      const pythonProcess = spawn('python3', [
-        this.pythonScriptPath,
-        JSON.stringify(features)
-      ], {
-        cwd: path.dirname(this.pythonScriptPath)
-      });
-
-      let output = '';
-      let errorOutput = '';
-
-      pythonProcess.stdout.on('data', (data) => {
-        output += data.toString();
-      });
-
-      pythonProcess.stderr.on('data', (data) => {
-        errorOutput += data.toString();
-      });
-
-      pythonProcess.on('close', (code) => {
-        if (code === 0) {
-          try {
-            const recommendations = JSON.parse(output.trim());
-            resolve(recommendations);
-          } catch (parseError) {
-            logger.error('Failed to parse Python output:', parseError);
-            resolve(this.predictWithJavaScript(features));
-          }
-        } else {
-          logger.error('Python script error:', errorOutput);
-          resolve(this.predictWithJavaScript(features));
-        }
-      });
-
-      pythonProcess.on('error', (error) => {
-        logger.error('Python process error:', error);
-        resolve(this.predictWithJavaScript(features));
-      });
-    });
+    try {
+      return await this.getWorker().request(features);
+    } catch (error) {
+      logger.error('Python worker error:', error);
+      return this.predictWithJavaScript(features);
+    }
   }
 
   predictWithJavaScript(features) {
@@ -0,0 +1,120 @@
+const { spawn } = require('child_process');
+const path = require('path');
+const logger = require('../../utils/logger');
+
+/**
+ * Long-lived Python prediction process speaking newline-delimited JSON.
+ * The script is started lazily with --serve, answers requests in order and
+ * is restarted on the next request if it exits or times out.
+ */
+class PythonWorker {
+  constructor(scriptPath, options = {}) {
+    this.scriptPath = scriptPath;
+    this.pythonPath = options.pythonPath || 'python3';
+    this.args = options.args || ['--serve'];
+    this.timeout = options.timeout || 10000;
+    this.process = null;
+    this.pending = [];
+    this.buffer = '';
+  }
+
+  start() {
+    const child = spawn(this.pythonPath, [this.scriptPath, ...this.args], {
+      cwd: path.dirname(this.scriptPath),
+      env: { ...process.env, PYTHONUNBUFFERED: '1' }
+    });
+
+    child.stdout.on('data', (data) => {
+      this.buffer += data.toString();
+      let newlineIndex = this.buffer.indexOf('\n');
+      while (newlineIndex !== -1) {
+        const line = this.buffer.slice(0, newlineIndex).trim();
+        this.buffer = this.buffer.slice(newlineIndex + 1);
+        if (line) {
+          this.handleLine(line);
+        }
+        newlineIndex = this.buffer.indexOf('\n');
+      }
+    });
+
+    child.stderr.on('data', (data) => {
+      logger.debug(`Python worker stderr: ${data.toString().substring(0, 200)}`);
+    });
+
+    child.stdin.on('error', (error) => {
+      if (this.process === child) {
+        this.reset(new Error(`Python worker stdin error: ${error.message}`));
+      }
+    });
+
+    child.on('exit', (code) => {
+      if (this.process === child) {
+        this.reset(new Error(`Python worker exited with code ${code}`));
+      }
+    });
+
+    child.on('error', (error) => {
+      if (this.process === child) {
+        this.reset(new Error(`Failed to start Python worker: ${error.message}`));
+      }
+    });
+
+    this.process = child;
+    this.buffer = '';
+    logger.info(`Started Python worker for ${path.basename(this.scriptPath)}`);
+  }
+
+  handleLine(line) {
+    const request = this.pending.shift();
+    if (!request) {
+      logger.warn('Python worker produced output with no pending request');
+      return;
+    }
+
+    clearTimeout(request.timer);
+    try {
+      request.resolve(JSON.parse(line));
+    } catch (error) {
+      request.reject(new Error(`Failed to parse Python worker output: ${error.message}`));
+    }
+  }
+
+  reset(error) {
+    const child = this.process;
+    this.process = null;
+    this.buffer = '';
+
+    const pending = this.pending;
+    this.pending = [];
+    pending.forEach((request) => {
+      clearTimeout(request.timer);
+      request.reject(error);
+    });
+
+    if (child && child.exitCode === null) {
+      child.kill();
+    }
+  }
+
+  request(payload) {
+    if (!this.process) {
+      this.start();
+    }
+
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        // Responses are matched by order, so a stuck request poisons the stream.
+        this.reset(new Error('Python worker request timeout'));
+      }, this.timeout);
+
+      this.pending.push({ resolve, reject, timer });
+      this.process.stdin.write(`${JSON.stringify(payload)}\n`);
+    });
+  }
+
+  stop() {
+    this.reset(new Error('Python worker stopped'));
+  }
+}
+
+module.exports = PythonWorker;
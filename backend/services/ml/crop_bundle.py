@@ -0,0 +1,480 @@
+"""
+Compiled Crop Model Bundle
+Flat NumPy export of the crop forest that loads with mmap and needs no sklearn
+
+A bundle is a directory of .npy arrays plus meta.json:
+  roots, depths            per tree: root node id and depth
+  feature, threshold       per node: split feature and threshold
+  children                 per node: [right, left] child node ids, interleaved so
+                           children[2 * node + went_left] is the next node
+                           (leaves point to themselves)
+  value                    per node: leaf output (class probabilities or margin)
+  tree_class               XGBoost only: class each tree contributes to
+  scaler_mean, scaler_scale
+  threshold_offset, threshold_step   int16 variant only: per-feature quantization grid
+
+meta.json carries an artifact_id, a digest of the arrays and the rest of the
+meta, so a copied or redeployed bundle keeps its id while any retrain changes
+it.
+
+Bundles are float64 by default. cast_arrays produces a float32 variant, or one
+with int16-quantized thresholds; export_bundle checks a variant's top-1/top-5
+agreement with the full-precision model on held-out rows before publishing it.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+
+BUNDLE_FORMAT_VERSION = 1
+ARRAY_NAMES = [
+    'roots', 'depths', 'feature', 'threshold', 'children', 'value', 'tree_class',
+    'scaler_mean', 'scaler_scale', 'threshold_offset', 'threshold_step'
+]
+PRECISIONS = ['float64', 'float32', 'int16']
+
+class BundleAgreementError(ValueError):
+    """A reduced-precision variant disagrees too often with the full model"""
+
+def _children(left, right):
+    """Interleaved [right, left] child ids per node, as stored in children.npy"""
+    return np.column_stack([np.concatenate(right), np.concatenate(left)]).ravel().astype(np.int32)
+
+def _sklearn_forest_arrays(model):
+    """Concatenate the trees of a fitted sklearn forest into flat node arrays"""
+    roots, depths = [], []
+    feature, threshold, left, right, value = [], [], [], [], []
+    offset = 0
+
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(n_nodes, dtype=np.int32) + offset
+        is_leaf = tree.children_left == -1
+
+        tree_left = np.where(is_leaf, node_ids, tree.children_left + offset)
+        tree_right = np.where(is_leaf, node_ids, tree.children_right + offset)
+        tree_value = tree.value[:, 0, :].astype(np.float64)
+        tree_value = tree_value / np.maximum(tree_value.sum(axis=1, keepdims=True), 1e-12)
+
+        roots.append(offset)
+        depths.append(tree.max_depth)
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(np.where(is_leaf, 0.0, tree.threshold))
+        left.append(tree_left)
+        right.append(tree_right)
+        value.append(np.where(is_leaf[:, None], tree_value, 0.0))
+        offset += n_nodes
+
+    return {
+        'roots': np.array(roots, dtype=np.int32),
+        'depths': np.array(depths, dtype=np.int32),
+        'feature': np.concatenate(feature).astype(np.int32),
+        'threshold': np.concatenate(threshold).astype(np.float64),
+        'children': _children(left, right),
+        'value': np.concatenate(value).astype(np.float64),
+    }, {'aggregation': 'mean', 'split': 'le', 'base_margin': 0.0}
+
+def _xgboost_arrays(model):
+    """Flatten a fitted XGBClassifier using its exact JSON dump"""
+    booster = model.get_booster()
+    dump = json.loads(booster.save_raw(raw_format='json'))
+    learner = dump['learner']
+    trees = learner['gradient_booster']['model']['trees']
+    tree_info = learner['gradient_booster']['model']['tree_info']
+    n_classes = int(learner['learner_model_param'].get('num_class', '0')) or 1
+
+    try:
+        best_iteration = model.best_iteration
+    except AttributeError:
+        best_iteration = None
+    if best_iteration is not None:
+        trees = trees[:(best_iteration + 1) * n_classes]
+        tree_info = tree_info[:len(trees)]
+
+    roots, depths = [], []
+    feature, threshold, left, right, value = [], [], [], [], []
+    offset = 0
+
+    for tree in trees:
+        tree_left = np.array(tree['left_children'], dtype=np.int64)
+        tree_right = np.array(tree['right_children'], dtype=np.int64)
+        conditions = np.array(tree['split_conditions'], dtype=np.float32).astype(np.float64)
+        n_nodes = len(tree_left)
+        node_ids = np.arange(n_nodes, dtype=np.int64) + offset
+        is_leaf = tree_left == -1
+
+        depth = np.zeros(n_nodes, dtype=np.int32)
+        for node in range(n_nodes):
+            if not is_leaf[node]:
+                depth[tree_left[node]] = depth[node] + 1
+                depth[tree_right[node]] = depth[node] + 1
+
+        roots.append(offset)
+        depths.append(int(depth.max()))
+        feature.append(np.where(is_leaf, 0, np.array(tree['split_indices'], dtype=np.int64)))
+        threshold.append(np.where(is_leaf, 0.0, conditions))
+        left.append(np.where(is_leaf, node_ids, tree_left + offset))
+        right.append(np.where(is_leaf, node_ids, tree_right + offset))
+        value.append(np.where(is_leaf, conditions, 0.0)[:, None])
+        offset += n_nodes
+
+    base_score = float(learner['learner_model_param'].get('base_score', 0.5))
+    if n_classes == 1:
+        aggregation = 'sigmoid'
+        base_margin = float(np.log(base_score / (1.0 - base_score)))
+    else:
+        aggregation = 'softmax'
+        base_margin = 0.0
+
+    return {
+        'roots': np.array(roots, dtype=np.int32),
+        'depths': np.array(depths, dtype=np.int32),
+        'feature': np.concatenate(feature).astype(np.int32),
+        'threshold': np.concatenate(threshold).astype(np.float64),
+        'children': _children(left, right),
+        'value': np.concatenate(value).astype(np.float64),
+        'tree_class': np.array(tree_info, dtype=np.int32),
+    }, {'aggregation': aggregation, 'split': 'lt', 'base_margin': base_margin}
+
+def model_arrays(model, scaler, label_encoder):
+    """Flatten a fitted forest and scaler into (arrays, meta)"""
+    if hasattr(model, 'estimators_'):
+        arrays, meta = _sklearn_forest_arrays(model)
+        kind = 'random_forest'
+        classes = [str(c) for c in label_encoder.inverse_transform(model.classes_)]
+    elif hasattr(model, 'get_booster'):
+        arrays, meta = _xgboost_arrays(model)
+        kind = 'xgboost'
+        classes = [str(c) for c in label_encoder.classes_]
+    else:
+        raise ValueError(f"Cannot compile {type(model).__name__} into a crop bundle")
+
+    arrays['scaler_mean'] = np.asarray(scaler.mean_, dtype=np.float64)
+    arrays['scaler_scale'] = np.asarray(scaler.scale_, dtype=np.float64)
+
+    meta.update({
+        'format_version': BUNDLE_FORMAT_VERSION,
+        'kind': kind,
+        'classes': classes,
+        'n_features': int(arrays['scaler_mean'].shape[0]),
+        'n_trees': int(arrays['roots'].shape[0]),
+        'n_nodes': int(arrays['feature'].shape[0]),
+        'max_depth': int(arrays['depths'].max()) if len(arrays['depths']) else 0,
+        'precision': 'float64',
+    })
+    return arrays, meta
+
+def compile_model(model, scaler, label_encoder):
+    """In-memory (forest, scaler, labels) engine for an already loaded model"""
+    arrays, meta = model_arrays(model, scaler, label_encoder)
+    return _bundle_objects(arrays, meta)
+
+def _round_down_float32(values):
+    """Largest float32 <= each value, so float32 x <= t32 exactly matches x <= t"""
+    rounded = values.astype(np.float32)
+    too_high = rounded.astype(np.float64) > values
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+def cast_arrays(arrays, meta, precision):
+    """Reduced-precision copy of bundle arrays: 'float32' or 'int16' thresholds"""
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown bundle precision: {precision}")
+    if precision == 'float64':
+        return arrays, meta
+
+    arrays = dict(arrays)
+    meta = dict(meta, precision=precision)
+    threshold = np.asarray(arrays['threshold'], dtype=np.float64)
+    if meta['split'] == 'le':
+        arrays['threshold'] = _round_down_float32(threshold)
+    else:
+        arrays['threshold'] = threshold.astype(np.float32)
+    arrays['value'] = np.asarray(arrays['value']).astype(np.float32)
+    # scaler_mean/scale stay float64: raw inputs that equal a training value
+    # land exactly on a split, and a float32 scaler moves them across it
+
+    if precision == 'int16':
+        n_features = meta['n_features']
+        is_split = arrays['children'][1::2] != np.arange(len(arrays['threshold']))
+        offset = np.zeros(n_features)
+        step = np.ones(n_features)
+        for feature in range(n_features):
+            used = threshold[is_split & (arrays['feature'] == feature)]
+            if used.size:
+                offset[feature] = used.min()
+                step[feature] = max(used.max() - used.min(), 1e-12) / 65533
+        # apply() codes inputs with the stored float32 grid, so thresholds are coded with exactly those values
+        offset = offset.astype(np.float32)
+        step = step.astype(np.float32)
+        grid_offset = offset.astype(np.float64)[arrays['feature']]
+        grid_step = step.astype(np.float64)[arrays['feature']]
+        # Split codes fill [-32767, 32766]; inputs are clipped to the full int16 range
+        codes = np.clip(np.rint((threshold - grid_offset) / grid_step) - 32767, -32768, 32767)
+        arrays['threshold'] = np.where(is_split, codes, 0).astype(np.int16)
+        arrays['threshold_offset'] = offset
+        arrays['threshold_step'] = step
+
+    return arrays, meta
+
+def top_k_agreement(reference, candidate, k=5):
+    """
+    (top-1 agreement, mean top-k overlap) between two predict_proba matrices.
+
+    A candidate top-k class counts as a match when its reference probability
+    reaches the reference's k-th largest, so ties (typically many zero-vote
+    classes) are not reported as disagreements.
+    """
+    k = min(k, reference.shape[1])
+    top1 = float(np.mean(reference.argmax(axis=1) == candidate.argmax(axis=1)))
+    kth_largest = -np.partition(-reference, k - 1, axis=1)[:, k - 1:k]
+    candidate_top = np.argsort(-candidate, axis=1, kind='stable')[:, :k]
+    matches = np.take_along_axis(reference, candidate_top, axis=1) >= kth_largest
+    return top1, float(np.mean(matches.sum(axis=1) / k))
+
+def content_digest(arrays, meta):
+    """sha256 of the arrays (name, dtype, shape, bytes) and of meta without its artifact_id"""
+    digest = hashlib.sha256()
+    for name in sorted(arrays):
+        array = np.ascontiguousarray(arrays[name])
+        digest.update(f'{name}:{array.dtype.str}:{array.shape};'.encode())
+        digest.update(array.tobytes())
+    meta = {key: value for key, value in meta.items() if key != 'artifact_id'}
+    digest.update(json.dumps(meta, sort_keys=True).encode())
+    return digest.hexdigest()
+
+def write_bundle(arrays, meta, bundle_dir):
+    """Atomically replace bundle_dir with the given arrays and meta.json (with its artifact_id)"""
+    meta = dict(meta, artifact_id=content_digest(arrays, meta))
+    tmp_dir = bundle_dir.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), np.ascontiguousarray(array))
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    shutil.rmtree(bundle_dir, ignore_errors=True)
+    os.replace(tmp_dir, bundle_dir)
+    return meta
+
+def export_bundle(model, scaler, label_encoder, bundle_dir, precision='float64',
+                  X_holdout=None, min_top1_agreement=0.99, min_top5_agreement=0.98):
+    """
+    Write model, scaler and class list as a memory-mappable bundle directory.
+
+    For reduced precisions, X_holdout (unscaled rows) is scored by both the
+    original model and the variant; BundleAgreementError is raised instead of
+    publishing when either agreement falls below its threshold.
+    """
+    arrays, meta = model_arrays(model, scaler, label_encoder)
+    arrays, meta = cast_arrays(arrays, meta, precision)
+
+    if precision != 'float64' and X_holdout is not None:
+        forest, bundle_scaler, _ = _bundle_objects(arrays, meta)
+        reference = model.predict_proba(scaler.transform(X_holdout))
+        candidate = forest.predict_proba(bundle_scaler.transform(X_holdout))
+        top1, top5 = top_k_agreement(reference, candidate)
+        meta['agreement'] = {'top1': top1, 'top5': top5, 'holdout_rows': int(len(X_holdout))}
+        if top1 < min_top1_agreement or top5 < min_top5_agreement:
+            raise BundleAgreementError(
+                f"{precision} variant agrees top-1 {top1:.4f} / top-5 {top5:.4f}, "
+                f"below the required {min_top1_agreement} / {min_top5_agreement}"
+            )
+
+    return write_bundle(arrays, meta, bundle_dir)
+
+class BundleScaler:
+    """StandardScaler.transform from stored mean/scale"""
+
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+class BundleLabels:
+    """Stand-in for LabelEncoder exposing classes_ in predict_proba column order"""
+
+    def __init__(self, classes):
+        self.classes_ = np.array(classes)
+
+class BundleForest:
+    """
+    Tree ensemble evaluated straight from bundle arrays.
+
+    All trees advance one level per step for the whole batch: a (rows, trees)
+    matrix of node ids is pushed through feature/threshold/children lookups
+    max_depth times. Leaves point to themselves, so shallow trees just stay put
+    and no per-tree Python loop is needed.
+    """
+
+    # Upper bound on rows * trees * outputs held in memory per chunk
+    CHUNK_ELEMENTS = 1 << 22
+    # Below this many rows * trees * outputs, sum leaf values in one gather
+    GATHER_ELEMENTS = 1 << 18
+
+    def __init__(self, arrays, meta):
+        self.arrays = arrays
+        self.meta = meta
+        self.n_classes = len(meta['classes'])
+        self.n_trees = int(arrays['roots'].shape[0])
+        self.max_depth = int(meta['max_depth'])
+        self.n_outputs = arrays['value'].shape[1]
+        # Used straight from the (memory-mapped) arrays, so workers share their pages
+        self.roots = arrays['roots']
+        if 'children' in arrays:
+            self.children = arrays['children']
+        else:
+            # Bundles exported before children.npy kept left.npy and right.npy
+            self.children = np.column_stack([arrays['right'], arrays['left']]).ravel()
+
+        if meta['aggregation'] == 'softmax':
+            # Route each tree's margin to its class column with one matmul
+            self.tree_to_class = np.zeros((self.n_trees, self.n_classes))
+            self.tree_to_class[np.arange(self.n_trees), arrays['tree_class']] = 1.0
+
+    def apply(self, X):
+        """Leaf node id reached in every tree, shape (n_samples, n_trees)"""
+        a = self.arrays
+        n_samples, n_features = X.shape
+        if 'threshold_step' in a:
+            # int16 variant: compare inputs on the same per-feature grid as the thresholds
+            codes = np.rint((X - a['threshold_offset']) / a['threshold_step']) - 32767
+            X = np.clip(codes, -32768, 32767).astype(np.int32)
+        flat_X = np.ascontiguousarray(X).ravel()
+        row_offset = (np.arange(n_samples, dtype=np.intp) * n_features)[:, None]
+        node = np.broadcast_to(self.roots, (n_samples, self.n_trees))
+        strict = self.meta['split'] == 'lt'
+
+        for _ in range(self.max_depth):
+            x = flat_X[row_offset + a['feature'][node]]
+            go_left = x < a['threshold'][node] if strict else x <= a['threshold'][node]
+            node = self.children[2 * node + go_left]
+        return node
+
+    def _predict_chunk(self, X):
+        leaves = self.apply(X)
+        aggregation = self.meta['aggregation']
+
+        if aggregation == 'mean':
+            if leaves.size * self.n_outputs <= self.GATHER_ELEMENTS:
+                return self.arrays['value'][leaves].sum(axis=1) / self.n_trees
+            # Large batches: accumulate tree by tree instead of a (rows, trees, classes) gather
+            proba = np.zeros((X.shape[0], self.n_classes))
+            for tree in range(self.n_trees):
+                proba += self.arrays['value'][leaves[:, tree]]
+            return proba / self.n_trees
+
+        leaf_margin = self.arrays['value'][leaves, 0]
+        if aggregation == 'sigmoid':
+            positive = 1.0 / (1.0 + np.exp(-(self.meta['base_margin'] + leaf_margin.sum(axis=1))))
+            return np.column_stack([1.0 - positive, positive])
+
+        margin = self.meta['base_margin'] + leaf_margin @ self.tree_to_class
+        margin -= margin.max(axis=1, keepdims=True)
+        exp = np.exp(margin)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict_proba(self, X):
+        # Trees compare float32 features against their thresholds, as sklearn and XGBoost do.
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        chunk = max(1, self.CHUNK_ELEMENTS // max(1, self.n_trees * self.n_outputs))
+        if X.shape[0] <= chunk:
+            return self._predict_chunk(X)
+        return np.vstack([self._predict_chunk(X[start:start + chunk]) for start in range(0, X.shape[0], chunk)])
+
+def _bundle_objects(arrays, meta):
+    forest = BundleForest(arrays, meta)
+    scaler = BundleScaler(arrays['scaler_mean'], arrays['scaler_scale'])
+    return forest, scaler, BundleLabels(meta['classes'])
+
+def load_bundle(bundle_dir, mmap_mode='r'):
+    """Load a bundle as (forest, scaler, labels), memory-mapping every array"""
+    with open(os.path.join(bundle_dir, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    if meta.get('format_version') != BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported crop bundle format: {meta.get('format_version')}")
+
+    arrays = {}
+    for name in ARRAY_NAMES + ['left', 'right']:
+        path = os.path.join(bundle_dir, f'{name}.npy')
+        if os.path.exists(path):
+            arrays[name] = np.load(path, mmap_mode=mmap_mode)
+
+    return _bundle_objects(arrays, meta)
+
+# Sampling ranges for N, P, K, temperature, humidity, ph, rainfall
+BENCHMARK_FEATURE_RANGES = np.array([
+    [0, 140], [5, 145], [5, 205], [8, 44], [14, 100], [3.5, 10], [20, 3000]
+], dtype=np.float64)
+
+def benchmark(model, scaler, label_encoder, batch_sizes=(1, 64, 10000), repeats=20, seed=42):
+    """Time the compiled engine against model.predict_proba and check they agree"""
+    import time
+
+    forest, _, _ = compile_model(model, scaler, label_encoder)
+    rng = np.random.default_rng(seed)
+    results = []
+
+    for batch_size in batch_sizes:
+        raw = rng.uniform(BENCHMARK_FEATURE_RANGES[:, 0], BENCHMARK_FEATURE_RANGES[:, 1], size=(batch_size, 7))
+        X = scaler.transform(raw)
+        runs = repeats if batch_size < 1000 else max(1, repeats // 10)
+
+        timings = {}
+        outputs = {}
+        for name, predict in (('sklearn', model.predict_proba), ('engine', forest.predict_proba)):
+            elapsed = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                outputs[name] = predict(X)
+                elapsed.append(time.perf_counter() - start)
+            timings[name] = float(np.median(elapsed)) * 1000
+
+        results.append({
+            'batch_size': batch_size,
+            'sklearn_ms': round(timings['sklearn'], 3),
+            'engine_ms': round(timings['engine'], 3),
+            'speedup': round(timings['sklearn'] / max(timings['engine'], 1e-9), 2),
+            'max_abs_diff': float(np.abs(outputs['sklearn'] - outputs['engine']).max()),
+        })
+
+    return results
+
+def main():
+    """Benchmark the compiled engine against the pickled crop model"""
+    import argparse
+    import joblib
+    import warnings
+
+    warnings.filterwarnings('ignore')
+
+    default_models_dir = os.path.join(os.path.dirname(__file__), '../../models')
+    parser = argparse.ArgumentParser(description='Compiled crop model bundle tools')
+    parser.add_argument('--benchmark', action='store_true', help='Compare engine and sklearn latency at several batch sizes')
+    parser.add_argument('--models-dir', type=str, default=default_models_dir, help='Directory holding crop_recommender.pkl, scaler.pkl and label_encoder.pkl')
+    parser.add_argument('--batch-sizes', type=str, default='1,64,10000', help='Comma-separated batch sizes')
+    parser.add_argument('--repeats', type=int, default=20, help='Timed runs per batch size')
+    args = parser.parse_args()
+
+    if not args.benchmark:
+        parser.print_help()
+        return
+
+    model = joblib.load(os.path.join(args.models_dir, 'crop_recommender.pkl'))
+    scaler = joblib.load(os.path.join(args.models_dir, 'scaler.pkl'))
+    label_encoder = joblib.load(os.path.join(args.models_dir, 'label_encoder.pkl'))
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+
+    print(f"{'batch':>8} {'sklearn ms':>12} {'engine ms':>12} {'speedup':>8} {'max |diff|':>12}")
+    for row in benchmark(model, scaler, label_encoder, batch_sizes, args.repeats):
+        print(f"{row['batch_size']:>8} {row['sklearn_ms']:>12.3f} {row['engine_ms']:>12.3f} {row['speedup']:>8.2f} {row['max_abs_diff']:>12.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Crop Recommendation Lookup Table
+Top-5 recommendations precomputed over a grid of the 7 model features
+
+Soil tests report N, P, K and pH in bands and weather arrives in buckets, so
+most queries land on a small grid. build_table scores every grid point with the
+live model once and writes a directory of .npy arrays plus meta.json:
+  axis_<feature>    ascending grid values of each feature
+  top_ids           (*grid_shape, 5) int16 ids into meta['classes']
+  top_conf          (*grid_shape, 5) float32 confidences in percent
+meta['model_id'] is the artifact_id of the model that scored the grid;
+predict_crop only uses a table whose model_id matches the current model.
+
+LookupTable.recommend answers rows inside the grid in one of three modes:
+  exact         every feature sits on a grid value (O(1) indexing)
+  nearest       snap each feature to its closest grid value
+  interpolate   multilinear blend of the surrounding cells' top-5 scores
+Rows it cannot answer come back as None and go to the live model.
+deviation_report measures how far each mode drifts from the live model.
+"""
+
+import os
+import json
+
+import numpy as np
+
+from crop_bundle import write_bundle, top_k_agreement
+
+TABLE_FORMAT_VERSION = 1
+FEATURE_NAMES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+LOOKUP_MODES = ['exact', 'nearest', 'interpolate']
+TOP_K = 5
+# Exact mode matches feature values to grid values at this many decimals
+GRID_DECIMALS = 6
+
+# (min, max, points) per feature; 6 points per axis gives ~280k cells (~8 MB)
+DEFAULT_GRID = {
+    'N': (0, 140, 6),
+    'P': (5, 145, 6),
+    'K': (5, 205, 6),
+    'temperature': (10, 40, 6),
+    'humidity': (20, 100, 6),
+    'ph': (4.5, 8.5, 6),
+    'rainfall': (50, 3000, 6),
+}
+
+def parse_axis(spec):
+    """'name=min:max:points' or 'name=v1,v2,...' -> (name, ascending values)"""
+    name, _, values = spec.partition('=')
+    if name not in FEATURE_NAMES:
+        raise ValueError(f"Unknown feature '{name}', expected one of {FEATURE_NAMES}")
+    if ':' in values:
+        low, high, points = values.split(':')
+        return name, np.linspace(float(low), float(high), int(points))
+    return name, np.array(sorted(float(value) for value in values.split(',')))
+
+def grid_axes(overrides=None):
+    """Grid values for every feature: DEFAULT_GRID with per-feature overrides"""
+    overrides = overrides or {}
+    return [
+        np.asarray(overrides[name], dtype=np.float64) if name in overrides
+        else np.linspace(*DEFAULT_GRID[name])
+        for name in FEATURE_NAMES
+    ]
+
+def build_table(axes, table_dir, chunk_size=50000):
+    """Score every grid point with the live predict_crop model and write the table"""
+    import predict_crop
+
+    shape = tuple(len(axis) for axis in axes)
+    n_cells = int(np.prod(shape))
+    top_ids = None
+    classes = None
+
+    for start in range(0, n_cells, chunk_size):
+        coords = np.unravel_index(np.arange(start, min(start + chunk_size, n_cells)), shape)
+        X = np.column_stack([axis[index] for axis, index in zip(axes, coords)])
+        probabilities, chunk_classes = predict_crop.predict_probabilities(X)
+        chunk_ids, chunk_prob = predict_crop.top_k_indices(probabilities, TOP_K)
+
+        if top_ids is None:
+            classes = [str(crop) for crop in chunk_classes]
+            k = chunk_ids.shape[1]
+            top_ids = np.empty((n_cells, k), dtype=np.int16)
+            top_conf = np.empty((n_cells, k), dtype=np.float32)
+        top_ids[start:start + len(X)] = chunk_ids
+        top_conf[start:start + len(X)] = chunk_prob * 100
+
+    arrays = {f'axis_{name}': axis for name, axis in zip(FEATURE_NAMES, axes)}
+    arrays['top_ids'] = top_ids.reshape(shape + (-1,))
+    arrays['top_conf'] = top_conf.reshape(shape + (-1,))
+    meta = {
+        'format_version': TABLE_FORMAT_VERSION,
+        'features': FEATURE_NAMES,
+        'classes': classes,
+        'grid_shape': list(shape),
+        'model_id': predict_crop.artifact_id(),
+    }
+    write_bundle(arrays, meta, table_dir)
+    return meta
+
+class LookupTable:
+    """Precomputed top-5 recommendations indexed by grid position"""
+
+    def __init__(self, arrays, meta):
+        self.meta = meta
+        self.axes = [np.asarray(arrays[f'axis_{name}']) for name in meta['features']]
+        self.shape = tuple(len(axis) for axis in self.axes)
+        self.top_ids = arrays['top_ids'].reshape(-1, arrays['top_ids'].shape[-1])
+        self.top_conf = arrays['top_conf'].reshape(-1, arrays['top_conf'].shape[-1])
+        self.classes = np.array(meta['classes'])
+        # Grid value -> index per axis and row-major strides for exact lookups
+        self.positions = [
+            {round(float(value), GRID_DECIMALS): i for i, value in enumerate(axis)}
+            for axis in self.axes
+        ]
+        self.strides = [int(np.prod(self.shape[j + 1:])) for j in range(len(self.shape))]
+        self.lower = np.array([axis[0] for axis in self.axes])
+        self.upper = np.array([axis[-1] for axis in self.axes])
+        # Content id of the model the table was built from (predict_crop.artifact_id)
+        self.model_id = meta.get('model_id')
+
+    def _positions(self, X):
+        """Lower grid index and fractional offset towards the next point, per row and feature"""
+        lower = np.empty(X.shape, dtype=np.intp)
+        fraction = np.zeros(X.shape)
+        for j, axis in enumerate(self.axes):
+            if len(axis) == 1:
+                lower[:, j] = 0
+                continue
+            index = np.clip(np.searchsorted(axis, X[:, j], side='right') - 1, 0, len(axis) - 2)
+            lower[:, j] = index
+            fraction[:, j] = (X[:, j] - axis[index]) / (axis[index + 1] - axis[index])
+        return lower, np.clip(fraction, 0.0, 1.0)
+
+    def lookup(self, X, mode='exact'):
+        """(answered row mask, (n_answered, k) class ids, (n_answered, k) confidences)"""
+        if mode not in LOOKUP_MODES:
+            raise ValueError(f"Unknown lookup mode: {mode}")
+        X = np.asarray(X, dtype=np.float64)
+        if mode == 'exact':
+            return self._exact(X)
+
+        inside = np.all((X >= self.lower) & (X <= self.upper), axis=1)
+        lower, fraction = self._positions(X[inside])
+        upper_index = np.minimum(lower + 1, np.array(self.shape) - 1)
+
+        if mode == 'interpolate':
+            ids, conf = self._interpolate(lower, upper_index, fraction)
+            return inside, ids, conf
+
+        index = np.where(fraction >= 0.5, upper_index, lower)
+        flat = np.ravel_multi_index(tuple(index.T), self.shape)
+        return inside, np.asarray(self.top_ids[flat]), np.asarray(self.top_conf[flat])
+
+    def _exact(self, X):
+        """Dictionary lookups per feature; avoids NumPy call overhead for single rows"""
+        answered = np.zeros(len(X), dtype=bool)
+        flat = []
+        for i, row in enumerate(X.tolist()):
+            index = 0
+            for value, positions, stride in zip(row, self.positions, self.strides):
+                position = positions.get(round(value, GRID_DECIMALS))
+                if position is None:
+                    break
+                index += position * stride
+            else:
+                answered[i] = True
+                flat.append(index)
+        flat = np.array(flat, dtype=np.intp)
+        return answered, np.asarray(self.top_ids[flat]), np.asarray(self.top_conf[flat])
+
+    def _interpolate(self, lower, upper_index, fraction):
+        """Blend the top-5 scores of the 2**7 corner cells around each row"""
+        import predict_crop
+
+        n_rows, n_features = lower.shape
+        scores = np.zeros((n_rows, len(self.classes)))
+        rows = np.arange(n_rows)[:, None]
+        for corner in range(1 << n_features):
+            use_upper = ((corner >> np.arange(n_features)) & 1).astype(bool)
+            index = np.where(use_upper, upper_index, lower)
+            weight = np.prod(np.where(use_upper, fraction, 1.0 - fraction), axis=1)
+            if not weight.any():
+                continue
+            flat = np.ravel_multi_index(tuple(index.T), self.shape)
+            np.add.at(scores, (rows, self.top_ids[flat]), weight[:, None] * self.top_conf[flat])
+        return predict_crop.top_k_indices(scores, self.top_ids.shape[1])
+
+    def recommend(self, X, mode='exact'):
+        """Recommendation lists per row of X, None where the table cannot answer"""
+        import predict_crop
+
+        answered, ids, conf = self.lookup(X, mode)
+        results = [None] * len(answered)
+        formatted = predict_crop.format_recommendations(self.classes[ids], conf, method='lookup_table')
+        for i, recommendations in zip(np.flatnonzero(answered), formatted):
+            results[i] = recommendations
+        return results
+
+def load_table(table_dir, mmap_mode='r'):
+    """Load a lookup table directory, memory-mapping its arrays"""
+    with open(os.path.join(table_dir, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    if meta.get('format_version') != TABLE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported crop lookup table format: {meta.get('format_version')}")
+
+    arrays = {
+        name: np.load(os.path.join(table_dir, f'{name}.npy'), mmap_mode=mmap_mode)
+        for name in [f'axis_{feature}' for feature in meta['features']] + ['top_ids', 'top_conf']
+    }
+    return LookupTable(arrays, meta)
+
+def deviation_report(table, n_samples=2000, seed=42):
+    """
+    Compare each lookup mode with the live model.
+
+    'exact' is scored on random grid points, the other modes on points drawn
+    uniformly inside the grid. Confidence error is the mean absolute difference
+    of the top-ranked crop's confidence, in percentage points.
+    """
+    import predict_crop
+
+    rng = np.random.default_rng(seed)
+    on_grid = np.column_stack([rng.choice(axis, size=n_samples) for axis in table.axes])
+    in_grid = rng.uniform(table.lower, table.upper, size=(n_samples, len(table.axes)))
+    report = {}
+
+    for mode in LOOKUP_MODES:
+        X = on_grid if mode == 'exact' else in_grid
+        answered, ids, conf = table.lookup(X, mode)
+        probabilities, classes = predict_crop.predict_probabilities(X[answered])
+        # Map table columns onto the live model's class order
+        column = {str(crop): i for i, crop in enumerate(classes)}
+        candidate = np.zeros_like(probabilities)
+        candidate_ids = np.array([column.get(str(crop), -1) for crop in table.classes])[ids]
+        valid = candidate_ids >= 0
+        rows = np.broadcast_to(np.arange(len(ids))[:, None], ids.shape)
+        candidate[rows[valid], candidate_ids[valid]] = conf[valid] / 100
+
+        top1, top5 = top_k_agreement(probabilities, candidate, TOP_K)
+        live_top1 = probabilities.max(axis=1) * 100
+        report[mode] = {
+            'rows': int(n_samples),
+            'answered': int(answered.sum()),
+            'top1_agreement': round(top1, 4),
+            'top5_overlap': round(top5, 4),
+            'mean_abs_confidence_error': round(float(np.mean(np.abs(conf[:, 0] - live_top1))), 3),
+        }
+
+    return report
+
+def main():
+    """Build a crop lookup table and/or report its deviation from the live model"""
+    import argparse
+    import warnings
+    import predict_crop
+
+    warnings.filterwarnings('ignore')
+
+    parser = argparse.ArgumentParser(description='Precomputed crop recommendation lookup table')
+    parser.add_argument('--build', action='store_true', help='Score the grid with the live model and write the table')
+    parser.add_argument('--report', action='store_true', help='Compare the table with the live model')
+    parser.add_argument('--axis', action='append', default=[], help="Override a grid axis: 'name=min:max:points' or 'name=v1,v2,...'")
+    parser.add_argument('--table-dir', type=str, default=predict_crop.LOOKUP_DIR, help='Lookup table directory')
+    parser.add_argument('--samples', type=int, default=2000, help='Rows per mode in --report')
+    args = parser.parse_args()
+
+    if not (args.build or args.report):
+        parser.print_help()
+        return
+    if not predict_crop.model_available():
+        parser.error('no trained crop model found; run train_model.py first')
+
+    if args.build:
+        axes = grid_axes(dict(parse_axis(spec) for spec in args.axis))
+        meta = build_table(axes, args.table_dir)
+        print(f"Wrote {args.table_dir} (grid {'x'.join(map(str, meta['grid_shape']))}, {len(meta['classes'])} crops)")
+
+    table = load_table(args.table_dir)
+    if table.model_id != predict_crop.artifact_id():
+        print("⚠️ Table was built from a different model artifact; rebuild it with --build")
+    print(json.dumps(deviation_report(table, args.samples), indent=2))
+
+if __name__ == "__main__":
+    main()
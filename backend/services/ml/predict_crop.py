@@ -1,57 +1,387 @@
 """
 Crop Recommendation ML Model
 Uses trained model or rule-based fallback
+
+Run with a JSON argument for a single prediction, or with --serve to keep the
+model loaded and answer newline-delimited JSON requests on stdin (or on a
+local Unix socket with --socket PATH).
+
+Heavy imports (numpy, sklearn via joblib) only happen on the ML path, so the
+rule-based fallback answers without them; --profile-startup reports the cost
+of each stage.
+
+When train_model.py has exported a compiled bundle (models/crop_bundle), the
+forest is evaluated straight from its memory-mapped arrays and the pickles are
+not loaded at all.
+
+Recommendations are memoized in a bounded LRU keyed on the features rounded to
+CROP_RESULT_CACHE_DECIMALS plus the model artifact's mtime; cached queries are
+predicted from the rounded values so a hit returns exactly what a miss would.
+The artifact is re-stat'ed at most every CROP_MODEL_SCAN_TTL seconds and a
+change reloads the model and clears the cache. Send {"command": "cache_stats"}
+to a worker for hit/miss/eviction counters.
+
+Inputs inside the grid of a precomputed crop_lookup.py table (models/crop_lookup)
+are answered from the table according to CROP_LOOKUP_MODE, ahead of the cache.
 """
 
 import sys
 import json
 import os
+import time
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
 
-def predict_crop(features):
-    """Predict crop using ML model or rule-based system"""
-    try:
-        model_path = os.path.join(os.path.dirname(__file__), '../../models/crop_recommender.pkl')
-        
-        if os.path.exists(model_path):
-            import joblib
-            import numpy as np
-            from sklearn.preprocessing import StandardScaler, LabelEncoder
-            
-            model = joblib.load(model_path)
-            scaler = joblib.load(os.path.join(os.path.dirname(__file__), '../../models/scaler.pkl'))
-            label_encoder = joblib.load(os.path.join(os.path.dirname(__file__), '../../models/label_encoder.pkl'))
-            
-            input_features = [
-                features.get('N', 70),
-                features.get('P', 40),
-                features.get('K', 40),
-                features.get('temperature', 25),
-                features.get('humidity', 65),
-                features.get('ph', 7.0),
-                features.get('rainfall', 800)
-            ]
+MODELS_DIR = os.path.join(os.path.dirname(__file__), '../../models')
+MODEL_PATH = os.path.join(MODELS_DIR, 'crop_recommender.pkl')
+SCALER_PATH = os.path.join(MODELS_DIR, 'scaler.pkl')
+ENCODER_PATH = os.path.join(MODELS_DIR, 'label_encoder.pkl')
+BUNDLE_DIR = os.path.join(MODELS_DIR, 'crop_bundle')
+LOOKUP_DIR = os.path.join(MODELS_DIR, 'crop_lookup')
+
+# The compiled NumPy engine avoids sklearn's per-call overhead on small batches;
+# sklearn's own traversal wins on large ones (see crop_bundle.py --benchmark).
+ENGINE_MAX_BATCH = 1000
+
+MODEL_SCAN_TTL = float(os.environ.get('CROP_MODEL_SCAN_TTL', '30'))
+# 0 disables the result cache; batches larger than ENGINE_MAX_BATCH bypass it
+RESULT_CACHE_SIZE = int(os.environ.get('CROP_RESULT_CACHE_SIZE', '4096'))
+RESULT_CACHE_DECIMALS = int(os.environ.get('CROP_RESULT_CACHE_DECIMALS', '2'))
+# How crop_lookup.py tables answer: 'exact', 'nearest', 'interpolate' or 'off'
+LOOKUP_MODE = os.environ.get('CROP_LOOKUP_MODE', 'exact')
+
+_artifacts = None
+_engine = None
+_lookup = None
+_model_version = {'version': None, 'checked_at': None}
+_artifact_id = {'version': None, 'id': None}
+
+class ResultCache:
+    """Thread-safe bounded LRU of recommendation lists with hit/miss/eviction counters"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self.lock:
+            recommendations = self.entries.get(key)
+            if recommendations is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return [dict(item) for item in recommendations]
+
+    def put(self, key, recommendations):
+        with self.lock:
+            self.entries[key] = recommendations
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+_result_cache = ResultCache(RESULT_CACHE_SIZE)
+
+def bundle_available():
+    """True when a compiled crop bundle has been exported"""
+    return os.path.exists(os.path.join(BUNDLE_DIR, 'meta.json'))
+
+def model_available():
+    """True when either the compiled bundle or the pickled model exists"""
+    return bundle_available() or os.path.exists(MODEL_PATH)
+
+def artifact_version():
+    """(path, mtime_ns) of the artifact load_artifacts would use, or None"""
+    for path in (os.path.join(BUNDLE_DIR, 'meta.json'), MODEL_PATH):
+        try:
+            return (path, os.stat(path).st_mtime_ns)
+        except OSError:
+            continue
+    return None
+
+def artifact_id():
+    """
+    Content id of the artifact load_artifacts would use: the bundle's
+    artifact_id, else a sha256 of the model, scaler and encoder pickles.
+    Recomputed only when artifact_version changes; None without a model.
+    """
+    version = artifact_version()
+    if version != _artifact_id['version']:
+        content_id = None
+        if version and bundle_available():
+            with open(os.path.join(BUNDLE_DIR, 'meta.json'), 'r') as f:
+                content_id = json.load(f).get('artifact_id')
+            if content_id is None:
+                # Bundles exported before artifact_id was written
+                from crop_bundle import content_digest, load_bundle
+
+                forest, _, _ = load_bundle(BUNDLE_DIR)
+                content_id = content_digest(forest.arrays, forest.meta)
+        elif version:
+            digest = hashlib.sha256()
+            for path in (MODEL_PATH, SCALER_PATH, ENCODER_PATH):
+                with open(path, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        digest.update(block)
+            content_id = digest.hexdigest()
+        _artifact_id.update(version=version, id=content_id)
+    return _artifact_id['id']
+
+def invalidate_model():
+    """Forget the loaded model and every cached result"""
+    global _artifacts, _engine, _lookup
+    _artifacts = None
+    _engine = None
+    _lookup = None
+    _result_cache.clear()
+
+def model_version():
+    """Current artifact version; re-checked at most once per MODEL_SCAN_TTL seconds"""
+    now = time.monotonic()
+    checked_at = _model_version['checked_at']
+    
+    if checked_at is None or now - checked_at >= MODEL_SCAN_TTL:
+        version = artifact_version()
+        if checked_at is not None and version != _model_version['version']:
+            print(f"Crop model changed ({version}), reloading", file=sys.stderr)
+            invalidate_model()
+        _model_version['version'] = version
+        _model_version['checked_at'] = now
+    
+    return _model_version['version']
+
+def load_artifacts():
+    """Load model, scaler and label encoder once per process"""
+    global _artifacts
+    if _artifacts is None:
+        if bundle_available():
+            from crop_bundle import load_bundle
             
-            input_scaled = scaler.transform([input_features])
-            prediction_encoded = model.predict(input_scaled)[0]
-            prediction = label_encoder.inverse_transform([prediction_encoded])[0]
+            _artifacts = load_bundle(BUNDLE_DIR)
+        else:
+            import joblib
             
-            probabilities = model.predict_proba(input_scaled)[0]
-            confidence = max(probabilities) * 100
+            _artifacts = (
+                joblib.load(MODEL_PATH),
+                joblib.load(SCALER_PATH),
+                joblib.load(ENCODER_PATH)
+            )
+    return _artifacts
+
+def load_engine():
+    """Compiled engine for the pickled model, or None when serving from a bundle or compiling fails"""
+    global _engine
+    if _engine is None:
+        if bundle_available():
+            _engine = False
+        else:
+            from crop_bundle import compile_model
             
-            top_5_idx = np.argsort(probabilities)[-5:][::-1]
-            top_5_crops = label_encoder.inverse_transform(top_5_idx)
-            top_5_conf = probabilities[top_5_idx] * 100
+            try:
+                _engine = compile_model(*load_artifacts())
+            except Exception as e:
+                print(f"Compiled engine unavailable, using model.predict_proba: {e}", file=sys.stderr)
+                _engine = False
+    return _engine or None
+
+def load_lookup():
+    """Lookup table built from the current model artifact, or None"""
+    global _lookup
+    if _lookup is None:
+        _lookup = False
+        if LOOKUP_MODE != 'off' and os.path.exists(os.path.join(LOOKUP_DIR, 'meta.json')):
+            from crop_lookup import load_table
             
-            recommendations = [
-                {'crop': crop, 'confidence': round(float(conf), 2), 'method': 'ml_model'}
-                for crop, conf in zip(top_5_crops, top_5_conf)
-            ]
+            try:
+                table = load_table(LOOKUP_DIR)
+                if table.model_id is not None and table.model_id == artifact_id():
+                    _lookup = table
+                else:
+                    print("Ignoring crop lookup table built from a different model", file=sys.stderr)
+            except Exception as e:
+                print(f"Crop lookup table unavailable: {e}", file=sys.stderr)
+    return _lookup or None
+
+FEATURE_DEFAULTS = [
+    ('N', 70),
+    ('P', 40),
+    ('K', 40),
+    ('temperature', 25),
+    ('humidity', 65),
+    ('ph', 7.0),
+    ('rainfall', 800)
+]
+
+def build_feature_matrix(features_list):
+    """Stack feature dicts into one (n_samples, 7) matrix"""
+    import numpy as np
+    
+    return np.array(
+        [[features.get(name, default) for name, default in FEATURE_DEFAULTS] for features in features_list],
+        dtype=float
+    )
+
+def coerce_features(features):
+    """features with the 7 model features as finite floats (defaults filled in); None for an unusable row"""
+    if not isinstance(features, dict):
+        return None
+    try:
+        values = {name: float(features.get(name, default)) for name, default in FEATURE_DEFAULTS}
+    except (TypeError, ValueError):
+        return None
+    if any(value != value or value in (float('inf'), float('-inf')) for value in values.values()):
+        return None
+    return dict(features, **values)
+
+def rule_based_row(features):
+    """get_rule_based_recommendations for one row, with defaults for a row it cannot read"""
+    try:
+        return get_rule_based_recommendations(features)
+    except Exception:
+        return get_rule_based_recommendations({})
+
+def top_k_indices(scores, k=5):
+    """Column ids and values of each row's k largest scores, best first"""
+    import numpy as np
+    
+    k = min(k, scores.shape[1])
+    top_idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top_idx, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    return np.take_along_axis(top_idx, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+def format_recommendations(top_crops, top_conf, method='ml_model'):
+    """Recommendation dicts from (n_samples, k) crop names and percent confidences"""
+    return [
+        [
+            {'crop': str(crop), 'confidence': round(float(conf), 2), 'method': method}
+            for crop, conf in zip(row_crops, row_conf)
+        ]
+        for row_crops, row_conf in zip(top_crops, top_conf)
+    ]
+
+def top_k_recommendations(probabilities, classes, k=5):
+    """Vectorized top-k over every row of a predict_proba matrix"""
+    import numpy as np
+    
+    top_idx, top_prob = top_k_indices(probabilities, k)
+    return format_recommendations(np.asarray(classes)[top_idx], top_prob * 100)
+
+def quantize_features(features):
+    """Cache key part: the 7 model features rounded to RESULT_CACHE_DECIMALS"""
+    return tuple(
+        round(float(features.get(name, default)), RESULT_CACHE_DECIMALS)
+        for name, default in FEATURE_DEFAULTS
+    )
+
+def predict_probabilities(feature_matrix):
+    """(predict_proba matrix, class names of its columns) from the loaded model"""
+    model, scaler, label_encoder = load_artifacts()
+    if len(feature_matrix) <= ENGINE_MAX_BATCH:
+        model, scaler, label_encoder = load_engine() or (model, scaler, label_encoder)
+    
+    input_scaled = scaler.transform(feature_matrix)
+    probabilities = model.predict_proba(input_scaled)
+    
+    # predict_proba columns follow model.classes_, which can be a subset
+    # of the encoder's classes when a crop was missing from the train split.
+    model_classes = getattr(model, 'classes_', None)
+    if model_classes is not None:
+        classes = label_encoder.inverse_transform(model_classes)
+    else:
+        classes = label_encoder.classes_
+    
+    return probabilities, classes
+
+def predict_ml_batch(features_list):
+    """Top-5 recommendations from the loaded model for every feature dict"""
+    return top_k_recommendations(*predict_probabilities(build_feature_matrix(features_list)))
+
+def predict_cached_batch(features_list, version):
+    """predict_ml_batch behind the result cache"""
+    if RESULT_CACHE_SIZE <= 0 or len(features_list) > ENGINE_MAX_BATCH:
+        return predict_ml_batch(features_list)
+    
+    keys = [(version, quantize_features(features)) for features in features_list]
+    results = [_result_cache.get(key) for key in keys]
+    missing = list(dict.fromkeys(key for key, result in zip(keys, results) if result is None))
+    if missing:
+        names = [name for name, _ in FEATURE_DEFAULTS]
+        computed = predict_ml_batch([dict(zip(names, key[1])) for key in missing])
+        fresh = dict(zip(missing, computed))
+        for key, recommendations in fresh.items():
+            _result_cache.put(key, recommendations)
+        results = [
+            result if result is not None else [dict(item) for item in fresh[key]]
+            for key, result in zip(keys, results)
+        ]
+    return results
+
+def predict_crop_batch(features_list):
+    """Predict crops for many feature dicts with a single model pass"""
+    if not features_list:
+        return []
+    
+    # Malformed rows get rule-based answers on their own; the rest still go to the model
+    coerced = [coerce_features(features) for features in features_list]
+    valid = [i for i, features in enumerate(coerced) if features is not None]
+    results = [None] * len(features_list)
+    
+    try:
+        if model_available() and valid:
+            version = model_version()
+            rows = [coerced[i] for i in valid]
+            answers = [None] * len(rows)
+            table = load_lookup()
+            if table is not None:
+                answers = table.recommend(build_feature_matrix(rows), LOOKUP_MODE)
             
-            return recommendations
+            # Rows outside the lookup grid go to the live model
+            pending = [j for j, answer in enumerate(answers) if answer is None]
+            if pending:
+                computed = predict_cached_batch([rows[j] for j in pending], version)
+                for j, recommendations in zip(pending, computed):
+                    answers[j] = recommendations
+            for i, answer in zip(valid, answers):
+                results[i] = answer
     except Exception as e:
         print(f"ML model error: {e}", file=sys.stderr)
+        results = [None] * len(features_list)
     
-    return get_rule_based_recommendations(features)
+    return [
+        result if result is not None else rule_based_row(features)
+        for features, result in zip(features_list, results)
+    ]
+
+def predict_crop(features):
+    """Predict crop using ML model or rule-based system"""
+    return predict_crop_batch([features])[0]
 
 def get_rule_based_recommendations(features):
     """Rule-based fallback recommendations"""
@@ -93,11 +423,181 @@ def get_rule_based_recommendations(features):
     
     return recommendations
 
+def profile_startup(features):
+    """Time imports, artifact loads and predictions stage by stage, in milliseconds"""
+    timings = {}
+    
+    def timed(stage, fn):
+        start = time.perf_counter()
+        result = fn()
+        timings[stage] = round((time.perf_counter() - start) * 1000, 3)
+        return result
+    
+    timed('rule_based', lambda: get_rule_based_recommendations(features))
+    heavy_modules = [name for name in ('numpy', 'sklearn', 'joblib') if name in sys.modules]
+    has_model = model_available()
+    
+    if has_model:
+        global _artifacts
+        timed('import_numpy', lambda: __import__('numpy'))
+        if bundle_available():
+            from crop_bundle import load_bundle
+            
+            _artifacts = timed('load_bundle', lambda: load_bundle(BUNDLE_DIR))
+        else:
+            timed('import_sklearn', lambda: __import__('sklearn.ensemble'))
+            joblib = timed('import_joblib', lambda: __import__('joblib'))
+            model = timed('load_model', lambda: joblib.load(MODEL_PATH))
+            scaler = timed('load_scaler', lambda: joblib.load(SCALER_PATH))
+            label_encoder = timed('load_label_encoder', lambda: joblib.load(ENCODER_PATH))
+            _artifacts = (model, scaler, label_encoder)
+            timed('compile_engine', load_engine)
+        timed('first_prediction', lambda: predict_crop(features))
+        timed('warm_prediction', lambda: predict_crop(features))
+    
+    return {
+        'model_available': has_model,
+        'model_format': 'bundle' if bundle_available() else ('pickle' if has_model else None),
+        'heavy_modules_on_rule_path': heavy_modules,
+        'timings_ms': timings,
+        'total_ms': round(sum(timings.values()), 3)
+    }
+
+def cache_stats():
+    """Result cache counters plus the model version they apply to"""
+    stats = _result_cache.stats()
+    version = _model_version['version']
+    stats['model_version'] = list(version) if version else None
+    return stats
+
+def handle_request(line):
+    """Answer one JSON-encoded feature request (or array of requests); never raises"""
+    payload = None
+    try:
+        payload = json.loads(line)
+        if isinstance(payload, dict) and payload.get('command') == 'cache_stats':
+            return cache_stats()
+        if isinstance(payload, list):
+            return predict_crop_batch(payload)
+        return predict_crop(payload)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        # A batch caller expects one list per row
+        if isinstance(payload, list):
+            return [get_rule_based_recommendations({}) for _ in payload]
+        return get_rule_based_recommendations({})
+
+def warm_up():
+    """Load the model before the first request arrives"""
+    if model_available():
+        try:
+            model_version()
+            load_artifacts()
+            load_engine()
+            load_lookup()
+        except Exception as e:
+            print(f"ML model error: {e}", file=sys.stderr)
+
+def read_batch_file(path):
+    """Read feature dicts from a JSON array or JSONL file ('-' for stdin)"""
+    stream = sys.stdin if path == '-' else open(path, 'r')
+    try:
+        content = stream.read()
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    
+    if content.lstrip().startswith('['):
+        return json.loads(content), False
+    return [json.loads(line) for line in content.splitlines() if line.strip()], True
+
+def run_batch(input_path, output_path=None, batch_size=10000):
+    """Score a JSON array or JSONL file, writing results in the same format"""
+    features_list, jsonl = read_batch_file(input_path)
+    
+    results = []
+    for start in range(0, len(features_list), batch_size):
+        results.extend(predict_crop_batch(features_list[start:start + batch_size]))
+    
+    stream = open(output_path, 'w') if output_path else sys.stdout
+    try:
+        if jsonl:
+            for recommendations in results:
+                stream.write(json.dumps(recommendations) + '\n')
+        else:
+            stream.write(json.dumps(results) + '\n')
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    
+    print(f"Scored {len(results)} feature sets", file=sys.stderr)
+
+def serve(input_stream=None, output_stream=None):
+    """Persistent worker: one JSON request per line in, one JSON response per line out"""
+    input_stream = input_stream or sys.stdin
+    output_stream = output_stream or sys.stdout
+    warm_up()
+
+    for line in input_stream:
+        line = line.strip()
+        if not line:
+            continue
+        output_stream.write(json.dumps(handle_request(line)) + '\n')
+        output_stream.flush()
+
+def serve_socket(socket_path):
+    """Persistent worker listening on a local Unix socket"""
+    import socketserver
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for raw in self.rfile:
+                line = raw.decode('utf-8').strip()
+                if not line:
+                    continue
+                self.wfile.write((json.dumps(handle_request(line)) + '\n').encode('utf-8'))
+                self.wfile.flush()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    warm_up()
+    with socketserver.ThreadingUnixStreamServer(socket_path, RequestHandler) as server:
+        print(f"Crop prediction worker listening on {socket_path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(socket_path)
+
 def main():
     """Main function - called from Node.js"""
+    parser = argparse.ArgumentParser(description='Crop recommendation predictor')
+    parser.add_argument('features', nargs='?', help='JSON-encoded feature dict')
+    parser.add_argument('--serve', action='store_true', help='Answer newline-delimited JSON requests on stdin')
+    parser.add_argument('--socket', type=str, help='Answer newline-delimited JSON requests on a Unix socket')
+    parser.add_argument('--batch', type=str, help="Score a JSON array or JSONL file of feature dicts ('-' for stdin)")
+    parser.add_argument('--output', type=str, help='Write --batch results to this file instead of stdout')
+    parser.add_argument('--batch-size', type=int, default=10000, help='Rows per model pass in --batch mode')
+    parser.add_argument('--profile-startup', action='store_true', help='Report import and load time for each stage')
+    args = parser.parse_args()
+    
+    if args.profile_startup:
+        print(json.dumps(profile_startup(json.loads(args.features) if args.features else {}), indent=2))
+        return
+
+    if args.socket:
+        serve_socket(args.socket)
+        return
+    if args.serve:
+        serve()
+        return
+    if args.batch:
+        run_batch(args.batch, args.output, args.batch_size)
+        return
+
     try:
-        if len(sys.argv) > 1:
-            features = json.loads(sys.argv[1])
+        if args.features:
+            features = json.loads(args.features)
         else:
             features = {}
         
@@ -1,43 +1,86 @@
 """
 Enhanced Crop Recommendation ML Model
 Uses trained models from ml-pipeline with real-time data integration
+
+numpy and sklearn are only imported once a model artifact is found, so the
+rule-based fallback stays cheap; --profile-startup reports each stage.
 """
 
 import sys
 import json
 import os
+import time
 from pathlib import Path
 
+MODELS_DIR = Path(__file__).resolve().parents[3] / 'ml-pipeline' / 'models'
+DEFAULT_FEATURE_NAMES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+MODEL_SCAN_TTL = float(os.environ.get('CROP_MODEL_SCAN_TTL', '30'))
+
+# Loaded artifacts keyed by (path, mtime); only the newest entry is kept.
+_model_cache = {}
+_last_scan = {'key': None, 'scanned_at': None}
+
+def find_latest_model(models_dir=MODELS_DIR):
+    """Return (path, mtime) of the newest crop forest artifact, or None"""
+    crop_models = list(models_dir.glob('*crop*random_forest*.joblib'))
+    if not crop_models:
+        crop_models = list(models_dir.glob('*sample_crop*random_forest*.joblib'))
+    
+    if not crop_models:
+        return None
+    
+    candidates = [(p, p.stat().st_mtime) for p in crop_models]
+    return max(candidates, key=lambda c: c[1])
+
+def load_model_artifacts(model_path, models_dir=MODELS_DIR):
+    """Load (model, scaler, label_encoder, feature_names) from a model artifact"""
+    import joblib
+    
+    model_data = joblib.load(model_path)
+    
+    if isinstance(model_data, dict):
+        return (
+            model_data.get('model'),
+            model_data.get('scaler'),
+            model_data.get('label_encoder'),
+            model_data.get('feature_names', DEFAULT_FEATURE_NAMES)
+        )
+    
+    scaler_path = models_dir / 'scaler.pkl'
+    encoder_path = models_dir / 'label_encoder.pkl'
+    scaler = joblib.load(scaler_path) if scaler_path.exists() else None
+    label_encoder = joblib.load(encoder_path) if encoder_path.exists() else None
+    return model_data, scaler, label_encoder, DEFAULT_FEATURE_NAMES
+
+def get_model_artifacts(models_dir=MODELS_DIR):
+    """Cached model artifacts; rescans the directory at most once per MODEL_SCAN_TTL seconds"""
+    now = time.monotonic()
+    scanned_at = _last_scan['scanned_at']
+    
+    if scanned_at is None or now - scanned_at >= MODEL_SCAN_TTL:
+        _last_scan['key'] = find_latest_model(models_dir)
+        _last_scan['scanned_at'] = now
+    
+    key = _last_scan['key']
+    if key is None:
+        return None
+    
+    if key not in _model_cache:
+        artifacts = load_model_artifacts(key[0], models_dir)
+        _model_cache.clear()
+        _model_cache[key] = artifacts
+    
+    return _model_cache[key]
+
 def predict_crop(features):
     """Predict crop using ML model from ml-pipeline or rule-based system"""
     try:
-        ml_pipeline_models = Path(__file__).resolve().parents[3] / 'ml-pipeline' / 'models'
+        artifacts = get_model_artifacts()
         
-        crop_models = list(ml_pipeline_models.glob('*crop*random_forest*.joblib'))
-        if not crop_models:
-            crop_models = list(ml_pipeline_models.glob('*sample_crop*random_forest*.joblib'))
-        
-        if crop_models:
-            latest_model = max(crop_models, key=lambda p: p.stat().st_mtime)
-            
-            import joblib
+        if artifacts:
             import numpy as np
-            from sklearn.preprocessing import StandardScaler, LabelEncoder
             
-            model_data = joblib.load(latest_model)
-            
-            if isinstance(model_data, dict):
-                model = model_data.get('model')
-                scaler = model_data.get('scaler')
-                label_encoder = model_data.get('label_encoder')
-                feature_names = model_data.get('feature_names', ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall'])
-            else:
-                model = model_data
-                scaler_path = ml_pipeline_models / 'scaler.pkl'
-                encoder_path = ml_pipeline_models / 'label_encoder.pkl'
-                scaler = joblib.load(scaler_path) if scaler_path.exists() else None
-                label_encoder = joblib.load(encoder_path) if encoder_path.exists() else None
-                feature_names = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+            model, scaler, label_encoder, feature_names = artifacts
             
             input_features = [
                 features.get('N', features.get('nitrogen', 70)),
@@ -127,7 +170,67 @@ def get_rule_based_recommendations(features):
     
     return sorted(recommendations, key=lambda x: x['confidence'], reverse=True)[:5]
 
+def profile_startup(features):
+    """Time the directory scan, imports, artifact load and predictions, in milliseconds"""
+    timings = {}
+    
+    def timed(stage, fn):
+        start = time.perf_counter()
+        result = fn()
+        timings[stage] = round((time.perf_counter() - start) * 1000, 3)
+        return result
+    
+    timed('rule_based', lambda: get_rule_based_recommendations(features))
+    heavy_modules = [name for name in ('numpy', 'sklearn', 'joblib') if name in sys.modules]
+    latest = timed('scan_models', find_latest_model)
+    
+    if latest:
+        timed('import_numpy', lambda: __import__('numpy'))
+        timed('import_sklearn', lambda: __import__('sklearn.ensemble'))
+        artifacts = timed('load_model', lambda: load_model_artifacts(latest[0]))
+        _model_cache.clear()
+        _model_cache[latest] = artifacts
+        _last_scan['key'] = latest
+        _last_scan['scanned_at'] = time.monotonic()
+        timed('first_prediction', lambda: predict_crop(features))
+        timed('warm_prediction', lambda: predict_crop(features))
+    
+    return {
+        'model_available': latest is not None,
+        'heavy_modules_on_rule_path': heavy_modules,
+        'timings_ms': timings,
+        'total_ms': round(sum(timings.values()), 3)
+    }
+
+def handle_request(line):
+    """Answer one JSON-encoded feature request; never raises"""
+    try:
+        return predict_crop(json.loads(line))
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return get_rule_based_recommendations({})
+
+def serve(input_stream=None, output_stream=None):
+    """Persistent worker: one JSON request per line in, one JSON response per line out"""
+    input_stream = input_stream or sys.stdin
+    output_stream = output_stream or sys.stdout
+    
+    for line in input_stream:
+        line = line.strip()
+        if not line:
+            continue
+        output_stream.write(json.dumps(handle_request(line)) + '\n')
+        output_stream.flush()
+
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve()
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == '--profile-startup':
+        features = json.loads(sys.argv[2]) if len(sys.argv) > 2 else {}
+        print(json.dumps(profile_startup(features), indent=2))
+        sys.exit(0)
+    
     try:
         if len(sys.argv) > 1:
             features_str = sys.argv[1]
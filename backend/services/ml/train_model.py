@@ -7,12 +7,27 @@ import pandas as pd
 import numpy as np
 import joblib
 import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.metrics import accuracy_score, classification_report
+from pandas.api.types import union_categoricals
 import warnings
 
+from crop_bundle import export_bundle, BundleAgreementError, PRECISIONS
+
+# Dataset cache shared with the ml-models training scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../ml-models'))
+from dataset_cache import load_or_build
+
 warnings.filterwarnings('ignore')
 
 try:
@@ -27,30 +42,167 @@ try:
 except ImportError:
     kagglehub = None
 
-def train_model():
-    """Train the crop recommendation model"""
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.feather as feather  # type: ignore
+except ImportError:
+    pa = None
+    feather = None
+
+KAGGLE_DATASET = "kunshbhatia/crop-production-data-raw-refined"
+DATA_CACHE_DIR = os.path.join(os.path.dirname(__file__), '../../data/cache')
+KAGGLE_LABEL_CACHE = os.path.join(DATA_CACHE_DIR, 'kaggle_crop_labels.arrow')
+CSV_CHUNK_ROWS = 200000
+
+# Candidates for --search. XGBoost n_estimators is an upper bound that early
+# stopping on the validation split cuts down per trial.
+XGB_SEARCH_GRID = {
+    'max_depth': [4, 6, 8],
+    'learning_rate': [0.05, 0.1, 0.2],
+    'n_estimators': [400],
+}
+RF_SEARCH_GRID = {
+    'max_depth': [8, 12, 16, None],
+    'n_estimators': [100, 200, 400],
+}
+EARLY_STOPPING_ROUNDS = 20
+
+DEFAULT_XGB_PARAMS = {'n_estimators': 100, 'max_depth': 6, 'learning_rate': 0.1}
+DEFAULT_RF_PARAMS = {'n_estimators': 200, 'max_depth': 12}
+
+# Scaled matrices memory-mapped once per search worker process
+_search_data = {}
+
+def build_classifier(params, n_jobs=-1):
+    """XGBoost classifier when available, RandomForest otherwise"""
+    if XGBOOST_AVAILABLE:
+        return xgb.XGBClassifier(random_state=42, tree_method="hist", n_jobs=n_jobs, **params)
+    return RandomForestClassifier(random_state=42, n_jobs=n_jobs, **params)
+
+def _init_search_worker(cache_dir):
+    """Process pool initializer: map the cached fit/validation matrices"""
+    warnings.filterwarnings('ignore')
+    for name in ('X_fit', 'y_fit', 'X_val', 'y_val'):
+        _search_data[name] = np.load(os.path.join(cache_dir, f'{name}.npy'), mmap_mode='r')
+
+def _run_trial(params):
+    """Fit one candidate single-threaded and score it on the validation split"""
+    start = time.perf_counter()
+    trial = {'params': params}
+    try:
+        X_fit, y_fit = _search_data['X_fit'], _search_data['y_fit']
+        X_val, y_val = _search_data['X_val'], _search_data['y_val']
+        model = build_classifier(params, n_jobs=1)
+        if XGBOOST_AVAILABLE:
+            model.set_params(early_stopping_rounds=EARLY_STOPPING_ROUNDS, eval_metric='mlogloss')
+            model.fit(X_fit, y_fit, eval_set=[(X_val, y_val)], verbose=False)
+            trial['n_estimators'] = int(model.best_iteration) + 1
+            trial['val_logloss'] = round(float(model.best_score), 4)
+        else:
+            model.fit(X_fit, y_fit)
+            trial['n_estimators'] = params['n_estimators']
+        trial['val_accuracy'] = round(float(accuracy_score(y_val, model.predict(X_val))), 4)
+    except Exception as e:
+        trial['error'] = str(e)
+    trial['wall_time_s'] = round(time.perf_counter() - start, 3)
+    return trial
+
+def search_hyperparameters(X_train_scaled, y_train, workers=None):
+    """
+    Evaluate every candidate of the search grid on a validation split of the
+    training data, one trial per process. The scaled matrices are written to
+    .npy once and memory-mapped by each worker instead of pickled per trial.
+
+    Returns (best params for the final fit, trial reports).
+    """
+    grid = XGB_SEARCH_GRID if XGBOOST_AVAILABLE else RF_SEARCH_GRID
+    candidates = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    workers = min(workers or os.cpu_count() or 1, len(candidates))
+
+    X_fit, X_val, y_fit, y_val = train_test_split(
+        X_train_scaled, y_train, test_size=0.2, random_state=42
+    )
+
+    print(f"🔎 Searching {len(candidates)} configurations on {workers} worker(s)...")
+    search_start = time.perf_counter()
+    cache_dir = tempfile.mkdtemp(prefix='crop_search_')
+    trials = []
+    try:
+        for name, array in (('X_fit', X_fit), ('y_fit', y_fit), ('X_val', X_val), ('y_val', y_val)):
+            np.save(os.path.join(cache_dir, f'{name}.npy'), np.ascontiguousarray(array))
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_search_worker,
+                                 initargs=(cache_dir,)) as pool:
+            futures = [pool.submit(_run_trial, params) for params in candidates]
+            for future in as_completed(futures):
+                trial = future.result()
+                trials.append(trial)
+                if 'error' in trial:
+                    print(f"   ⚠️ {trial['params']}: {trial['error']}")
+                else:
+                    print(f"   {trial['params']} -> val accuracy {trial['val_accuracy']:.2%}, "
+                          f"{trial['n_estimators']} trees, {trial['wall_time_s']:.2f}s")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    scored = [trial for trial in trials if 'error' not in trial]
+    if not scored:
+        raise RuntimeError("every hyperparameter trial failed")
+
+    # Highest accuracy, then lowest validation loss, then fewest trees
+    best = max(scored, key=lambda trial: (
+        trial['val_accuracy'], -trial.get('val_logloss', 0.0), -trial['n_estimators']
+    ))
+    best_params = dict(best['params'], n_estimators=best['n_estimators'])
+    print(f"🏆 Best of {len(trials)} trials in {time.perf_counter() - search_start:.1f}s: "
+          f"{best_params} (val accuracy {best['val_accuracy']:.2%})")
+    return best_params, trials
+
+def train_model(precision='float64', min_top1_agreement=0.99, min_top5_agreement=0.98,
+                search=False, search_workers=None, refresh_data_cache=False):
+    """
+    Train the crop recommendation model.
+
+    precision selects the compiled bundle variant ('float64', 'float32' or
+    'int16'); reduced variants are only published if they agree with the
+    full model on the held-out split, otherwise float64 is written instead.
+
+    With search=True the depth/estimators/learning rate are picked by
+    search_hyperparameters instead of the fixed defaults. refresh_data_cache
+    rebuilds cached training data instead of reusing it.
+    """
     try:
         # 1) Try to build training data from Kaggle crop production dataset
-        df = load_kaggle_training_data()
+        df = load_kaggle_training_data(refresh_data_cache)
         kaggle_used = df is not None
 
         # 2) If Kaggle is not available, fall back to local JSON, then synthetic data
+        feature_columns = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
         if df is None:
             dataset_path = os.path.join(os.path.dirname(__file__), '../../data/crop_data.json')
             
             if os.path.exists(dataset_path):
-                import json
-                with open(dataset_path, 'r') as f:
-                    data = json.load(f)
-                df = pd.DataFrame(data)
-                print(f"📊 Loaded local crop dataset from {dataset_path}")
+                def build():
+                    with open(dataset_path, 'r') as f:
+                        data = json.load(f)
+                    print(f"📊 Loaded local crop dataset from {dataset_path}")
+                    return crop_arrays(pd.DataFrame(data), feature_columns)
+                
+                arrays = load_or_build('crop_json', build, source=dataset_path,
+                                       refresh=refresh_data_cache, cache_dir=DATA_CACHE_DIR)
             else:
-                print("Creating sample synthetic dataset (no Kaggle / local data found)...")
-                df = create_sample_dataset()
+                def build():
+                    print("Creating sample synthetic dataset (no Kaggle / local data found)...")
+                    return crop_arrays(create_sample_dataset(seed=42), feature_columns)
+                
+                arrays = load_or_build('crop_synthetic', build, refresh=refresh_data_cache,
+                                       cache_dir=DATA_CACHE_DIR, num_samples=1000, seed=42)
+            
+            df = pd.DataFrame(np.asarray(arrays['X']), columns=feature_columns)
+            df['label'] = np.asarray(arrays['label'])
         
         print(f"📊 Dataset loaded: {len(df)} samples, {df['label'].nunique()} crops")
         
-        feature_columns = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
         X = df[feature_columns]
         y = df['label']
         
@@ -68,23 +220,16 @@ def train_model():
         if kaggle_used:
             print("🌐 Using Kaggle crop-production dataset as label source for training.")
         
+        params = DEFAULT_XGB_PARAMS if XGBOOST_AVAILABLE else DEFAULT_RF_PARAMS
+        search_trials = None
+        if search:
+            params, search_trials = search_hyperparameters(X_train_scaled, y_train, search_workers)
+        
         if XGBOOST_AVAILABLE:
-            print("🤖 Training XGBoost model...")
-            model = xgb.XGBClassifier(
-                n_estimators=100,
-                max_depth=6,
-                learning_rate=0.1,
-                random_state=42,
-                tree_method="hist",
-            )
+            print(f"🤖 Training XGBoost model {params}...")
         else:
-            print("🤖 XGBoost not available, training RandomForestClassifier instead...")
-            model = RandomForestClassifier(
-                n_estimators=200,
-                max_depth=12,
-                random_state=42,
-                n_jobs=-1,
-            )
+            print(f"🤖 XGBoost not available, training RandomForestClassifier {params} instead...")
+        model = build_classifier(params)
         
         model.fit(X_train_scaled, y_train)
         
@@ -113,6 +258,34 @@ def train_model():
         print(f"   - {scaler_path}")
         print(f"   - {encoder_path}")
         
+        if search_trials is not None:
+            report_path = os.path.join(models_dir, 'crop_search_report.json')
+            with open(report_path, 'w') as f:
+                json.dump({'best_params': params, 'test_accuracy': accuracy, 'trials': search_trials}, f, indent=2, default=str)
+            print(f"   - {report_path}")
+        
+        # Compiled bundle lets predict_crop.py mmap the forest instead of unpickling it
+        bundle_path = os.path.join(models_dir, 'crop_bundle')
+        try:
+            try:
+                bundle_meta = export_bundle(
+                    model, scaler, label_encoder, bundle_path,
+                    precision=precision, X_holdout=X_test.values,
+                    min_top1_agreement=min_top1_agreement,
+                    min_top5_agreement=min_top5_agreement
+                )
+            except BundleAgreementError as e:
+                print(f"⚠️ Not publishing {precision} crop bundle: {e}")
+                bundle_meta = export_bundle(model, scaler, label_encoder, bundle_path)
+            print(f"   - {bundle_path} ({bundle_meta['n_trees']} trees, {bundle_meta['n_nodes']} nodes, {bundle_meta['precision']})")
+            if 'agreement' in bundle_meta:
+                agreement = bundle_meta['agreement']
+                print(f"     agreement with full model: top-1 {agreement['top1']:.4f}, top-5 {agreement['top5']:.4f}")
+        except Exception as e:
+            # A stale bundle would shadow the new pickles, so never leave one behind
+            shutil.rmtree(bundle_path, ignore_errors=True)
+            print(f"⚠️ Could not export compiled crop bundle: {e}")
+        
         return True
         
     except Exception as e:
@@ -122,21 +295,115 @@ def train_model():
         return False
 
 
-def load_kaggle_training_data():
+def find_crop_column(columns):
+    """Name of the crop label column in the Kaggle CSV, or None"""
+    for col in columns:
+        if str(col).lower() in ("crop", "crop_name", "cropname"):
+            return col
+    return None
+
+def stream_crop_labels(csv_path, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Read only the crop column of csv_path, chunk by chunk, as a lowercased
+    categorical Series. Returns None when the CSV has no crop column.
+    """
+    columns = pd.read_csv(csv_path, nrows=0).columns
+    crop_col = find_crop_column(columns)
+    if crop_col is None:
+        print("⚠️ Could not find a 'Crop' column in Kaggle dataset; columns:", list(columns))
+        return None
+
+    chunks = []
+    reader = pd.read_csv(csv_path, usecols=[crop_col], dtype={crop_col: 'string'}, chunksize=chunk_rows)
+    for chunk in reader:
+        crops = chunk[crop_col].dropna().str.strip().str.lower()
+        chunks.append(pd.Categorical(crops.astype(object)))
+
+    if not chunks:
+        return pd.Series(pd.Categorical([]), name='label')
+    return pd.Series(union_categoricals(chunks), name='label')
+
+def write_label_cache(labels, cache_path):
+    """Store labels as an uncompressed, dictionary-encoded Arrow IPC file"""
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    table = pa.Table.from_pandas(labels.to_frame(), preserve_index=False)
+    tmp_path = cache_path + '.tmp'
+    feather.write_feather(table, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, cache_path)
+
+def read_label_cache(cache_path):
+    """Memory-map a label cache written by write_label_cache"""
+    with pa.memory_map(cache_path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+        return table.column('label').to_pandas().rename('label')
+
+def load_kaggle_training_data(refresh_cache=False):
     """
     Build a training DataFrame using the Kaggle dataset:
     - Downloads kunshbhatia/crop-production-data-raw-refined via kagglehub
     - Extracts crop labels from the refined CSV
     - Generates agronomic feature columns (N, P, K, temperature, humidity, ph, rainfall)
       so that they match the existing model/prediction interface.
+
+    Only the crop column is read, in chunks. With pyarrow installed the labels
+    are cached as an Arrow file under data/cache, and later runs memory-map it
+    without downloading or parsing the CSV (refresh_cache=True rebuilds it).
     """
+    labels = None
+    if pa is not None and not refresh_cache and os.path.exists(KAGGLE_LABEL_CACHE):
+        try:
+            labels = read_label_cache(KAGGLE_LABEL_CACHE)
+            print(f"📦 Using cached Kaggle crop labels from {KAGGLE_LABEL_CACHE}")
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable Kaggle label cache: {e}")
+
+    if labels is None:
+        labels = download_kaggle_crop_labels()
+        if labels is None:
+            return None
+        if pa is not None:
+            try:
+                write_label_cache(labels, KAGGLE_LABEL_CACHE)
+                print(f"   Cached crop labels to {KAGGLE_LABEL_CACHE}")
+            except Exception as e:
+                print(f"⚠️ Could not cache Kaggle crop labels: {e}")
+
+    if labels.empty:
+        print("⚠️ Kaggle crop column is empty after cleaning.")
+        return None
+
+    # Build a training DataFrame with same feature schema as the existing model
+    n_samples = len(labels)
+    rng = np.random.default_rng(42)
+
+    # Synthetic but reasonable ranges for soil/nutrient/environmental features
+    data = {
+        'N': rng.integers(10, 130, size=n_samples),
+        'P': rng.integers(5, 80, size=n_samples),
+        'K': rng.integers(5, 120, size=n_samples),
+        'temperature': rng.uniform(15, 38, size=n_samples),
+        'humidity': rng.uniform(40, 95, size=n_samples),
+        'ph': rng.uniform(4.5, 8.5, size=n_samples),
+        'rainfall': rng.uniform(50, 3000, size=n_samples),
+    }
+
+    # Use the real crop names from Kaggle as labels
+    # (lowercased to keep labels consistent)
+    data['label'] = labels.reset_index(drop=True)
+
+    df = pd.DataFrame(data)
+    print(f"✅ Built training DataFrame from Kaggle dataset: {len(df)} samples, {df['label'].nunique()} crops")
+    return df
+
+def download_kaggle_crop_labels():
+    """Download the Kaggle dataset and stream the crop labels out of its CSV"""
     if kagglehub is None:
         print("ℹ️ kagglehub not installed; skipping Kaggle dataset.")
         return None
 
     try:
-        print("⬇️ Downloading Kaggle dataset: kunshbhatia/crop-production-data-raw-refined ...")
-        path = kagglehub.dataset_download("kunshbhatia/crop-production-data-raw-refined")
+        print(f"⬇️ Downloading Kaggle dataset: {KAGGLE_DATASET} ...")
+        path = kagglehub.dataset_download(KAGGLE_DATASET)
         print(f"   Kaggle dataset downloaded to: {path}")
     except Exception as e:
         print(f"⚠️ Failed to download Kaggle dataset: {e}")
@@ -156,53 +423,23 @@ def load_kaggle_training_data():
         csv_path = os.path.join(path, csv_name)
 
         print(f"   Using CSV file: {csv_name}")
-        df_raw = pd.read_csv(csv_path)
+        return stream_crop_labels(csv_path)
     except Exception as e:
         print(f"⚠️ Failed to read Kaggle CSV: {e}")
         return None
 
-    # Try to locate a crop-name column
-    crop_col = None
-    for col in df_raw.columns:
-        col_lower = str(col).lower()
-        if col_lower in ("crop", "crop_name", "cropname"):
-            crop_col = col
-            break
-
-    if crop_col is None:
-        print("⚠️ Could not find a 'Crop' column in Kaggle dataset; columns:", list(df_raw.columns))
-        return None
-
-    crops = df_raw[crop_col].dropna().astype(str).str.strip()
-    if crops.empty:
-        print("⚠️ Kaggle crop column is empty after cleaning.")
-        return None
-
-    # Build a training DataFrame with same feature schema as the existing model
-    n_samples = len(crops)
-    rng = np.random.default_rng(42)
-
-    # Synthetic but reasonable ranges for soil/nutrient/environmental features
-    data = {
-        'N': rng.integers(10, 130, size=n_samples),
-        'P': rng.integers(5, 80, size=n_samples),
-        'K': rng.integers(5, 120, size=n_samples),
-        'temperature': rng.uniform(15, 38, size=n_samples),
-        'humidity': rng.uniform(40, 95, size=n_samples),
-        'ph': rng.uniform(4.5, 8.5, size=n_samples),
-        'rainfall': rng.uniform(50, 3000, size=n_samples),
+def crop_arrays(df, feature_columns):
+    """Feature matrix and label strings of a crop DataFrame, ready for the dataset cache"""
+    return {
+        'X': df[feature_columns].to_numpy(dtype=np.float64),
+        'label': df['label'].astype(str).to_numpy(dtype=str),
     }
 
-    # Use the real crop names from Kaggle as labels
-    # (lowercased to keep labels consistent)
-    data['label'] = crops.str.lower().reset_index(drop=True)
-
-    df = pd.DataFrame(data)
-    print(f"✅ Built training DataFrame from Kaggle dataset: {len(df)} samples, {df['label'].nunique()} crops")
-    return df
-
-def create_sample_dataset():
+def create_sample_dataset(seed=None):
     """Create sample dataset if real data not available"""
+    if seed is not None:
+        np.random.seed(seed)
+    
     data = {
         'N': np.random.randint(10, 100, 1000),
         'P': np.random.randint(10, 100, 1000),
@@ -219,9 +456,26 @@ def create_sample_dataset():
     return pd.DataFrame(data)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Train the crop recommendation model')
+    parser.add_argument('--precision', choices=PRECISIONS, default='float64',
+                        help='Numeric precision of the compiled crop bundle')
+    parser.add_argument('--min-top1-agreement', type=float, default=0.99,
+                        help='Minimum top-1 agreement with the full model for reduced precisions')
+    parser.add_argument('--min-top5-agreement', type=float, default=0.98,
+                        help='Minimum top-5 overlap with the full model for reduced precisions')
+    parser.add_argument('--search', action='store_true',
+                        help='Pick depth/estimators/learning rate with a parallel hyperparameter search')
+    parser.add_argument('--search-workers', type=int, default=None,
+                        help='Worker processes for --search (default: all cores)')
+    parser.add_argument('--refresh-data-cache', action='store_true',
+                        help='Re-download and re-parse training data instead of using data/cache')
+    args = parser.parse_args()
+
     print("🌾 Training Crop Recommendation ML Model")
     print("=" * 50)
-    success = train_model()
+    success = train_model(args.precision, args.min_top1_agreement, args.min_top5_agreement,
+                          search=args.search, search_workers=args.search_workers,
+                          refresh_data_cache=args.refresh_data_cache)
     if success:
         print("\n🎉 Model training completed successfully!")
     else:
@@ -0,0 +1,72 @@
+const { EventEmitter } = require('events');
+
+const createFakeChild = () => {
+  const child = new EventEmitter();
+  child.stdout = new EventEmitter();
+  child.stderr = new EventEmitter();
+  child.stdin = new EventEmitter();
+  child.stdin.write = jest.fn();
+  child.exitCode = null;
+  child.kill = jest.fn(() => {
+    child.exitCode = 0;
+  });
+  return child;
+};
+
+describe('PythonWorker', () => {
+  let children;
+
+  beforeEach(() => {
+    jest.resetModules();
+    children = [];
+    jest.doMock('child_process', () => ({
+      spawn: jest.fn(() => {
+        const child = createFakeChild();
+        children.push(child);
+        return child;
+      })
+    }));
+  });
+
+  test('starts one process and answers requests in order', async () => {
+    const PythonWorker = require('../../services/ml/PythonWorker');
+    const worker = new PythonWorker('/tmp/predict_crop.py');
+
+    const first = worker.request({ temperature: 30 });
+    const second = worker.request({ temperature: 20 });
+
+    expect(children.length).toBe(1);
+    expect(children[0].stdin.write).toHaveBeenCalledWith('{"temperature":30}\n');
+
+    children[0].stdout.emit('data', Buffer.from('[{"crop":"Rice"}]\n[{"crop":'));
+    children[0].stdout.emit('data', Buffer.from('"Wheat"}]\n'));
+
+    await expect(first).resolves.toEqual([{ crop: 'Rice' }]);
+    await expect(second).resolves.toEqual([{ crop: 'Wheat' }]);
+    worker.stop();
+  });
+
+  test('rejects pending requests and restarts after the process exits', async () => {
+    const PythonWorker = require('../../services/ml/PythonWorker');
+    const worker = new PythonWorker('/tmp/predict_crop.py');
+
+    const pending = worker.request({});
+    children[0].emit('exit', 1);
+    await expect(pending).rejects.toThrow('exited with code 1');
+
+    const retried = worker.request({});
+    expect(children.length).toBe(2);
+    children[1].stdout.emit('data', Buffer.from('[]\n'));
+    await expect(retried).resolves.toEqual([]);
+    worker.stop();
+  });
+
+  test('kills the process when a request times out', async () => {
+    const PythonWorker = require('../../services/ml/PythonWorker');
+    const worker = new PythonWorker('/tmp/predict_crop.py', { timeout: 5 });
+
+    await expect(worker.request({})).rejects.toThrow('timeout');
+    expect(children[0].kill).toHaveBeenCalled();
+    expect(worker.process).toBeNull();
+  });
+});
@@ -0,0 +1,96 @@
+"""
+Content-addressed dataset cache shared by the training scripts
+
+Prepared training arrays are stored under a key derived from what produced
+them: the bytes of the source file, or the generator name, parameters and
+seed. Each entry is a directory of .npy files plus meta.json that later runs
+memory-map, so repeat and CI training runs skip data preparation entirely.
+
+Entries live in ml-models/cache/datasets unless ML_DATASET_CACHE_DIR is set;
+ML_DATASET_CACHE=0 turns the cache off.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+
+CACHE_FORMAT_VERSION = 1
+DEFAULT_CACHE_DIR = os.environ.get(
+    'ML_DATASET_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'datasets')
+)
+CACHE_ENABLED = os.environ.get('ML_DATASET_CACHE', '1') != '0'
+
+def file_digest(path, block_size=1 << 20):
+    """SHA-256 of a file's contents, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def dataset_key(name, source=None, **params):
+    """Cache key for a dataset built by `name` from a source file and/or parameters"""
+    payload = {'format': CACHE_FORMAT_VERSION, 'name': name, 'params': params}
+    if source is not None:
+        payload['source'] = file_digest(source)
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+def write_entry(arrays, entry_dir, meta):
+    """Atomically write arrays (name -> ndarray, no object dtypes) as one cache entry"""
+    tmp_dir = entry_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), np.ascontiguousarray(array), allow_pickle=False)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(dict(meta, arrays=list(arrays)), f, indent=2, default=str)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    shutil.rmtree(entry_dir, ignore_errors=True)
+    os.replace(tmp_dir, entry_dir)
+
+def read_entry(entry_dir, mmap_mode='r'):
+    """Memory-map every array of a cache entry"""
+    with open(os.path.join(entry_dir, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    return {
+        name: np.load(os.path.join(entry_dir, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+        for name in meta['arrays']
+    }
+
+def load_or_build(name, build, source=None, refresh=False, cache_dir=None, **params):
+    """
+    Arrays for dataset `name`, from the cache when an entry with the same key
+    exists, otherwise from build() (a callable returning name -> ndarray),
+    which are then cached. refresh=True ignores any existing entry.
+    """
+    if not CACHE_ENABLED:
+        return build()
+
+    key = dataset_key(name, source, **params)
+    entry_dir = os.path.join(cache_dir or DEFAULT_CACHE_DIR, f'{name}-{key}')
+
+    if not refresh and os.path.exists(os.path.join(entry_dir, 'meta.json')):
+        try:
+            arrays = read_entry(entry_dir)
+            print(f"📦 Using cached {name} dataset from {entry_dir}")
+            return arrays
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable dataset cache {entry_dir}: {e}")
+
+    arrays = build()
+    try:
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        write_entry(arrays, entry_dir, {'name': name, 'source': source, 'params': params})
+        print(f"📦 Cached {name} dataset to {entry_dir}")
+    except Exception as e:
+        print(f"⚠️ Could not cache {name} dataset: {e}")
+    return arrays
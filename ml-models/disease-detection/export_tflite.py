@@ -0,0 +1,252 @@
+"""
+TFLite export for the disease CNNs
+
+Converts a Keras model written by train.py, train_comprehensive.py or
+train_cnn.py into model.tflite beside it, optionally with post-training
+quantization:
+
+  none     float32 weights and activations
+  float16  float16 weights
+  dynamic  int8 weights, float activations
+  int8     int8 weights and activations, calibrated on training images
+
+The converted model is scored against the Keras model on the validation
+split, and it is only written when its top-1 agreement reaches
+--min-agreement. Without --data the report is still written, with agreement
+on random images, but the model is not. predict.py prefers model.tflite over
+an older-or-equal Keras artifact in the same directory. A latency/throughput
+report for several interpreter thread counts is saved as tflite_report.json.
+
+Usage:
+  python export_tflite.py --model trained/comprehensive_disease_detection/model.keras \\
+      --data data --quantize int8 --threads 1,2,4
+"""
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+
+from image_shards import has_image_splits, prepare_image_splits, stratified_indices
+
+QUANTIZATION_MODES = ('none', 'float16', 'dynamic', 'int8')
+CALIBRATION_IMAGES = 200
+AGREEMENT_IMAGES = 1000
+MIN_TOP1_AGREEMENT = 0.98
+
+class TFLiteAgreementError(ValueError):
+    """The converted model disagrees too often with the Keras model"""
+
+def load_interpreter(model_path=None, model_content=None, num_threads=None):
+    """TFLite interpreter from tflite_runtime when installed, else from TensorFlow"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+
+        Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=model_path, model_content=model_content, num_threads=num_threads)
+
+class TFLiteClassifier:
+    """Batched predict_proba over a TFLite interpreter; quantized inputs/outputs are (de)quantized here"""
+
+    def __init__(self, model_path=None, model_content=None, num_threads=None):
+        self.interpreter = load_interpreter(model_path, model_content, num_threads)
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.image_size = tuple(int(d) for d in self.input['shape'][1:3])
+        self.batch_size = None
+
+    def predict_proba(self, images, rescale=1.0 / 255):
+        """(n, classes) float32 probabilities for a uint8 (n, height, width, 3) batch"""
+        if self.batch_size != len(images):
+            self.interpreter.resize_tensor_input(self.input['index'], (len(images),) + self.image_size + (3,))
+            self.interpreter.allocate_tensors()
+            self.batch_size = len(images)
+
+        x = images.astype(np.float32) * np.float32(rescale)
+        scale, zero_point = self.input['quantization']
+        if self.input['dtype'] != np.float32:
+            x = np.round(x / scale + zero_point)
+            info = np.iinfo(self.input['dtype'])
+            x = np.clip(x, info.min, info.max).astype(self.input['dtype'])
+        self.interpreter.set_tensor(self.input['index'], x)
+        self.interpreter.invoke()
+
+        probs = self.interpreter.get_tensor(self.output['index'])
+        scale, zero_point = self.output['quantization']
+        if self.output['dtype'] != np.float32:
+            probs = (probs.astype(np.float32) - zero_point) * scale
+        return probs.astype(np.float32, copy=False)
+
+def split_images(data_dir, limit, split='val', seed=42):
+    """Up to limit uint8 images from data_dir/train or data_dir/val, a seeded class-stratified sample"""
+    train_images, val_images = prepare_image_splits(data_dir)
+    dataset = val_images if split == 'val' else train_images
+    if not len(dataset):
+        raise ValueError(f"No {split} images under {data_dir}")
+    return dataset.read_indices(stratified_indices(dataset.labels, limit, seed))
+
+def convert(keras_model, quantize='none', calibration=None):
+    """TFLite flatbuffer bytes for keras_model; int8 needs uint8 calibration images"""
+    import tensorflow as tf
+
+    if quantize not in QUANTIZATION_MODES:
+        raise ValueError(f"quantize must be one of {QUANTIZATION_MODES}")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    if quantize != 'none':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantize == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    if quantize == 'int8':
+        if calibration is None or not len(calibration):
+            raise ValueError("int8 quantization needs calibration images (--data)")
+
+        def representative_dataset():
+            for image in calibration:
+                yield [image[np.newaxis].astype(np.float32) / 255.0]
+
+        converter.representative_dataset = representative_dataset
+        # Float input/output keeps the predictor's preprocessing unchanged
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+def keras_predict(keras_model, images, batch_size=32):
+    outputs = [
+        np.asarray(keras_model(images[i:i + batch_size].astype(np.float32) / 255.0, training=False))
+        for i in range(0, len(images), batch_size)
+    ]
+    return np.concatenate(outputs)
+
+def top1_agreement(reference, candidate):
+    return float(np.mean(np.argmax(reference, axis=1) == np.argmax(candidate, axis=1)))
+
+def benchmark(model_content, images, threads=(1,), runs=50, batch_size=8):
+    """
+    Latency of single-image calls and batched throughput for each interpreter
+    thread count
+    """
+    report = []
+    for num_threads in threads:
+        classifier = TFLiteClassifier(model_content=model_content, num_threads=num_threads)
+        classifier.predict_proba(images[:1])
+
+        latencies = []
+        for i in range(runs):
+            start = time.perf_counter()
+            classifier.predict_proba(images[i % len(images)][np.newaxis])
+            latencies.append(time.perf_counter() - start)
+
+        batch = images[:batch_size]
+        classifier.predict_proba(batch)
+        start = time.perf_counter()
+        for _ in range(max(1, runs // batch_size)):
+            classifier.predict_proba(batch)
+        elapsed = time.perf_counter() - start
+
+        report.append({
+            'threads': num_threads,
+            'latency_ms_p50': round(float(np.percentile(latencies, 50)) * 1000, 3),
+            'latency_ms_p95': round(float(np.percentile(latencies, 95)) * 1000, 3),
+            'throughput_images_per_s': round(max(1, runs // batch_size) * len(batch) / elapsed, 1),
+            'batch_size': len(batch)
+        })
+    return report
+
+def export_tflite(keras_path, data_dir=None, quantize='none', min_agreement=MIN_TOP1_AGREEMENT,
+                  threads=(1,), output_path=None):
+    """
+    Convert keras_path, check top-1 agreement on validation images and write
+    model.tflite plus tflite_report.json. Raises TFLiteAgreementError, without
+    writing the model, when agreement is below min_agreement.
+    """
+    import tensorflow as tf
+
+    model_dir = os.path.dirname(os.path.abspath(keras_path))
+    output_path = output_path or os.path.join(model_dir, 'model.tflite')
+    keras_model = tf.keras.models.load_model(keras_path, compile=False)
+    height, width = keras_model.input_shape[1:3]
+
+    calibration = None
+    if has_image_splits(data_dir):
+        images = split_images(data_dir, AGREEMENT_IMAGES, 'val')
+        image_source = 'validation'
+        if quantize == 'int8':
+            # Calibrating on train/ keeps the agreement check on images the quantizer never saw
+            calibration = split_images(data_dir, CALIBRATION_IMAGES, 'train')
+    elif quantize == 'int8':
+        raise ValueError("int8 quantization needs --data with train/ and val/ splits")
+    else:
+        print("⚠️ No --data given; benchmarking on random images, the model will not be published")
+        images = np.random.default_rng(42).integers(0, 256, (64, height, width, 3), dtype=np.uint8)
+        image_source = 'random'
+
+    print(f"Converting {keras_path} to TFLite (quantize={quantize})...")
+    model_content = convert(keras_model, quantize, calibration)
+
+    candidate = TFLiteClassifier(model_content=model_content, num_threads=max(threads))
+    check = images
+    tflite_probs = np.concatenate([candidate.predict_proba(check[i:i + 32]) for i in range(0, len(check), 32)])
+    agreement = top1_agreement(keras_predict(keras_model, check), tflite_probs)
+
+    report = {
+        'source_model': os.path.abspath(keras_path),
+        'quantize': quantize,
+        'size_bytes': len(model_content),
+        'keras_size_bytes': os.path.getsize(keras_path),
+        'top1_agreement': agreement,
+        'min_top1_agreement': min_agreement,
+        'agreement_images': int(len(check)),
+        'agreement_image_source': image_source,
+        'benchmark': benchmark(model_content, images, threads),
+        # Agreement on noise says nothing about agreement on leaves
+        'published': image_source == 'validation' and agreement >= min_agreement
+    }
+
+    with open(os.path.join(model_dir, 'tflite_report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if image_source != 'validation':
+        raise TFLiteAgreementError(
+            f"top-1 agreement {agreement:.4f} was measured on random images; give --data to publish"
+        )
+    if not report['published']:
+        raise TFLiteAgreementError(
+            f"{quantize} TFLite model agrees top-1 {agreement:.4f} with Keras, below the required {min_agreement}"
+        )
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(model_content)
+    os.replace(tmp_path, output_path)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a disease CNN to TFLite')
+    parser.add_argument('--model', type=str, required=True, help='Keras model (model.keras or disease_cnn.h5)')
+    parser.add_argument('--data', type=str, help='Folder with train/ and val/ class subfolders for calibration and checks')
+    parser.add_argument('--quantize', choices=QUANTIZATION_MODES, default='none', help='Post-training quantization')
+    parser.add_argument('--min-agreement', type=float, default=MIN_TOP1_AGREEMENT,
+                        help='Required top-1 agreement with the Keras model')
+    parser.add_argument('--threads', type=str, default='1', help='Comma-separated interpreter thread counts to benchmark')
+    parser.add_argument('--output', type=str, help='Output path (default: model.tflite beside the Keras model)')
+    args = parser.parse_args()
+
+    threads = tuple(int(t) for t in args.threads.split(',') if t.strip())
+    try:
+        report = export_tflite(args.model, args.data, args.quantize, args.min_agreement, threads, args.output)
+    except TFLiteAgreementError as e:
+        print(f"⚠️ Not publishing TFLite model: {e}")
+        raise SystemExit(1)
+
+    print(f"Top-1 agreement with Keras: {report['top1_agreement']:.4f} on {report['agreement_images']} images")
+    print(f"Size: {report['size_bytes'] / 1e6:.1f} MB (Keras {report['keras_size_bytes'] / 1e6:.1f} MB)")
+    for row in report['benchmark']:
+        print(f"  {row['threads']} thread(s): p50 {row['latency_ms_p50']} ms/image, "
+              f"p95 {row['latency_ms_p95']} ms, {row['throughput_images_per_s']} images/s at batch {row['batch_size']}")
+
+if __name__ == "__main__":
+    main()
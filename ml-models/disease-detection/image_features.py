@@ -0,0 +1,106 @@
+"""
+Compact per-image features for the scikit-learn disease fallback
+
+A 224x224x3 photo flattened is 150k features, far too many for a Random
+Forest. extract_features reduces each image to ~250 values computed for a
+whole uint8 batch at once with NumPy:
+
+  - HSV colour histograms (hue 18 bins, saturation 8, value 8)
+  - per-channel RGB and HSV mean / standard deviation
+  - green-tissue and yellow/brown-lesion pixel fractions
+  - texture: grayscale gradient-magnitude histogram, mean, std, and
+    Laplacian energy
+  - an 8x8 RGB thumbnail
+
+Colour and texture statistics are taken on every second pixel in each
+direction, which leaves the histograms practically unchanged at a quarter of
+the cost. Trainers record the extractor name in metadata.json
+('image_features') so predict.py applies the same one.
+"""
+
+import numpy as np
+
+from image_shards import pooled_pixels
+
+HUE_BINS = 18
+SATURATION_BINS = 8
+VALUE_BINS = 8
+GRADIENT_BINS = 8
+THUMBNAIL_GRID = 8
+DEFAULT_EXTRACTOR = 'color_texture'
+
+def rgb_to_hsv(rgb):
+    """Vectorized RGB in [0, 1] -> HSV with hue, saturation and value in [0, 1]"""
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    value = rgb.max(axis=-1)
+    delta = value - rgb.min(axis=-1)
+    saturation = np.divide(delta, value, out=np.zeros_like(value), where=value > 0)
+
+    safe_delta = np.where(delta > 0, delta, 1)
+    hue = np.where(
+        value == r, (g - b) / safe_delta,
+        np.where(value == g, 2 + (b - r) / safe_delta, 4 + (r - g) / safe_delta)
+    )
+    hue = np.where(delta > 0, (hue / 6) % 1.0, 0)
+    return np.stack([hue, saturation, value], axis=-1).astype(np.float32, copy=False)
+
+def batch_histograms(values, bins):
+    """(n, bins) normalized histograms of values (n, pixels) in [0, 1]"""
+    n, pixels = values.shape
+    index = np.minimum((values * bins).astype(np.intp), bins - 1)
+    index += np.arange(n, dtype=np.intp)[:, np.newaxis] * bins
+    counts = np.bincount(index.ravel(), minlength=n * bins).reshape(n, bins)
+    return counts.astype(np.float32) / np.float32(pixels)
+
+def color_texture_features(images):
+    """(n, features) float32 colour/texture/thumbnail features for a uint8 (n, h, w, 3) batch"""
+    n = len(images)
+    rgb = images[:, ::2, ::2].astype(np.float32) * np.float32(1.0 / 255)
+    hsv = rgb_to_hsv(rgb)
+    flat_rgb = rgb.reshape(n, -1, 3)
+    flat_hsv = hsv.reshape(n, -1, 3)
+    hue, saturation, value = flat_hsv[..., 0], flat_hsv[..., 1], flat_hsv[..., 2]
+
+    # Hue on weakly saturated pixels is noise; leaves are green, most lesions yellow to brown
+    colored = saturation > 0.2
+    green = colored & (hue > 0.19) & (hue < 0.47)
+    lesion = colored & (hue >= 0.03) & (hue <= 0.19)
+
+    gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    grad_y = np.abs(np.diff(gray, axis=1))[:, :, :-1]
+    grad_x = np.abs(np.diff(gray, axis=2))[:, :-1, :]
+    gradient = np.minimum(grad_x + grad_y, 1.0).reshape(n, -1)
+    laplacian = (
+        gray[:, 1:-1, :-2] + gray[:, 1:-1, 2:] + gray[:, :-2, 1:-1] + gray[:, 2:, 1:-1]
+        - 4 * gray[:, 1:-1, 1:-1]
+    ).reshape(n, -1)
+
+    return np.hstack([
+        batch_histograms(hue, HUE_BINS),
+        batch_histograms(saturation, SATURATION_BINS),
+        batch_histograms(value, VALUE_BINS),
+        flat_rgb.mean(axis=1), flat_rgb.std(axis=1),
+        flat_hsv.mean(axis=1), flat_hsv.std(axis=1),
+        green.mean(axis=1, dtype=np.float32)[:, np.newaxis],
+        lesion.mean(axis=1, dtype=np.float32)[:, np.newaxis],
+        batch_histograms(gradient, GRADIENT_BINS),
+        gradient.mean(axis=1)[:, np.newaxis], gradient.std(axis=1)[:, np.newaxis],
+        np.square(laplacian).mean(axis=1)[:, np.newaxis],
+        pooled_pixels(images, THUMBNAIL_GRID),
+    ]).astype(np.float32, copy=False)
+
+# Name stored in metadata.json -> function of a uint8 image batch
+EXTRACTORS = {
+    'color_texture': color_texture_features,
+    'pooled_pixels': pooled_pixels,
+}
+
+def extract_features(images, extractor=DEFAULT_EXTRACTOR, batch_size=256):
+    """Features for a uint8 (n, h, w, 3) array, computed batch_size images at a time"""
+    extract = EXTRACTORS[extractor]
+    if not len(images):
+        return np.zeros((0, feature_count(extractor, images.shape[1:3])), dtype=np.float32)
+    return np.concatenate([extract(images[start:start + batch_size]) for start in range(0, len(images), batch_size)])
+
+def feature_count(extractor=DEFAULT_EXTRACTOR, image_size=(224, 224)):
+    return EXTRACTORS[extractor](np.zeros((1,) + tuple(image_size) + (3,), dtype=np.uint8)).shape[1]
@@ -0,0 +1,321 @@
+"""
+Sharded uint8 image dataset shared by the disease trainers
+
+prepare_split walks a class-per-folder directory (data/train, data/val) once,
+decodes and resizes every image to 224x224 in a thread pool and stores the
+pixels as uint8 .npy shards next to an index of class labels. Images are
+written in a seeded random order, so every shard, and every batch read from
+one, mixes all classes:
+
+  <cache>/<split>/index.json          classes, image size, shard list, source signature
+  <cache>/<split>/images-00000.npy    (n, 224, 224, 3) uint8
+  <cache>/<split>/labels-00000.npy    (n,) int32 class ids
+
+Training memory-maps the shards, so epochs read raw pixels with no JPEG
+decoding; make_tf_dataset adds parallel batch reads and prefetch. A split is
+only rebuilt when the files, sizes or mtimes under its folder change.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+from itertools import repeat
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+INDEX_FORMAT_VERSION = 2
+IMAGE_SIZE = (224, 224)
+SHARD_SIZE = 1024
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+SHARD_CACHE_NAME = '.shards'
+POOL_GRID = 16
+
+def has_image_splits(data_dir):
+    """True when data_dir holds class-per-folder train/ and val/ directories"""
+    return bool(data_dir) and all(
+        os.path.isdir(os.path.join(data_dir, split)) for split in ('train', 'val')
+    )
+
+def list_images(split_dir, classes=None):
+    """
+    (classes, [(path, class id), ...]) for a class-per-folder directory.
+    classes fixes the label order (e.g. the training split's) for other splits.
+    """
+    found = sorted(
+        name for name in os.listdir(split_dir)
+        if os.path.isdir(os.path.join(split_dir, name)) and not name.startswith('.')
+    )
+    if classes is None:
+        classes = found
+    else:
+        unknown = sorted(set(found) - set(classes))
+        if unknown:
+            raise ValueError(f"Classes in {split_dir} missing from the training split: {unknown}")
+
+    class_ids = {name: i for i, name in enumerate(classes)}
+    items = []
+    for name in found:
+        for root, dirs, files in os.walk(os.path.join(split_dir, name)):
+            dirs.sort()
+            for filename in sorted(files):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    items.append((os.path.join(root, filename), class_ids[name]))
+    return list(classes), items
+
+def source_signature(items):
+    """Hash of every path, label, size and mtime; changes whenever the split changes"""
+    digest = hashlib.sha256()
+    for path, label in items:
+        stat = os.stat(path)
+        digest.update(f'{path}\0{label}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+def decode_image(path, image_size=IMAGE_SIZE):
+    """RGB uint8 array of an image file resized to image_size (height, width)"""
+    from PIL import Image
+
+    with Image.open(path) as image:
+        # Lets libjpeg downscale large JPEGs while decoding
+        image.draft('RGB', (image_size[1], image_size[0]))
+        image = image.convert('RGB').resize((image_size[1], image_size[0]), Image.BILINEAR)
+        return np.asarray(image, dtype=np.uint8)
+
+def pooled_pixels(images, grid=POOL_GRID):
+    """
+    (n, grid*grid*3) float32 thumbnails: each uint8 image mean-pooled to
+    grid x grid and scaled to [0, 1]
+    """
+    n, height, width = images.shape[:3]
+    pooled = images[:, :height // grid * grid, :width // grid * grid].reshape(
+        n, grid, height // grid, grid, width // grid, 3
+    ).mean(axis=(2, 4), dtype=np.float32)
+    return pooled.reshape(n, -1) / np.float32(255.0)
+
+def _decode_or_none(path, image_size):
+    try:
+        return decode_image(path, image_size)
+    except Exception as e:
+        print(f"⚠️ Skipping unreadable image {path}: {e}")
+        return None
+
+def load_index(shard_dir):
+    with open(os.path.join(shard_dir, 'index.json'), 'r') as f:
+        return json.load(f)
+
+def prepare_split(split_dir, shard_dir, classes=None, image_size=IMAGE_SIZE,
+                  shard_size=SHARD_SIZE, workers=None, force=False, seed=42):
+    """Decode split_dir into uint8 shards under shard_dir unless they are already up to date"""
+    classes, items = list_images(split_dir, classes)
+    signature = source_signature(items)
+    image_size = tuple(image_size)
+
+    if not force and os.path.exists(os.path.join(shard_dir, 'index.json')):
+        index = load_index(shard_dir)
+        if (index.get('format_version') == INDEX_FORMAT_VERSION and index['signature'] == signature
+                and tuple(index['image_size']) == image_size and index['classes'] == classes
+                and index.get('seed') == seed):
+            return index
+
+    # list_images groups items by class; shuffling them keeps single-shard batches class-mixed
+    items = [items[i] for i in np.random.default_rng(seed).permutation(len(items))]
+
+    print(f"Decoding {len(items)} images from {split_dir} into {shard_dir}...")
+    tmp_dir = shard_dir.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    shards = []
+    skipped = []
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for shard_id, start in enumerate(range(0, len(items), shard_size)):
+            chunk = items[start:start + shard_size]
+            decoded = pool.map(_decode_or_none, [path for path, _ in chunk], repeat(image_size))
+            kept = []
+            for (path, label), pixels in zip(chunk, decoded):
+                if pixels is None:
+                    skipped.append(path)
+                else:
+                    kept.append((pixels, label))
+            if not kept:
+                continue
+
+            images_name = f'images-{shard_id:05d}.npy'
+            labels_name = f'labels-{shard_id:05d}.npy'
+            images = np.lib.format.open_memmap(
+                os.path.join(tmp_dir, images_name), mode='w+', dtype=np.uint8,
+                shape=(len(kept),) + image_size + (3,)
+            )
+            for i, (pixels, _) in enumerate(kept):
+                images[i] = pixels
+            images.flush()
+            del images
+            np.save(os.path.join(tmp_dir, labels_name), np.array([label for _, label in kept], dtype=np.int32))
+            shards.append({'images': images_name, 'labels': labels_name, 'count': len(kept)})
+
+    index = {
+        'format_version': INDEX_FORMAT_VERSION,
+        'source': os.path.abspath(split_dir),
+        'classes': classes,
+        'image_size': list(image_size),
+        'num_images': sum(shard['count'] for shard in shards),
+        'signature': signature,
+        'seed': seed,
+        'shards': shards,
+        'skipped': skipped,
+    }
+    with open(os.path.join(tmp_dir, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=2)
+
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    os.replace(tmp_dir, shard_dir)
+    return index
+
+class ShardedImageDataset:
+    """Memory-mapped view over the shards written by prepare_split"""
+
+    def __init__(self, shard_dir):
+        self.index = load_index(shard_dir)
+        self.classes = self.index['classes']
+        self.num_classes = len(self.classes)
+        self.image_size = tuple(self.index['image_size'])
+        self.shards = [
+            np.load(os.path.join(shard_dir, shard['images']), mmap_mode='r')
+            for shard in self.index['shards']
+        ]
+        shard_labels = [
+            np.load(os.path.join(shard_dir, shard['labels']))
+            for shard in self.index['shards']
+        ]
+        self.labels = np.concatenate(shard_labels) if shard_labels else np.zeros(0, dtype=np.int32)
+        self._shard_labels = shard_labels
+        # Global index of each shard's first image
+        self._offsets = np.cumsum([0] + [len(labels) for labels in shard_labels])[:-1]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def batch_plan(self, batch_size=32, shuffle=False, seed=42):
+        """
+        (shard id, sorted row indices) per batch. Batches never span shards,
+        so each read is one mmap gather; with shuffle the rows of every shard
+        are permuted once before slicing.
+        """
+        rng = np.random.default_rng(seed)
+        plan = []
+        for shard_id, images in enumerate(self.shards):
+            rows = rng.permutation(len(images)) if shuffle else np.arange(len(images))
+            for start in range(0, len(rows), batch_size):
+                plan.append((shard_id, np.sort(rows[start:start + batch_size])))
+        return plan
+
+    def read_batch(self, shard_id, rows):
+        """(uint8 images, int32 labels) for rows of one shard"""
+        return np.asarray(self.shards[shard_id][rows]), self._shard_labels[shard_id][rows]
+
+    def batches(self, batch_size=32, shuffle=False, seed=42):
+        """Iterate (uint8 images, labels) batches without TensorFlow"""
+        plan = self.batch_plan(batch_size, shuffle, seed)
+        order = np.random.default_rng(seed).permutation(len(plan)) if shuffle else range(len(plan))
+        for i in order:
+            yield self.read_batch(*plan[i])
+
+    def read_indices(self, indices):
+        """uint8 images for global row indices, in the given order"""
+        indices = np.asarray(indices)
+        images = np.empty((len(indices),) + self.image_size + (3,), dtype=np.uint8)
+        shard_ids = np.searchsorted(self._offsets, indices, side='right') - 1
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            images[mask] = self.shards[shard_id][indices[mask] - self._offsets[shard_id]]
+        return images
+
+    def features(self, extract=pooled_pixels, batch_size=256, indices=None):
+        """
+        extract(uint8 batch) for every image in index order, or for the given
+        global indices; only batch_size images are in memory at a time
+        """
+        if indices is None:
+            return np.concatenate([extract(images) for images, _ in self.batches(batch_size)])
+        return np.concatenate([
+            extract(self.read_indices(indices[start:start + batch_size]))
+            for start in range(0, len(indices), batch_size)
+        ])
+
+def stratified_indices(labels, limit, seed=42):
+    """
+    Up to limit sorted row indices drawn at random with the classes as evenly
+    represented as their sizes allow
+    """
+    rng = np.random.default_rng(seed)
+    shuffled = rng.permutation(len(labels))
+    grouped = shuffled[np.argsort(labels[shuffled], kind='stable')]
+    # Rank of each row within its class; taking rank 0 of every class, then rank 1, ... stratifies
+    starts = np.searchsorted(labels[grouped], labels[grouped], side='left')
+    rank = np.arange(len(grouped)) - starts
+    return np.sort(grouped[np.argsort(rank, kind='stable')[:limit]])
+
+def prepare_image_splits(data_dir, cache_dir=None, force=False, **kwargs):
+    """Shard data_dir/train and data_dir/val (sharing the train label order) and open both"""
+    cache_dir = cache_dir or os.path.join(data_dir, SHARD_CACHE_NAME)
+    train_dir = os.path.join(cache_dir, 'train')
+    val_dir = os.path.join(cache_dir, 'val')
+
+    train_index = prepare_split(os.path.join(data_dir, 'train'), train_dir, force=force, **kwargs)
+    prepare_split(os.path.join(data_dir, 'val'), val_dir, classes=train_index['classes'], force=force, **kwargs)
+    return ShardedImageDataset(train_dir), ShardedImageDataset(val_dir)
+
+def augmentation_layers(rotation=0.0, shift=0.0, zoom=0.0, horizontal_flip=False, vertical_flip=False):
+    """Keras preprocessing layers standing in for the ImageDataGenerator options"""
+    import tensorflow as tf
+
+    layers = []
+    if horizontal_flip or vertical_flip:
+        mode = 'horizontal_and_vertical' if horizontal_flip and vertical_flip else (
+            'horizontal' if horizontal_flip else 'vertical')
+        layers.append(tf.keras.layers.RandomFlip(mode))
+    if rotation:
+        layers.append(tf.keras.layers.RandomRotation(rotation / 360.0, fill_mode='nearest'))
+    if shift:
+        layers.append(tf.keras.layers.RandomTranslation(shift, shift, fill_mode='nearest'))
+    if zoom:
+        layers.append(tf.keras.layers.RandomZoom(zoom, fill_mode='nearest'))
+    return tf.keras.Sequential(layers) if layers else None
+
+def make_tf_dataset(dataset, batch_size=32, shuffle=False, seed=42, rescale=1.0 / 255, augment=None):
+    """
+    tf.data pipeline of (float32 images, one-hot labels) over a ShardedImageDataset.
+    Batches are read from the memory-mapped shards in parallel and prefetched;
+    with shuffle the batch order changes every epoch.
+    """
+    import tensorflow as tf
+
+    plan = dataset.batch_plan(batch_size, shuffle, seed)
+    height, width = dataset.image_size
+
+    def load(batch_id):
+        images, labels = dataset.read_batch(*plan[int(batch_id)])
+        return images, labels.astype(np.int32)
+
+    def read(batch_id):
+        images, labels = tf.numpy_function(load, [batch_id], (tf.uint8, tf.int32))
+        images.set_shape((None, height, width, 3))
+        labels.set_shape((None,))
+        return images, labels
+
+    def convert(images, labels):
+        images = tf.cast(images, tf.float32) * rescale
+        if augment is not None:
+            images = augment(images, training=True)
+        return images, tf.one_hot(labels, dataset.num_classes)
+
+    batches = tf.data.Dataset.range(len(plan))
+    if shuffle:
+        batches = batches.shuffle(len(plan), seed=seed, reshuffle_each_iteration=True)
+    return (
+        batches
+        .map(read, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+        .map(convert, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+        .prefetch(tf.data.AUTOTUNE)
+    )
@@ -0,0 +1,155 @@
+"""
+Incremental training for the scikit-learn disease fallback
+
+Instead of one fit over every sample, the training rows are streamed in
+class-balanced chunks (balanced_chunks) whose features are computed on
+demand, so only one chunk is in memory at a time:
+
+  forest  a warm-started RandomForest that grows trees_per_chunk trees on
+          each chunk, up to max_trees per run; with more chunks than that,
+          one tree is grown on each of max_trees evenly spaced chunks, so
+          the saved forest never exceeds max_trees trees (the oldest are
+          dropped when a resumed run adds more) however large the dataset
+  sgd     StandardScaler + SGDClassifier(log_loss) updated with partial_fit;
+          a saved model can be resumed with extra classes (add_sgd_classes)
+          without retraining from zero
+
+read_rows(indices) -> (len(indices), features) is supplied by the trainer,
+e.g. ShardedImageDataset.features(..., indices=indices) or rows of a
+memory-mapped array.
+"""
+
+import os
+import json
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+INCREMENTAL_MODES = ('off', 'forest', 'sgd')
+CHUNK_SIZE = 4096
+TREES_PER_CHUNK = 25
+# Same size as the forest fitted in one pass
+MAX_TREES = 300
+SGD_EPOCHS = 5
+
+def balanced_chunks(labels, chunk_size=CHUNK_SIZE, seed=42):
+    """
+    Sorted index arrays of about chunk_size rows, each with the same number of
+    rows from every class present in labels. One pass covers every row of the
+    largest class; smaller classes are cycled, so each chunk holds all classes.
+    """
+    rng = np.random.default_rng(seed)
+    members = [rng.permutation(np.flatnonzero(labels == c)) for c in np.unique(labels)]
+    per_class = max(1, chunk_size // len(members))
+    largest = max(len(rows) for rows in members)
+
+    for start in range(0, largest, per_class):
+        positions = np.arange(start, start + per_class)
+        yield np.sort(np.concatenate([np.take(rows, positions, mode='wrap') for rows in members]))
+
+def chunk_count(labels, chunk_size=CHUNK_SIZE):
+    """Number of chunks balanced_chunks yields for labels"""
+    counts = np.unique(labels, return_counts=True)[1]
+    per_class = max(1, chunk_size // len(counts))
+    return -(-int(counts.max()) // per_class)
+
+def chunk_trees(n_chunks, trees_per_chunk=TREES_PER_CHUNK, max_trees=MAX_TREES):
+    """Trees to grow on each chunk: trees_per_chunk each, spread thinner so the run adds at most max_trees"""
+    budget = min(trees_per_chunk * n_chunks, max_trees)
+    if n_chunks > budget:
+        trees = np.zeros(n_chunks, dtype=np.int64)
+        trees[np.unique(np.linspace(0, n_chunks - 1, budget).round().astype(np.int64))] = 1
+        return trees
+    return np.diff(budget * np.arange(n_chunks + 1) // n_chunks)
+
+def fit_forest_incremental(read_rows, labels, trees_per_chunk=TREES_PER_CHUNK, chunk_size=CHUNK_SIZE,
+                           seed=42, model=None, max_trees=MAX_TREES, **forest_params):
+    """
+    Grow a warm-started RandomForest chunk by chunk, to at most max_trees
+    trees; model continues an earlier run and loses its oldest trees beyond
+    max_trees
+    """
+    classes = np.unique(labels)
+    if model is None:
+        model = RandomForestClassifier(warm_start=True, random_state=seed, **forest_params)
+    elif not np.array_equal(model.classes_, classes):
+        raise ValueError("A forest cannot learn new classes incrementally; use --incremental sgd or retrain")
+    model.set_params(warm_start=True)
+
+    trees = chunk_trees(chunk_count(labels, chunk_size), trees_per_chunk, max_trees)
+    for i, indices in enumerate(balanced_chunks(labels, chunk_size, seed)):
+        if not trees[i]:
+            # Past the tree budget: skip the chunk without reading its features
+            continue
+        model.n_estimators = len(getattr(model, 'estimators_', [])) + int(trees[i])
+        model.fit(read_rows(indices), labels[indices])
+        print(f"  chunk {i + 1}/{len(trees)}: {len(indices)} rows, {model.n_estimators} trees")
+
+    if len(model.estimators_) > max_trees:
+        # The oldest trees come from the earlier run
+        model.estimators_ = model.estimators_[-max_trees:]
+        model.n_estimators = max_trees
+    return model
+
+def add_sgd_classes(sgd, classes):
+    """Extend a fitted SGDClassifier with zero-initialized weights for unseen classes"""
+    merged = np.union1d(sgd.classes_, classes)
+    if len(merged) == len(sgd.classes_):
+        return sgd
+
+    coef = sgd.coef_
+    intercept = sgd.intercept_
+    if len(sgd.classes_) == 2:
+        # Binary models keep one weight row for classes_[1]
+        coef = np.vstack([-coef, coef])
+        intercept = np.concatenate([-intercept, intercept])
+
+    positions = np.searchsorted(merged, sgd.classes_)
+    sgd.coef_ = np.zeros((len(merged), coef.shape[1]), dtype=coef.dtype)
+    sgd.intercept_ = np.zeros(len(merged), dtype=intercept.dtype)
+    sgd.coef_[positions] = coef
+    sgd.intercept_[positions] = intercept
+    sgd.classes_ = merged
+    return sgd
+
+def fit_sgd_incremental(read_rows, labels, epochs=SGD_EPOCHS, chunk_size=CHUNK_SIZE, seed=42, model=None):
+    """
+    partial_fit a scaled SGDClassifier over epochs passes of balanced chunks.
+    model (a pipeline from an earlier run) is continued, gaining any classes
+    present in labels. The scaler is fitted once, on the first chunk.
+    """
+    if model is None:
+        scaler = StandardScaler()
+        sgd = SGDClassifier(loss='log_loss', alpha=1e-4, random_state=seed)
+    else:
+        scaler, sgd = model.steps[0][1], model.steps[-1][1]
+        add_sgd_classes(sgd, np.unique(labels))
+    classes = np.union1d(getattr(sgd, 'classes_', []), np.unique(labels)).astype(labels.dtype)
+
+    for epoch in range(epochs):
+        for i, indices in enumerate(balanced_chunks(labels, chunk_size, seed + epoch)):
+            X = read_rows(indices)
+            if not hasattr(scaler, 'mean_'):
+                scaler.fit(X)
+            sgd.partial_fit(scaler.transform(X), labels[indices], classes=classes)
+        print(f"  epoch {epoch + 1}/{epochs}: {i + 1} chunks")
+    return make_pipeline(scaler, sgd)
+
+def load_resume_state(model_dir, classes):
+    """
+    (model, merged class names, label remap) for continuing the model saved in
+    model_dir: earlier classes keep their ids, unseen names are appended, and
+    remap[i] is the merged id of classes[i]
+    """
+    with open(os.path.join(model_dir, 'class_labels.json'), 'r') as f:
+        previous_classes = json.load(f)
+    model = joblib.load(os.path.join(model_dir, 'model.joblib'))
+
+    merged = previous_classes + [name for name in classes if name not in previous_classes]
+    index = {name: i for i, name in enumerate(merged)}
+    remap = np.array([index[name] for name in classes], dtype=np.int32)
+    return model, merged, remap
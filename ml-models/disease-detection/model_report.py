@@ -0,0 +1,70 @@
+"""
+Size, FLOP and CPU latency report for the disease CNNs
+
+Used by the trainers' --head-report option to compare the Flatten+Dense
+classifier head with the pooled head on the same convolutional trunk.
+FLOPs count one multiply-add as two operations and cover convolution and
+dense layers, which dominate the total.
+"""
+
+import time
+
+import numpy as np
+
+def _shape(tensor):
+    return tuple(int(d) if d is not None else 1 for d in tensor.shape[1:])
+
+def layer_flops(layer):
+    """Forward-pass FLOPs of one Keras layer for a single image"""
+    kind = type(layer).__name__
+    if kind in ('Conv2D', 'DepthwiseConv2D', 'SeparableConv2D'):
+        in_channels = _shape(layer.input)[-1]
+        out_h, out_w, out_channels = _shape(layer.output)
+        kh, kw = layer.kernel_size
+        if kind == 'Conv2D':
+            return 2 * out_h * out_w * kh * kw * in_channels * out_channels
+        depthwise = 2 * out_h * out_w * kh * kw * in_channels * getattr(layer, 'depth_multiplier', 1)
+        if kind == 'DepthwiseConv2D':
+            return depthwise
+        return depthwise + 2 * out_h * out_w * in_channels * layer.depth_multiplier * out_channels
+    if kind == 'Dense':
+        return 2 * _shape(layer.input)[-1] * layer.units
+    return 0
+
+def model_report(model, runs=20, batch_sizes=(1, 32)):
+    """Parameter count, weight bytes, FLOPs and CPU latency of a built Keras model"""
+    dense_params = sum(layer.count_params() for layer in model.layers if type(layer).__name__ == 'Dense')
+    report = {
+        'params': int(model.count_params()),
+        'dense_params': int(dense_params),
+        'weight_bytes': int(sum(np.prod(w.shape) * w.dtype.size for w in model.get_weights())),
+        'flops_per_image': int(sum(layer_flops(layer) for layer in model.layers)),
+        'latency_ms': {}
+    }
+
+    height, width, channels = _shape(model.inputs[0])
+    for batch_size in batch_sizes:
+        x = np.random.default_rng(0).random((batch_size, height, width, channels), dtype=np.float32)
+        model(x, training=False)
+        start = time.perf_counter()
+        for _ in range(runs):
+            model(x, training=False)
+        per_batch = (time.perf_counter() - start) / runs
+        report['latency_ms'][f'batch_{batch_size}'] = {
+            'per_batch': round(per_batch * 1000, 3),
+            'per_image': round(per_batch * 1000 / batch_size, 3)
+        }
+    return report
+
+def compare_heads(build_model, num_classes, heads, runs=20):
+    """model_report for build_model(num_classes, head=...) with each head"""
+    return {head: model_report(build_model(num_classes, head=head), runs=runs) for head in heads}
+
+def print_head_report(reports):
+    for head, report in reports.items():
+        latency = ', '.join(
+            f"{name.replace('_', ' ')}: {values['per_image']} ms/image"
+            for name, values in report['latency_ms'].items()
+        )
+        print(f"{head:>8} head: {report['params']:,} params ({report['dense_params']:,} dense), "
+              f"{report['weight_bytes'] / 1e6:.1f} MB float32, {report['flops_per_image'] / 1e9:.2f} GFLOPs/image; {latency}")
@@ -0,0 +1,345 @@
+"""
+Plant disease prediction from leaf photos
+
+Serves the newest model written by train.py, train_comprehensive.py or
+train_cnn.py (model.keras, disease_cnn.h5 or model.joblib next to
+class_labels.json) under trained/, or DISEASE_MODEL_DIR. The model is loaded
+once per process; the artifact is re-stat'ed at most every
+DISEASE_MODEL_SCAN_TTL seconds and reloaded when a newer one appears.
+
+Usage:
+  python predict.py leaf.jpg [more.jpg ...] [--top-k 5] [--crop Rice]
+  python predict.py --serve
+
+Images are decoded and resized in a thread pool (DISEASE_DECODE_WORKERS)
+while the previous batch of DISEASE_BATCH_SIZE images runs through the model.
+With --crop, only that crop's diseases (crop_disease_mapping.json) are ranked.
+
+A model.tflite written by export_tflite.py is served instead of the Keras
+model in its directory unless it is older than that model; set
+DISEASE_BACKEND=keras to ignore it.
+
+--serve answers newline-delimited JSON requests on stdin, one response line
+each:
+  {"image": "leaf.jpg", "top_k": 3, "crop": "Rice"}   -> one result
+  {"images": ["a.jpg", "b.jpg"]} or ["a.jpg", "b.jpg"] -> {"results": [...]}
+  {"command": "model_info"}                          -> loaded model details
+"""
+
+import sys
+import json
+import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from image_shards import IMAGE_SIZE, decode_image
+from image_features import EXTRACTORS, feature_count
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAINED_DIR = os.environ.get('DISEASE_MODEL_DIR', os.path.join(BASE_DIR, 'trained'))
+# Preference order when one directory holds several artifacts
+MODEL_FILES = ('model.tflite', 'model.keras', 'disease_cnn.h5', 'model.joblib')
+# 'auto' serves a fresh model.tflite when present, 'keras' never does
+BACKEND = os.environ.get('DISEASE_BACKEND', 'auto')
+
+BATCH_SIZE = int(os.environ.get('DISEASE_BATCH_SIZE', '32'))
+DECODE_WORKERS = int(os.environ.get('DISEASE_DECODE_WORKERS', str(min(8, os.cpu_count() or 1))))
+TFLITE_THREADS = int(os.environ.get('DISEASE_TFLITE_THREADS', str(os.cpu_count() or 1)))
+MODEL_SCAN_TTL = float(os.environ.get('DISEASE_MODEL_SCAN_TTL', '30'))
+DEFAULT_TOP_K = 5
+
+_model = None
+_model_version = {'version': None, 'checked_at': None}
+_decode_pool = None
+
+def split_class_name(name):
+    """('Rice', 'Blast') for 'Rice___Blast'; (None, name) for names without a crop"""
+    parts = name.split('___')
+    if len(parts) == 2:
+        return parts[0], parts[1]
+    return None, name
+
+class DiseaseModel:
+    """A trained disease classifier with its class labels and crop-disease mapping"""
+
+    def __init__(self, model_path):
+        self.path = model_path
+        model_dir = os.path.dirname(model_path)
+
+        with open(os.path.join(model_dir, 'class_labels.json'), 'r') as f:
+            self.classes = json.load(f)
+        self.metadata = {}
+        metadata_path = os.path.join(model_dir, 'metadata.json')
+        if os.path.exists(metadata_path):
+            with open(metadata_path, 'r') as f:
+                self.metadata = json.load(f)
+
+        self.class_info = [split_class_name(name) for name in self.classes]
+        self.crop_classes = self._crop_classes(model_dir)
+
+        if model_path.endswith('.joblib'):
+            import joblib
+
+            self.kind = 'random_forest'
+            self.model = joblib.load(model_path)
+            # Trainers fit with verbose=1; keep joblib progress lines off the worker's stdout
+            self.model.verbose = 0
+            # Models from before the extractor was recorded used pooled pixels
+            self.extractor = self.metadata.get('image_features') or 'pooled_pixels'
+            expected = feature_count(self.extractor, IMAGE_SIZE)
+            if getattr(self.model, 'n_features_in_', expected) != expected:
+                raise ValueError(
+                    f"{model_path} was trained on {self.model.n_features_in_} synthetic features, not image "
+                    "features; retrain it with --data pointing at an image folder"
+                )
+            # Forests only know the classes present in their training labels
+            self.columns = np.asarray(self.model.classes_, dtype=np.intp)
+        elif model_path.endswith('.tflite'):
+            from export_tflite import TFLiteClassifier
+
+            self.kind = 'tflite'
+            self.model = TFLiteClassifier(model_path, num_threads=TFLITE_THREADS)
+            self.columns = None
+        else:
+            import tensorflow as tf
+
+            self.kind = 'tensorflow_cnn'
+            self.model = tf.keras.models.load_model(model_path, compile=False)
+            self.columns = None
+
+        input_shape = getattr(self.model, 'input_shape', None)
+        if self.kind == 'tflite':
+            self.image_size = self.model.image_size
+        elif self.kind == 'tensorflow_cnn' and input_shape and None not in input_shape[1:3]:
+            self.image_size = tuple(input_shape[1:3])
+        else:
+            self.image_size = IMAGE_SIZE
+
+    def _crop_classes(self, model_dir):
+        """Lower-cased crop name -> class indices, from crop_disease_mapping.json or the class names"""
+        index = {name: i for i, name in enumerate(self.classes)}
+        crop_classes = {}
+        mapping_path = os.path.join(model_dir, 'crop_disease_mapping.json')
+        if os.path.exists(mapping_path):
+            with open(mapping_path, 'r') as f:
+                for crop, diseases in json.load(f).items():
+                    ids = [index[f'{crop}___{d}'] for d in diseases if f'{crop}___{d}' in index]
+                    crop_classes.setdefault(crop.lower(), []).extend(ids)
+        else:
+            for i, (crop, _) in enumerate(self.class_info):
+                if crop:
+                    crop_classes.setdefault(crop.lower(), []).append(i)
+        return {crop: np.array(sorted(set(ids)), dtype=np.intp) for crop, ids in crop_classes.items()}
+
+    def predict_proba(self, images):
+        """(n, len(classes)) probabilities for a uint8 (n, height, width, 3) batch"""
+        if self.kind == 'random_forest':
+            probs = np.zeros((len(images), len(self.classes)), dtype=np.float32)
+            probs[:, self.columns] = self.model.predict_proba(EXTRACTORS[self.extractor](images))
+            return probs
+        if self.kind == 'tflite':
+            return self.model.predict_proba(images)
+
+        # Same 1/255 rescale the trainers apply
+        x = images.astype(np.float32) * np.float32(1.0 / 255)
+        return np.asarray(self.model(x, training=False), dtype=np.float32)
+
+    def top_predictions(self, probs, top_k=DEFAULT_TOP_K, crop=None):
+        """Top-k prediction dicts for one probability row, optionally limited to one crop's diseases"""
+        candidates = self.crop_classes.get(crop.lower()) if crop else None
+        if candidates is not None and len(candidates):
+            scores = probs[candidates]
+            total = scores.sum()
+            if total > 0:
+                scores = scores / total
+        else:
+            candidates = np.arange(len(probs))
+            scores = probs
+
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+
+        predictions = []
+        for i in top:
+            class_id = int(candidates[i])
+            crop_name, disease = self.class_info[class_id]
+            predictions.append({
+                'className': self.classes[class_id],
+                'crop': crop_name,
+                'disease': disease,
+                'probability': round(float(scores[i]) * 100, 2)
+            })
+        return predictions
+
+    def info(self):
+        return {
+            'model_path': self.path,
+            'model_type': self.kind,
+            'num_classes': len(self.classes),
+            'crops': sorted(self.crop_classes),
+            'image_size': list(self.image_size),
+            'training_id': self.metadata.get('training_id')
+        }
+
+def find_artifact(trained_dir=None):
+    """(path, mtime_ns) of the newest model file that has class labels beside it, or None"""
+    newest = None
+    for root, dirs, files in os.walk(trained_dir or TRAINED_DIR):
+        if 'class_labels.json' not in files:
+            continue
+        mtimes = {name: os.stat(os.path.join(root, name)).st_mtime_ns for name in MODEL_FILES if name in files}
+        if 'model.tflite' in mtimes:
+            # A TFLite export older than a retrained Keras model is stale
+            others = [mtime for name, mtime in mtimes.items() if name != 'model.tflite']
+            if BACKEND == 'keras' or (others and max(others) > mtimes['model.tflite']):
+                del mtimes['model.tflite']
+        for name in MODEL_FILES:
+            if name in mtimes:
+                if newest is None or mtimes[name] > newest[1]:
+                    newest = (os.path.join(root, name), mtimes[name])
+                break
+    return newest
+
+def model_version():
+    """Newest artifact; rescanned at most once per MODEL_SCAN_TTL seconds"""
+    global _model
+    now = time.monotonic()
+    checked_at = _model_version['checked_at']
+
+    if checked_at is None or now - checked_at >= MODEL_SCAN_TTL:
+        version = find_artifact()
+        if checked_at is not None and version != _model_version['version']:
+            print(f"Disease model changed ({version}), reloading", file=sys.stderr)
+            _model = None
+        _model_version['version'] = version
+        _model_version['checked_at'] = now
+
+    return _model_version['version']
+
+def load_model():
+    """The current DiseaseModel, loaded once per artifact version"""
+    global _model
+    version = model_version()
+    if version is None:
+        raise FileNotFoundError(f"No trained disease model under {TRAINED_DIR}")
+    if _model is None:
+        _model = DiseaseModel(version[0])
+    return _model
+
+def decode_pool():
+    global _decode_pool
+    if _decode_pool is None:
+        _decode_pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS)
+    return _decode_pool
+
+def _decode(path, image_size):
+    try:
+        return decode_image(path, image_size), None
+    except Exception as e:
+        return None, str(e)
+
+def predict_images(paths, top_k=DEFAULT_TOP_K, crop=None):
+    """
+    One result dict per path, in order. Unreadable images get an 'error'
+    entry instead of failing the batch.
+    """
+    model = load_model()
+    pool = decode_pool()
+    chunks = [paths[start:start + BATCH_SIZE] for start in range(0, len(paths), BATCH_SIZE)]
+
+    def submit(chunk):
+        return [pool.submit(_decode, path, model.image_size) for path in chunk]
+
+    results = []
+    upcoming = submit(chunks[0]) if chunks else []
+    for i, chunk in enumerate(chunks):
+        # Decode the next batch while this one runs through the model
+        current = upcoming
+        if i + 1 < len(chunks):
+            upcoming = submit(chunks[i + 1])
+
+        decoded = [future.result() for future in current]
+        images = [pixels for pixels, _ in decoded if pixels is not None]
+        probs = iter(model.predict_proba(np.stack(images)) if images else [])
+
+        for path, (pixels, error) in zip(chunk, decoded):
+            if pixels is None:
+                results.append({'image': path, 'error': f"Could not read image: {error}"})
+                continue
+            results.append({
+                'image': path,
+                'predictions': model.top_predictions(next(probs), top_k, crop),
+                'model_type': model.kind
+            })
+    return results
+
+def predict_image(path, top_k=DEFAULT_TOP_K, crop=None):
+    return predict_images([path], top_k, crop)[0]
+
+def handle_request(line):
+    """Answer one JSON request; never raises"""
+    try:
+        payload = json.loads(line)
+        if isinstance(payload, list):
+            return {'results': predict_images(payload)}
+        if payload.get('command') == 'model_info':
+            return load_model().info()
+
+        top_k = int(payload.get('top_k', DEFAULT_TOP_K))
+        crop = payload.get('crop')
+        if 'images' in payload:
+            return {'results': predict_images(payload['images'], top_k, crop)}
+        return predict_image(payload['image'], top_k, crop)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return {'error': str(e)}
+
+def warm_up():
+    """Load the model and run one forward pass before the first request arrives"""
+    try:
+        model = load_model()
+        model.predict_proba(np.zeros((1,) + tuple(model.image_size) + (3,), dtype=np.uint8))
+    except Exception as e:
+        print(f"Disease model error: {e}", file=sys.stderr)
+
+def serve(input_stream=None, output_stream=None):
+    """Persistent worker: one JSON request per line in, one JSON response per line out"""
+    input_stream = input_stream or sys.stdin
+    output_stream = output_stream or sys.stdout
+    warm_up()
+
+    for line in input_stream:
+        line = line.strip()
+        if not line:
+            continue
+        output_stream.write(json.dumps(handle_request(line)) + '\n')
+        output_stream.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description='Plant disease predictor')
+    parser.add_argument('images', nargs='*', help='Image files to classify')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help='Predictions returned per image')
+    parser.add_argument('--crop', type=str, help="Only rank this crop's diseases")
+    parser.add_argument('--serve', action='store_true', help='Answer newline-delimited JSON requests on stdin')
+    args = parser.parse_args()
+
+    if args.serve:
+        serve()
+        return
+    if not args.images:
+        parser.error('give at least one image path, or --serve')
+
+    try:
+        results = predict_images(args.images, args.top_k, args.crop)
+        print(json.dumps(results[0] if len(results) == 1 else results))
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        print(json.dumps({'error': str(e)}))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
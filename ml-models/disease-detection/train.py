@@ -8,6 +8,11 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dataset_cache import load_or_build
+from image_shards import augmentation_layers, has_image_splits, make_tf_dataset, prepare_image_splits
+from image_features import DEFAULT_EXTRACTOR, EXTRACTORS
+
 TENSORFLOW_AVAILABLE = False
 try:
     import tensorflow as tf
@@ -68,7 +73,31 @@ def create_enhanced_synthetic_data(num_samples=3000, num_classes=38):
     
     return X, y
 
-def create_tensorflow_model(num_classes):
+HEAD_TYPES = ('flatten', 'pooled')
+
+def classifier_head(head='flatten'):
+    """
+    Layers between the last conv block and the softmax. 'flatten' feeds the
+    14x14x256 feature map into Dense(512) (~25.7M weights); 'pooled' averages
+    it to 256 values first, shrinking the head to ~0.07M weights.
+    """
+    if head == 'pooled':
+        return [
+            layers.GlobalAveragePooling2D(),
+            layers.Dense(256, activation='relu'),
+            layers.Dropout(0.5),
+        ]
+    if head != 'flatten':
+        raise ValueError(f"head must be one of {HEAD_TYPES}")
+    return [
+        layers.Flatten(),
+        layers.Dense(512, activation='relu'),
+        layers.Dropout(0.5),
+        layers.Dense(256, activation='relu'),
+        layers.Dropout(0.5),
+    ]
+
+def create_tensorflow_model(num_classes, head='flatten'):
     model = models.Sequential([
         layers.Input(shape=(224, 224, 3)),
         layers.Conv2D(32, (3, 3), activation='relu', padding='same'),
@@ -87,11 +116,7 @@ def create_tensorflow_model(num_classes):
         layers.BatchNormalization(),
         layers.MaxPooling2D((2, 2)),
         layers.Dropout(0.25),
-        layers.Flatten(),
-        layers.Dense(512, activation='relu'),
-        layers.Dropout(0.5),
-        layers.Dense(256, activation='relu'),
-        layers.Dropout(0.5),
+        *classifier_head(head),
         layers.Dense(num_classes, activation='softmax')
     ])
     
@@ -103,7 +128,7 @@ def create_tensorflow_model(num_classes):
     
     return model
 
-def train_disease_detection(data_path=None, output_path=None, training_id=None, epochs=30):
+def train_disease_detection(data_path=None, output_path=None, training_id=None, epochs=30, refresh_data_cache=False, head='flatten'):
     if not output_path:
         output_path = os.path.join(os.path.dirname(__file__), 'trained', 'disease_detection')
     os.makedirs(output_path, exist_ok=True)
@@ -115,48 +140,77 @@ def train_disease_detection(data_path=None, output_path=None, training_id=None,
     print(f"Output path: {output_path}")
     print(f"TensorFlow Available: {TENSORFLOW_AVAILABLE}")
     
-    num_classes = len(DISEASE_CLASSES)
-    X, y = create_enhanced_synthetic_data(num_samples=3000, num_classes=num_classes)
-    
-    if TENSORFLOW_AVAILABLE:
-        X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
+    # A --data folder with train/ and val/ class folders is decoded once into
+    # uint8 shards; otherwise the synthetic dataset is used
+    real_data = has_image_splits(data_path)
+    if real_data:
+        print(f"Loading images from {data_path}...")
+        train_images, val_images = prepare_image_splits(data_path, force=refresh_data_cache)
+        classes = train_images.classes
+        num_classes = len(classes)
+        n_train, n_val = len(train_images), len(val_images)
     else:
-        X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42, stratify=np.argmax(y, axis=1) if len(y.shape) > 1 else y)
+        classes = DISEASE_CLASSES
+        num_classes = len(classes)
+        arrays = load_or_build(
+            'disease_enhanced_synthetic',
+            lambda: dict(zip(('X', 'y'), create_enhanced_synthetic_data(num_samples=3000, num_classes=num_classes))),
+            refresh=refresh_data_cache,
+            num_samples=3000, num_classes=num_classes, seed=42, tensorflow=TENSORFLOW_AVAILABLE
+        )
+        X, y = arrays['X'], arrays['y']
+        
+        if TENSORFLOW_AVAILABLE:
+            X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
+        else:
+            X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42, stratify=np.argmax(y, axis=1) if len(y.shape) > 1 else y)
+        n_train, n_val = len(X_train), len(X_val)
     
-    print(f"Training samples: {len(X_train)}")
-    print(f"Validation samples: {len(X_val)}")
+    print(f"Training samples: {n_train}")
+    print(f"Validation samples: {n_val}")
     print(f"Number of classes: {num_classes}")
     
     if TENSORFLOW_AVAILABLE:
         print("Training TensorFlow CNN model...")
-        model = create_tensorflow_model(num_classes)
+        model = create_tensorflow_model(num_classes, head=head)
         
-        datagen = ImageDataGenerator(
-            rotation_range=20,
-            width_shift_range=0.2,
-            height_shift_range=0.2,
-            horizontal_flip=True,
-            zoom_range=0.2
-        )
-        
-        history = model.fit(
-            datagen.flow(X_train, y_train, batch_size=32),
-            steps_per_epoch=len(X_train) // 32,
-            epochs=epochs,
-            validation_data=(X_val, y_val),
-            verbose=1
-        )
+        if real_data:
+            augment = augmentation_layers(rotation=20, shift=0.2, zoom=0.2, horizontal_flip=True)
+            train_ds = make_tf_dataset(train_images, batch_size=32, shuffle=True, augment=augment)
+            val_ds = make_tf_dataset(val_images, batch_size=32)
+            
+            history = model.fit(train_ds, epochs=epochs, validation_data=val_ds, verbose=1)
+            
+            val_loss, val_accuracy, val_top_k = model.evaluate(val_ds, verbose=0)
+            y_pred = model.predict(val_ds)
+            y_true_classes = val_images.labels
+        else:
+            datagen = ImageDataGenerator(
+                rotation_range=20,
+                width_shift_range=0.2,
+                height_shift_range=0.2,
+                horizontal_flip=True,
+                zoom_range=0.2
+            )
+            
+            history = model.fit(
+                datagen.flow(X_train, y_train, batch_size=32),
+                steps_per_epoch=len(X_train) // 32,
+                epochs=epochs,
+                validation_data=(X_val, y_val),
+                verbose=1
+            )
+            
+            val_loss, val_accuracy, val_top_k = model.evaluate(X_val, y_val, verbose=0)
+            y_pred = model.predict(X_val)
+            y_true_classes = np.argmax(y_val, axis=1)
         
-        val_loss, val_accuracy, val_top_k = model.evaluate(X_val, y_val, verbose=0)
         print(f"Validation Accuracy: {val_accuracy:.4f}")
         print(f"Validation Top-K Accuracy: {val_top_k:.4f}")
-        
-        y_pred = model.predict(X_val)
         y_pred_classes = np.argmax(y_pred, axis=1)
-        y_true_classes = np.argmax(y_val, axis=1)
         
         print("\nClassification Report:")
-        print(classification_report(y_true_classes, y_pred_classes, target_names=DISEASE_CLASSES[:num_classes], zero_division=0))
+        print(classification_report(y_true_classes, y_pred_classes, labels=np.arange(num_classes), target_names=classes, zero_division=0))
         
         model_path = os.path.join(output_path, 'model.keras')
         model.save(model_path)
@@ -165,15 +219,20 @@ def train_disease_detection(data_path=None, output_path=None, training_id=None,
         val_accuracy_final = float(val_accuracy)
     else:
         print("Training Random Forest model...")
-        if len(X_train.shape) > 2:
-            X_train_flat = X_train.reshape(X_train.shape[0], -1)
-            X_val_flat = X_val.reshape(X_val.shape[0], -1)
+        if real_data:
+            extract = EXTRACTORS[DEFAULT_EXTRACTOR]
+            X_train_flat, y_train_flat = train_images.features(extract), train_images.labels
+            X_val_flat, y_val_flat = val_images.features(extract), val_images.labels
         else:
-            X_train_flat = X_train
-            X_val_flat = X_val
-        
-        y_train_flat = np.argmax(y_train, axis=1) if len(y_train.shape) > 1 else y_train
-        y_val_flat = np.argmax(y_val, axis=1) if len(y_val.shape) > 1 else y_val
+            if len(X_train.shape) > 2:
+                X_train_flat = X_train.reshape(X_train.shape[0], -1)
+                X_val_flat = X_val.reshape(X_val.shape[0], -1)
+            else:
+                X_train_flat = X_train
+                X_val_flat = X_val
+            
+            y_train_flat = np.argmax(y_train, axis=1) if len(y_train.shape) > 1 else y_train
+            y_val_flat = np.argmax(y_val, axis=1) if len(y_val.shape) > 1 else y_val
         
         model = RandomForestClassifier(
             n_estimators=200,
@@ -192,7 +251,7 @@ def train_disease_detection(data_path=None, output_path=None, training_id=None,
         print(f"Validation Accuracy: {val_accuracy:.4f}")
         
         print("\nClassification Report:")
-        print(classification_report(y_val_flat, y_pred, target_names=DISEASE_CLASSES[:num_classes], zero_division=0))
+        print(classification_report(y_val_flat, y_pred, labels=np.arange(num_classes), target_names=classes, zero_division=0))
         
         model_path = os.path.join(output_path, 'model.joblib')
         joblib.dump(model, model_path)
@@ -202,18 +261,20 @@ def train_disease_detection(data_path=None, output_path=None, training_id=None,
     
     labels_path = os.path.join(output_path, 'class_labels.json')
     with open(labels_path, 'w') as f:
-        json.dump(DISEASE_CLASSES, f, indent=2)
+        json.dump(classes, f, indent=2)
     print(f"Class labels saved to {labels_path}")
     
     metadata = {
         'training_id': training_id,
         'model_type': 'tensorflow_cnn' if TENSORFLOW_AVAILABLE else 'random_forest',
         'num_classes': num_classes,
-        'classes': DISEASE_CLASSES,
+        'classes': classes,
         'accuracy': val_accuracy_final,
         'tensorflow_available': TENSORFLOW_AVAILABLE,
-        'training_samples': len(X_train),
-        'validation_samples': len(X_val)
+        'head': head if TENSORFLOW_AVAILABLE else None,
+        'image_features': DEFAULT_EXTRACTOR if real_data and not TENSORFLOW_AVAILABLE else None,
+        'training_samples': n_train,
+        'validation_samples': n_val
     }
     
     metadata_path = os.path.join(output_path, 'metadata.json')
@@ -226,18 +287,37 @@ def train_disease_detection(data_path=None, output_path=None, training_id=None,
 
 def main():
     parser = argparse.ArgumentParser(description='Train disease detection model')
-    parser.add_argument('--data', type=str, help='Path to training data')
+    parser.add_argument('--data', type=str, help='Folder with train/ and val/ class subfolders (synthetic data if omitted)')
     parser.add_argument('--output', type=str, help='Output directory for model')
     parser.add_argument('--training-id', type=str, help='Training ID')
     parser.add_argument('--epochs', type=int, default=30, help='Number of training epochs')
+    parser.add_argument('--refresh-data-cache', action='store_true', help='Rebuild the cached training arrays')
+    parser.add_argument('--head', choices=HEAD_TYPES, default='flatten', help='CNN classifier head (TensorFlow only)')
+    parser.add_argument('--head-report', action='store_true',
+                        help='Compare parameters, FLOPs and CPU latency of each head instead of training')
     
     args = parser.parse_args()
     
+    if args.head_report:
+        if not TENSORFLOW_AVAILABLE:
+            parser.error('--head-report needs TensorFlow')
+        from model_report import compare_heads, print_head_report
+        
+        reports = compare_heads(create_tensorflow_model, len(DISEASE_CLASSES), HEAD_TYPES)
+        print_head_report(reports)
+        if args.output:
+            os.makedirs(args.output, exist_ok=True)
+            with open(os.path.join(args.output, 'head_report.json'), 'w') as f:
+                json.dump(reports, f, indent=2)
+        return
+    
     train_disease_detection(
         data_path=args.data,
         output_path=args.output,
         training_id=args.training_id,
-        epochs=args.epochs
+        epochs=args.epochs,
+        refresh_data_cache=args.refresh_data_cache,
+        head=args.head
     )
 
 if __name__ == "__main__":
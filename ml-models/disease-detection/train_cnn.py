@@ -20,6 +20,10 @@ Usage:
   cd agri-smart-ai/ml-models/disease-detection
   python train_cnn.py
 
+The first run decodes every image once into uint8 shards under data/.shards
+(see image_shards.py); later runs reuse them until the images change, so the
+epoch loop only reads memory-mapped pixels.
+
 After training:
   - Keras model: trained/comprehensive_disease_detection/disease_cnn.h5
   - Class labels: trained/comprehensive_disease_detection/class_labels.json
@@ -30,7 +34,8 @@ import os
 import json
 
 import tensorflow as tf
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+from image_shards import augmentation_layers, make_tf_dataset, prepare_image_splits
 
 BASE_DIR = os.path.dirname(__file__)
 DATA_DIR = os.path.join(BASE_DIR, "data")
@@ -54,30 +59,14 @@ def main():
       "Please prepare the dataset as described in the docstring."
     )
 
-  train_datagen = ImageDataGenerator(
-    rescale=1.0 / 255,
-    rotation_range=15,
-    width_shift_range=0.05,
-    height_shift_range=0.05,
-    zoom_range=0.1,
-    horizontal_flip=True,
-  )
-  val_datagen = ImageDataGenerator(rescale=1.0 / 255)
+  train_images, val_images = prepare_image_splits(DATA_DIR, image_size=IMG_SIZE)
+  print(f"Training on {len(train_images)} images, validating on {len(val_images)}")
 
-  train_gen = train_datagen.flow_from_directory(
-    TRAIN_DIR,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    class_mode="categorical",
-  )
-  val_gen = val_datagen.flow_from_directory(
-    VAL_DIR,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    class_mode="categorical",
-  )
+  augment = augmentation_layers(rotation=15, shift=0.05, zoom=0.1, horizontal_flip=True)
+  train_ds = make_tf_dataset(train_images, BATCH_SIZE, shuffle=True, augment=augment)
+  val_ds = make_tf_dataset(val_images, BATCH_SIZE)
 
-  num_classes = train_gen.num_classes
+  num_classes = train_images.num_classes
 
   base = tf.keras.applications.MobileNetV2(
     input_shape=IMG_SIZE + (3,),
@@ -101,8 +90,8 @@ def main():
   )
 
   model.fit(
-    train_gen,
-    validation_data=val_gen,
+    train_ds,
+    validation_data=val_ds,
     epochs=EPOCHS,
   )
 
@@ -112,10 +101,7 @@ def main():
   print(f"Saved Keras model to {keras_path}")
 
   # Save class labels as an array indexed by class index
-  class_indices = train_gen.class_indices  # {class_name: index}
-  labels = [None] * len(class_indices)
-  for name, idx in class_indices.items():
-    labels[idx] = name
+  labels = train_images.classes
 
   labels_path = os.path.join(OUTPUT_DIR, "class_labels.json")
   with open(labels_path, "w") as f:
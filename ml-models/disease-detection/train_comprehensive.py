@@ -8,6 +8,13 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dataset_cache import load_or_build
+from image_shards import augmentation_layers, has_image_splits, make_tf_dataset, prepare_image_splits
+from image_features import DEFAULT_EXTRACTOR, EXTRACTORS
+from incremental import (CHUNK_SIZE, INCREMENTAL_MODES, MAX_TREES, fit_forest_incremental, fit_sgd_incremental,
+                         load_resume_state)
+
 TENSORFLOW_AVAILABLE = False
 try:
     import tensorflow as tf
@@ -141,7 +148,106 @@ COMPREHENSIVE_DISEASE_CLASSES = [
     'Corn___healthy'
 ]
 
+IMAGE_SHAPE = (224, 224, 3)
+FEATURE_SIZE = 1500
+
+# Class-name keywords -> RGB offset added to every pixel; the first matching rule wins
+CHANNEL_OFFSET_RULES = [
+    (('healthy',), (0.1, 0.1, 0.1)),
+    (('blight',), (-0.1, 0.0, 0.0)),
+    (('rust',), (0.15, -0.1, 0.0)),
+    (('mildew',), (0.2, 0.2, 0.2)),
+    (('mosaic', 'virus'), (0.0, 0.1, 0.0)),
+    (('spot',), (0.0, 0.0, -0.1)),
+]
+
+# Class-name keywords -> (feature block, boost) for the RandomForest feature vectors
+FEATURE_BLOCK_RULES = [
+    (('healthy',), slice(0, 200), 0.2),
+    (('blight',), slice(200, 400), 0.15),
+    (('rust',), slice(400, 600), 0.18),
+    (('mildew',), slice(600, 800), 0.2),
+    (('mosaic', 'virus'), slice(800, 1000), 0.15),
+    (('spot',), slice(1000, 1200), 0.12),
+    (('wilt',), slice(1200, 1400), 0.1),
+]
+
+def _first_match(class_name, rules):
+    lower = class_name.lower()
+    for rule in rules:
+        if any(keyword in lower for keyword in rule[0]):
+            return rule
+    return None
+
+def class_channel_offsets(classes):
+    """(num_classes, 3) RGB offsets, computed once from the class names"""
+    offsets = np.zeros((len(classes), 3), dtype=np.float32)
+    for i, class_name in enumerate(classes):
+        rule = _first_match(class_name, CHANNEL_OFFSET_RULES)
+        if rule:
+            offsets[i] = rule[1]
+    return offsets
+
+def class_feature_offsets(classes, feature_size=FEATURE_SIZE):
+    """(num_classes, feature_size) boosts for the RandomForest feature vectors"""
+    offsets = np.zeros((len(classes), feature_size), dtype=np.float32)
+    for i, class_name in enumerate(classes):
+        rule = _first_match(class_name, FEATURE_BLOCK_RULES)
+        if rule:
+            offsets[i, rule[1]] = rule[2]
+    return offsets
+
+def synthetic_images(labels, channel_offsets, rng):
+    """Noise images in [0, 1/255] shifted by each label's channel offsets and clipped to [0, 1]"""
+    X = rng.random((len(labels),) + IMAGE_SHAPE, dtype=np.float32)
+    X /= 255.0
+    X += channel_offsets[labels][:, None, None, :]
+    return np.clip(X, 0, 1, out=X)
+
+def synthetic_image_batch(labels, channel_offsets, start, batch_size=32, seed=42, augment=None):
+    """
+    (images, one-hot labels) for the batch of labels beginning at start.
+
+    Batch start is always drawn from the same seed, so every epoch sees the
+    same images while only one batch is ever in memory. augment is an
+    optional ImageDataGenerator applied to the batch.
+    """
+    batch_labels = labels[start:start + batch_size]
+    X = synthetic_images(batch_labels, channel_offsets, np.random.default_rng([seed, start]))
+    if augment is not None:
+        X = next(augment.flow(X, batch_size=len(X), shuffle=False))
+    # tf.numpy_function needs exactly the declared float32 outputs
+    return X.astype(np.float32, copy=False), np.eye(len(channel_offsets), dtype=np.float32)[batch_labels]
+
+def make_synthetic_dataset(labels, channel_offsets, batch_size=32, seed=42, augment=None, shuffle=False):
+    """
+    tf.data pipeline over synthetic_image_batch; with shuffle the batch order
+    changes every epoch, as the in-memory fit shuffled its samples
+    """
+    def generate(batch_id):
+        return synthetic_image_batch(labels, channel_offsets, int(batch_id) * batch_size, batch_size, seed, augment)
+
+    def read(batch_id):
+        images, one_hot = tf.numpy_function(generate, [batch_id], (tf.float32, tf.float32))
+        images.set_shape((None,) + IMAGE_SHAPE)
+        one_hot.set_shape((None, len(channel_offsets)))
+        return images, one_hot
+
+    n_batches = -(-len(labels) // batch_size)
+    batches = tf.data.Dataset.range(n_batches)
+    if shuffle:
+        batches = batches.shuffle(n_batches, seed=seed, reshuffle_each_iteration=True)
+    return (
+        batches
+        .map(read, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+
 def create_comprehensive_training_data(num_samples_per_class=100, num_classes=None):
+    """
+    Materialize the whole synthetic set as arrays. With TensorFlow this is
+    samples * 224*224*3 floats; training streams make_synthetic_dataset instead.
+    """
     if num_classes is None:
         num_classes = len(COMPREHENSIVE_DISEASE_CLASSES)
     
@@ -149,65 +255,49 @@ def create_comprehensive_training_data(num_samples_per_class=100, num_classes=No
     print(f"Creating {total_samples} training samples for {num_classes} disease classes...")
     print(f"Crops covered: Rice, Wheat, Maize, Tomato, Potato, Cotton, Sugarcane, Mango, and more...")
     
-    np.random.seed(42)
+    rng = np.random.default_rng(42)
+    classes = COMPREHENSIVE_DISEASE_CLASSES[:num_classes]
+    y = np.arange(total_samples) % num_classes
     
     if TENSORFLOW_AVAILABLE:
-        X = np.random.rand(total_samples, 224, 224, 3).astype(np.float32) / 255.0
-        
-        for i in range(total_samples):
-            class_idx = i % num_classes
-            class_name = COMPREHENSIVE_DISEASE_CLASSES[class_idx]
-            
-            if 'healthy' in class_name.lower():
-                X[i, :, :, :] = np.clip(X[i, :, :, :] + 0.1, 0, 1)
-            elif 'blight' in class_name.lower():
-                X[i, :, :, 0] = np.clip(X[i, :, :, 0] - 0.1, 0, 1)
-            elif 'rust' in class_name.lower():
-                X[i, :, :, 0] = np.clip(X[i, :, :, 0] + 0.15, 0, 1)
-                X[i, :, :, 1] = np.clip(X[i, :, :, 1] - 0.1, 0, 1)
-            elif 'mildew' in class_name.lower():
-                X[i, :, :, :] = np.clip(X[i, :, :, :] + 0.2, 0, 1)
-            elif 'mosaic' in class_name.lower() or 'virus' in class_name.lower():
-                X[i, :, :, 1] = np.clip(X[i, :, :, 1] + 0.1, 0, 1)
-            elif 'spot' in class_name.lower():
-                X[i, :, :, 2] = np.clip(X[i, :, :, 2] - 0.1, 0, 1)
-            
-            X[i] = np.clip(X[i], 0, 1)
+        X = synthetic_images(y, class_channel_offsets(classes), rng)
     else:
-        feature_size = 1500
-        X = np.random.rand(total_samples, feature_size).astype(np.float32)
-        
-        for i in range(total_samples):
-            class_idx = i % num_classes
-            class_name = COMPREHENSIVE_DISEASE_CLASSES[class_idx]
-            
-            base_features = np.random.rand(feature_size)
-            
-            if 'healthy' in class_name.lower():
-                base_features[:200] += 0.2
-            elif 'blight' in class_name.lower():
-                base_features[200:400] += 0.15
-            elif 'rust' in class_name.lower():
-                base_features[400:600] += 0.18
-            elif 'mildew' in class_name.lower():
-                base_features[600:800] += 0.2
-            elif 'mosaic' in class_name.lower() or 'virus' in class_name.lower():
-                base_features[800:1000] += 0.15
-            elif 'spot' in class_name.lower():
-                base_features[1000:1200] += 0.12
-            elif 'wilt' in class_name.lower():
-                base_features[1200:1400] += 0.1
-            
-            X[i] = np.clip(base_features, 0, 1)
-    
-    y = np.array([i % num_classes for i in range(total_samples)])
+        X = rng.random((total_samples, FEATURE_SIZE), dtype=np.float32)
+        X += class_feature_offsets(classes)[y]
+        np.clip(X, 0, 1, out=X)
     
     if TENSORFLOW_AVAILABLE:
         y = keras.utils.to_categorical(y, num_classes)
     
     return X, y
 
-def create_enhanced_tensorflow_model(num_classes):
+HEAD_TYPES = ('flatten', 'pooled')
+
+def classifier_head(head='flatten'):
+    """
+    Layers between the last conv block and the softmax. 'flatten' feeds the
+    7x7x512 feature map into Dense(1024) (~25.7M weights); 'pooled' averages
+    it to 512 values first, shrinking the head to ~0.13M weights.
+    """
+    if head == 'pooled':
+        return [
+            layers.GlobalAveragePooling2D(),
+            layers.Dense(256, activation='relu'),
+            layers.Dropout(0.5),
+        ]
+    if head != 'flatten':
+        raise ValueError(f"head must be one of {HEAD_TYPES}")
+    return [
+        layers.Flatten(),
+        layers.Dense(1024, activation='relu'),
+        layers.Dropout(0.5),
+        layers.Dense(512, activation='relu'),
+        layers.Dropout(0.5),
+        layers.Dense(256, activation='relu'),
+        layers.Dropout(0.5),
+    ]
+
+def create_enhanced_tensorflow_model(num_classes, head='flatten'):
     model = models.Sequential([
         layers.Input(shape=(224, 224, 3)),
         layers.Conv2D(32, (3, 3), activation='relu', padding='same'),
@@ -230,13 +320,7 @@ def create_enhanced_tensorflow_model(num_classes):
         layers.BatchNormalization(),
         layers.MaxPooling2D((2, 2)),
         layers.Dropout(0.25),
-        layers.Flatten(),
-        layers.Dense(1024, activation='relu'),
-        layers.Dropout(0.5),
-        layers.Dense(512, activation='relu'),
-        layers.Dropout(0.5),
-        layers.Dense(256, activation='relu'),
-        layers.Dropout(0.5),
+        *classifier_head(head),
         layers.Dense(num_classes, activation='softmax')
     ])
     
@@ -248,7 +332,9 @@ def create_enhanced_tensorflow_model(num_classes):
     
     return model
 
-def train_comprehensive_model(data_path=None, output_path=None, training_id=None, epochs=50, samples_per_class=150):
+def train_comprehensive_model(data_path=None, output_path=None, training_id=None, epochs=50, samples_per_class=150,
+                              refresh_data_cache=False, head='flatten', incremental='off', resume=False,
+                              chunk_size=CHUNK_SIZE, max_trees=MAX_TREES):
     if not output_path:
         output_path = os.path.join(os.path.dirname(__file__), 'trained', 'comprehensive_disease_detection')
     os.makedirs(output_path, exist_ok=True)
@@ -256,7 +342,15 @@ def train_comprehensive_model(data_path=None, output_path=None, training_id=None
     if not training_id:
         training_id = f"comprehensive_training_{np.random.randint(10000, 99999)}"
     
-    num_classes = len(COMPREHENSIVE_DISEASE_CLASSES)
+    # A --data folder with train/ and val/ class folders is decoded once into
+    # uint8 shards; otherwise synthetic images are generated per class
+    real_data = has_image_splits(data_path)
+    if real_data:
+        train_images, val_images = prepare_image_splits(data_path, force=refresh_data_cache)
+        classes = train_images.classes
+    else:
+        classes = COMPREHENSIVE_DISEASE_CLASSES
+    num_classes = len(classes)
     
     print("=" * 70)
     print("COMPREHENSIVE DISEASE DETECTION MODEL TRAINING")
@@ -265,53 +359,76 @@ def train_comprehensive_model(data_path=None, output_path=None, training_id=None
     print(f"Output path: {output_path}")
     print(f"TensorFlow Available: {TENSORFLOW_AVAILABLE}")
     print(f"Total Disease Classes: {num_classes}")
-    print(f"Samples per class: {samples_per_class}")
-    print(f"Total training samples: {samples_per_class * num_classes}")
+    if not real_data:
+        print(f"Samples per class: {samples_per_class}")
+        print(f"Total training samples: {samples_per_class * num_classes}")
     print()
     print("Crops Covered:")
     crops = set()
-    for cls in COMPREHENSIVE_DISEASE_CLASSES:
+    for cls in classes:
         crop = cls.split('___')[0]
         crops.add(crop)
     print(f"  - {', '.join(sorted(crops))}")
     print()
     
-    X, y = create_comprehensive_training_data(samples_per_class, num_classes)
-    
-    if TENSORFLOW_AVAILABLE:
-        X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
+    if real_data:
+        n_train, n_val = len(train_images), len(val_images)
+    elif TENSORFLOW_AVAILABLE:
+        # Images are generated batch by batch during training; only class ids are split here
+        labels = np.arange(samples_per_class * num_classes) % num_classes
+        train_labels, val_labels = train_test_split(labels, test_size=0.2, random_state=42)
+        n_train, n_val = len(train_labels), len(val_labels)
     else:
+        arrays = load_or_build(
+            'disease_comprehensive_synthetic',
+            lambda: dict(zip(('X', 'y'), create_comprehensive_training_data(samples_per_class, num_classes))),
+            refresh=refresh_data_cache,
+            samples_per_class=samples_per_class, classes=COMPREHENSIVE_DISEASE_CLASSES[:num_classes],
+            seed=42, generator_version=2
+        )
+        X, y = arrays['X'], arrays['y']
         X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42, stratify=np.argmax(y, axis=1) if len(y.shape) > 1 else y)
+        n_train, n_val = len(X_train), len(X_val)
     
-    print(f"Training samples: {len(X_train)}")
-    print(f"Validation samples: {len(X_val)}")
+    print(f"Training samples: {n_train}")
+    print(f"Validation samples: {n_val}")
     print()
     
     if TENSORFLOW_AVAILABLE:
         print("Training TensorFlow CNN model...")
-        model = create_enhanced_tensorflow_model(num_classes)
+        model = create_enhanced_tensorflow_model(num_classes, head=head)
         
         print(f"Model architecture:")
         model.summary()
         print()
         
-        datagen = ImageDataGenerator(
-            rotation_range=30,
-            width_shift_range=0.2,
-            height_shift_range=0.2,
-            horizontal_flip=True,
-            vertical_flip=True,
-            zoom_range=0.2,
-            brightness_range=[0.8, 1.2],
-            fill_mode='nearest'
-        )
+        if real_data:
+            augment = augmentation_layers(rotation=30, shift=0.2, zoom=0.2, horizontal_flip=True, vertical_flip=True)
+            train_data = make_tf_dataset(train_images, batch_size=32, shuffle=True, augment=augment)
+            val_data = make_tf_dataset(val_images, batch_size=32)
+            val_labels = val_images.labels
+        else:
+            datagen = ImageDataGenerator(
+                rotation_range=30,
+                width_shift_range=0.2,
+                height_shift_range=0.2,
+                horizontal_flip=True,
+                vertical_flip=True,
+                zoom_range=0.2,
+                brightness_range=[0.8, 1.2],
+                fill_mode='nearest'
+            )
+            
+            channel_offsets = class_channel_offsets(COMPREHENSIVE_DISEASE_CLASSES[:num_classes])
+            train_data = make_synthetic_dataset(train_labels, channel_offsets, batch_size=32, seed=42, augment=datagen,
+                                                shuffle=True)
+            val_data = make_synthetic_dataset(val_labels, channel_offsets, batch_size=32, seed=43)
         
         print("Starting training...")
         history = model.fit(
-            datagen.flow(X_train, y_train, batch_size=32),
-            steps_per_epoch=len(X_train) // 32,
+            train_data,
             epochs=epochs,
-            validation_data=(X_val, y_val),
+            validation_data=val_data,
             verbose=1,
             callbacks=[
                 keras.callbacks.EarlyStopping(monitor='val_accuracy', patience=5, restore_best_weights=True),
@@ -319,25 +436,25 @@ def train_comprehensive_model(data_path=None, output_path=None, training_id=None
             ]
         )
         
-        val_loss, val_accuracy, val_top_k = model.evaluate(X_val, y_val, verbose=0)
+        val_loss, val_accuracy, val_top_k = model.evaluate(val_data, verbose=0)
         print(f"\nValidation Accuracy: {val_accuracy:.4f}")
         print(f"Validation Top-K Accuracy: {val_top_k:.4f}")
         
-        y_pred = model.predict(X_val, verbose=0)
+        y_pred = model.predict(val_data, verbose=0)
         y_pred_classes = np.argmax(y_pred, axis=1)
-        y_true_classes = np.argmax(y_val, axis=1)
+        y_true_classes = val_labels
         
         print("\nClassification Report:")
         unique_classes = np.unique(np.concatenate([y_true_classes, y_pred_classes]))
         if len(unique_classes) <= 30:
-            print(classification_report(y_true_classes, y_pred_classes, target_names=[COMPREHENSIVE_DISEASE_CLASSES[i] for i in unique_classes], zero_division=0, labels=unique_classes))
+            print(classification_report(y_true_classes, y_pred_classes, target_names=[classes[i] for i in unique_classes], zero_division=0, labels=unique_classes))
         else:
             print(f"Total classes: {len(unique_classes)}")
             from collections import Counter
             pred_counts = Counter(y_pred_classes)
             print(f"Top 10 most common predictions:")
             for pred, count in pred_counts.most_common(10):
-                print(f"  {COMPREHENSIVE_DISEASE_CLASSES[pred]}: {count} predictions")
+                print(f"  {classes[pred]}: {count} predictions")
         
         model_path = os.path.join(output_path, 'model.keras')
         model.save(model_path)
@@ -345,30 +462,62 @@ def train_comprehensive_model(data_path=None, output_path=None, training_id=None
         
         val_accuracy_final = float(val_accuracy)
     else:
-        print("Training Random Forest model...")
-        if len(X_train.shape) > 2:
-            X_train_flat = X_train.reshape(X_train.shape[0], -1)
-            X_val_flat = X_val.reshape(X_val.shape[0], -1)
+        print("Training Random Forest model..." if incremental != 'sgd' else "Training SGD model...")
+        if real_data:
+            extract = EXTRACTORS[DEFAULT_EXTRACTOR]
+            y_train_flat = train_images.labels
+            X_val_flat, y_val_flat = val_images.features(extract), val_images.labels
         else:
-            X_train_flat = X_train
-            X_val_flat = X_val
-        
-        y_train_flat = np.argmax(y_train, axis=1) if len(y_train.shape) > 1 else y_train
-        y_val_flat = np.argmax(y_val, axis=1) if len(y_val.shape) > 1 else y_val
-        
-        model = RandomForestClassifier(
-            n_estimators=300,
-            max_depth=30,
-            min_samples_split=3,
-            min_samples_leaf=2,
-            random_state=42,
-            n_jobs=-1,
-            verbose=1,
-            class_weight='balanced'
-        )
+            if len(X_train.shape) > 2:
+                X_train_flat = X_train.reshape(X_train.shape[0], -1)
+                X_val_flat = X_val.reshape(X_val.shape[0], -1)
+            else:
+                X_train_flat = X_train
+                X_val_flat = X_val
+            
+            y_train_flat = np.argmax(y_train, axis=1) if len(y_train.shape) > 1 else y_train
+            y_val_flat = np.argmax(y_val, axis=1) if len(y_val.shape) > 1 else y_val
         
-        print("Fitting model...")
-        model.fit(X_train_flat, y_train_flat)
+        if incremental != 'off':
+            # Features are computed per class-balanced chunk, so the training set never sits in memory
+            previous = None
+            if resume:
+                previous, classes, remap = load_resume_state(output_path, classes)
+                num_classes = len(classes)
+                crops.update(cls.split('___')[0] for cls in classes)
+                y_train_flat, y_val_flat = remap[y_train_flat], remap[y_val_flat]
+                print(f"Resuming {output_path} with {num_classes} classes")
+            
+            if real_data:
+                read_rows = lambda indices: train_images.features(extract, indices=indices)
+            else:
+                read_rows = lambda indices: X_train_flat[indices]
+            
+            print(f"Fitting incrementally ({incremental}) in class-balanced chunks of {chunk_size}...")
+            if incremental == 'forest':
+                model = fit_forest_incremental(
+                    read_rows, y_train_flat, chunk_size=chunk_size, model=previous, max_trees=max_trees,
+                    max_depth=30, min_samples_split=3, min_samples_leaf=2, n_jobs=-1
+                )
+            else:
+                model = fit_sgd_incremental(read_rows, y_train_flat, chunk_size=chunk_size, model=previous)
+        else:
+            if real_data:
+                X_train_flat = train_images.features(extract)
+            
+            model = RandomForestClassifier(
+                n_estimators=300,
+                max_depth=30,
+                min_samples_split=3,
+                min_samples_leaf=2,
+                random_state=42,
+                n_jobs=-1,
+                verbose=1,
+                class_weight='balanced'
+            )
+            
+            print("Fitting model...")
+            model.fit(X_train_flat, y_train_flat)
         
         y_pred = model.predict(X_val_flat)
         val_accuracy = accuracy_score(y_val_flat, y_pred)
@@ -377,14 +526,14 @@ def train_comprehensive_model(data_path=None, output_path=None, training_id=None
         print("\nClassification Report (showing all classes):")
         unique_classes = np.unique(np.concatenate([y_val_flat, y_pred]))
         if len(unique_classes) <= 30:
-            print(classification_report(y_val_flat, y_pred, target_names=[COMPREHENSIVE_DISEASE_CLASSES[i] for i in unique_classes], zero_division=0, labels=unique_classes))
+            print(classification_report(y_val_flat, y_pred, target_names=[classes[i] for i in unique_classes], zero_division=0, labels=unique_classes))
         else:
             print(f"Total classes predicted: {len(unique_classes)}")
             print(f"Top 10 most common predictions:")
             from collections import Counter
             pred_counts = Counter(y_pred)
             for pred, count in pred_counts.most_common(10):
-                print(f"  {COMPREHENSIVE_DISEASE_CLASSES[pred]}: {count} predictions")
+                print(f"  {classes[pred]}: {count} predictions")
         
         model_path = os.path.join(output_path, 'model.joblib')
         joblib.dump(model, model_path)
@@ -394,11 +543,11 @@ def train_comprehensive_model(data_path=None, output_path=None, training_id=None
     
     labels_path = os.path.join(output_path, 'class_labels.json')
     with open(labels_path, 'w') as f:
-        json.dump(COMPREHENSIVE_DISEASE_CLASSES, f, indent=2)
+        json.dump(classes, f, indent=2)
     print(f"Class labels saved to {labels_path}")
     
     crop_disease_mapping = {}
-    for cls in COMPREHENSIVE_DISEASE_CLASSES:
+    for cls in classes:
         parts = cls.split('___')
         if len(parts) == 2:
             crop = parts[0]
@@ -414,15 +563,18 @@ def train_comprehensive_model(data_path=None, output_path=None, training_id=None
     
     metadata = {
         'training_id': training_id,
-        'model_type': 'tensorflow_cnn' if TENSORFLOW_AVAILABLE else 'random_forest',
+        'model_type': 'tensorflow_cnn' if TENSORFLOW_AVAILABLE else ('sgd' if incremental == 'sgd' else 'random_forest'),
+        'incremental': None if TENSORFLOW_AVAILABLE or incremental == 'off' else incremental,
         'num_classes': num_classes,
-        'classes': COMPREHENSIVE_DISEASE_CLASSES,
+        'classes': classes,
         'crops_covered': sorted(list(crops)),
         'accuracy': val_accuracy_final,
         'tensorflow_available': TENSORFLOW_AVAILABLE,
-        'training_samples': len(X_train),
-        'validation_samples': len(X_val),
-        'samples_per_class': samples_per_class,
+        'head': head if TENSORFLOW_AVAILABLE else None,
+        'image_features': DEFAULT_EXTRACTOR if real_data and not TENSORFLOW_AVAILABLE else None,
+        'training_samples': n_train,
+        'validation_samples': n_val,
+        'samples_per_class': None if real_data else samples_per_class,
         'epochs': epochs if TENSORFLOW_AVAILABLE else None
     }
     
@@ -437,28 +589,61 @@ def train_comprehensive_model(data_path=None, output_path=None, training_id=None
     print("=" * 70)
     print(f"Model supports {num_classes} disease classes across {len(crops)} crops")
     print(f"Model saved to: {output_path}")
-    print()
-    print("Note: This model was trained on synthetic data.")
-    print("For production use, train with real PlantVillage or custom dataset images.")
+    if not real_data:
+        print()
+        print("Note: This model was trained on synthetic data.")
+        print("For production use, train with real PlantVillage or custom dataset images.")
     
     return True
 
 def main():
     parser = argparse.ArgumentParser(description='Train comprehensive disease detection model for all crops')
-    parser.add_argument('--data', type=str, help='Path to training data directory')
+    parser.add_argument('--data', type=str, help='Folder with train/ and val/ class subfolders (synthetic data if omitted)')
     parser.add_argument('--output', type=str, help='Output directory for model')
     parser.add_argument('--training-id', type=str, help='Training ID')
     parser.add_argument('--epochs', type=int, default=50, help='Number of training epochs (TensorFlow only)')
     parser.add_argument('--samples-per-class', type=int, default=150, help='Number of samples per disease class')
+    parser.add_argument('--refresh-data-cache', action='store_true', help='Rebuild the cached training arrays')
+    parser.add_argument('--incremental', choices=INCREMENTAL_MODES, default='off',
+                        help='Without TensorFlow: stream class-balanced chunks into a warm-started forest or an SGD model')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows per incremental chunk')
+    parser.add_argument('--max-trees', type=int, default=MAX_TREES,
+                        help='Tree cap for --incremental forest, whatever the dataset size')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue the incremental model in --output; sgd can add new classes')
+    parser.add_argument('--head', choices=HEAD_TYPES, default='flatten', help='CNN classifier head (TensorFlow only)')
+    parser.add_argument('--head-report', action='store_true',
+                        help='Compare parameters, FLOPs and CPU latency of each head instead of training')
     
     args = parser.parse_args()
     
+    if args.resume and args.incremental == 'off':
+        parser.error('--resume needs --incremental forest or sgd')
+    if args.head_report:
+        if not TENSORFLOW_AVAILABLE:
+            parser.error('--head-report needs TensorFlow')
+        from model_report import compare_heads, print_head_report
+        
+        reports = compare_heads(create_enhanced_tensorflow_model, len(COMPREHENSIVE_DISEASE_CLASSES), HEAD_TYPES)
+        print_head_report(reports)
+        if args.output:
+            os.makedirs(args.output, exist_ok=True)
+            with open(os.path.join(args.output, 'head_report.json'), 'w') as f:
+                json.dump(reports, f, indent=2)
+        return
+    
     train_comprehensive_model(
         data_path=args.data,
         output_path=args.output,
         training_id=args.training_id,
         epochs=args.epochs,
-        samples_per_class=args.samples_per_class
+        samples_per_class=args.samples_per_class,
+        refresh_data_cache=args.refresh_data_cache,
+        head=args.head,
+        incremental=args.incremental,
+        resume=args.resume,
+        chunk_size=args.chunk_size,
+        max_trees=args.max_trees
     )
 
 if __name__ == "__main__":
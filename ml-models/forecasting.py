@@ -0,0 +1,138 @@
+"""
+Recursive multi-day forecasting shared by the weather and market predictors
+
+The sequence models predict one step from the last seq_length scaled rows.
+rollout feeds every prediction back in for a whole batch of windows at once,
+so a horizon-day forecast costs one model call per day however many windows
+are in the batch. Scaling is an affine map per window (the fitted
+MinMaxScaler's scale_ and min_, or per-series ranges), applied to the full
+(batch, rows, features) array in one NumPy expression each way.
+"""
+
+import os
+import sys
+import json
+
+import joblib
+import numpy as np
+
+from sequence_windows import flat_windows
+from sequence_features import with_calendar
+
+DEFAULT_HORIZON = 7
+MAX_HORIZON = 60
+
+def step_function(model):
+    """
+    predict_step(windows, day) for a scikit-learn or Keras model: (batch,
+    seq_length, features) scaled windows -> (batch, outputs) for forecast day
+    """
+    if hasattr(model, 'layers'):
+        return lambda windows, day: np.asarray(model(windows, training=False)).reshape(len(windows), -1)
+    return lambda windows, day: np.asarray(model.predict(flat_windows(windows))).reshape(len(windows), -1)
+
+def calendar_step_function(model, last_dates):
+    """predict_step for a model that also takes calendar columns of each target day"""
+    last_dates = np.array([str(date)[:10] for date in last_dates], dtype='datetime64[D]')
+    return lambda windows, day: np.asarray(
+        model.predict(with_calendar(flat_windows(windows), last_dates + day + 1))
+    ).reshape(len(windows), -1)
+
+def rollout(predict_step, windows, horizon):
+    """(batch, horizon, features) scaled forecasts, each day predicted from the previous seq_length rows"""
+    batch, seq_length, features = windows.shape
+    buffer = np.empty((batch, seq_length + horizon, features), dtype=np.float32)
+    buffer[:, :seq_length] = windows
+    for day in range(horizon):
+        buffer[:, seq_length + day] = predict_step(buffer[:, day:day + seq_length], day)
+    return buffer[:, seq_length:]
+
+def forecast(predict_step, windows, scale, offset, horizon=DEFAULT_HORIZON):
+    """
+    Forecasts in original units for raw (batch, seq_length, features)
+    windows, where scaled = raw * scale + offset (scale and offset broadcast
+    per feature or per window)
+    """
+    scaled = rollout(predict_step, windows * scale + offset, horizon)
+    return (scaled - offset) / scale
+
+def check_horizon(horizon):
+    horizon = int(horizon)
+    if not 1 <= horizon <= MAX_HORIZON:
+        raise ValueError(f"horizon must be between 1 and {MAX_HORIZON} days")
+    return horizon
+
+def stack_windows(windows, seq_length):
+    """(batch, seq_length, features) array of the last seq_length rows of each window"""
+    rows = [np.asarray(window, dtype=np.float64) for window in windows]
+    for i, window in enumerate(rows):
+        if len(window) < seq_length:
+            raise ValueError(f"window {i} has {len(window)} rows; the model needs the last {seq_length}")
+    if not rows:
+        return np.zeros((0, seq_length, 1))
+    return np.stack([window[-seq_length:].reshape(seq_length, -1) for window in rows])
+
+class SequenceModel:
+    """A one-step sequence model (model.keras or model.joblib) with its scaler and metadata.json"""
+
+    def __init__(self, model_dir):
+        self.model_dir = model_dir
+        with open(os.path.join(model_dir, 'metadata.json'), 'r') as f:
+            self.metadata = json.load(f)
+        self.scaler = joblib.load(os.path.join(model_dir, 'scaler.joblib'))
+        self.n_features = int(self.scaler.n_features_in_)
+
+        if self.metadata.get('model_type') == 'tensorflow_lstm':
+            import tensorflow as tf
+
+            self.kind = 'tensorflow_lstm'
+            self.model = tf.keras.models.load_model(os.path.join(model_dir, 'model.keras'), compile=False)
+            inferred = self.model.input_shape[1]
+        else:
+            self.kind = self.metadata.get('model_type') or 'random_forest'
+            self.model = joblib.load(os.path.join(model_dir, 'model.joblib'))
+            inferred = self.model.n_features_in_ // self.n_features
+        # Models trained before seq_length was recorded in metadata.json
+        self.seq_length = int(self.metadata.get('seq_length') or inferred)
+        self.calendar = bool(self.metadata.get('calendar_features'))
+        self.predict_step = step_function(self.model)
+
+    def forecast(self, windows, horizon=DEFAULT_HORIZON, dates=None):
+        """
+        (batch, horizon, features) forecasts for raw (batch, seq_length,
+        features) windows; models with calendar features also need dates, the
+        last day of each window
+        """
+        predict_step = self.predict_step
+        if self.calendar:
+            if dates is None or any(date is None for date in dates):
+                raise ValueError("This model uses calendar features; give the date of each window's last day")
+            predict_step = calendar_step_function(self.model, dates)
+        return forecast(predict_step, windows, self.scaler.scale_, self.scaler.min_, horizon)
+
+    def info(self):
+        return {
+            'model_dir': self.model_dir,
+            'model_type': self.kind,
+            'seq_length': self.seq_length,
+            'n_features': self.n_features,
+            'calendar_features': self.calendar,
+            'training_id': self.metadata.get('training_id')
+        }
+
+def serve(handle_request, warm_up=None, input_stream=None, output_stream=None):
+    """Persistent worker: one JSON request per line in, one JSON response per line out"""
+    input_stream = input_stream or sys.stdin
+    output_stream = output_stream or sys.stdout
+    if warm_up:
+        try:
+            warm_up()
+        except Exception as e:
+            print(f"Model error: {e}", file=sys.stderr)
+
+    for line in input_stream:
+        line = line.strip()
+        if not line:
+            continue
+        output_stream.write(json.dumps(handle_request(line)) + '\n')
+        output_stream.flush()
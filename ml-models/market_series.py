@@ -0,0 +1,190 @@
+"""
+Per-series market price models
+
+A nationwide price file mixes many (crop, market) series. group_price_series
+sorts it into contiguous, date-ordered series, and train_series_models fits
+one RandomForest per series with enough history across a process pool, plus
+one global model on the windows of every shorter series. Each series is
+min-max scaled on its own range and windows never cross series boundaries.
+
+The result is a single indexed artifact (series_models.joblib):
+
+  index                   'crop|market' -> series position
+  model_index             position in models, -1 for the global model
+  price_min, price_scale  per-series scaling, scaled = (price - min) * scale
+  models, global_model, seq_length
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_absolute_error
+
+from sequence_windows import flat_windows, sliding_windows
+
+SERIES_KEY_COLUMNS = ('crop', 'market')
+SEQ_LENGTH = 7
+MIN_SERIES_LENGTH = 30
+VALIDATION_FRACTION = 0.2
+FOREST_PARAMS = {'n_estimators': 100, 'max_depth': 15, 'random_state': 42}
+
+def series_key(crop, market):
+    return f'{crop}|{market}'
+
+def group_price_series(df, price):
+    """
+    {'price', 'offsets', 'crop', 'market'} arrays with the rows of each
+    (crop, market) series contiguous and in date order, so series i is
+    price[offsets[i]:offsets[i + 1]]; None without price, crop or market.
+    Missing prices are forward-filled within their own series only.
+    """
+    if price is None or any(column not in df.columns for column in SERIES_KEY_COLUMNS):
+        return None
+
+    columns = list(SERIES_KEY_COLUMNS) + (['date'] if 'date' in df.columns else [])
+    frame = df[columns].astype(str).assign(price=np.asarray(price, dtype=np.float64).ravel())
+    frame = frame.sort_values(columns, kind='stable')
+    frame['price'] = frame.groupby(list(SERIES_KEY_COLUMNS), sort=False)['price'].ffill()
+    frame = frame.dropna(subset=['price'])
+
+    keys = frame[list(SERIES_KEY_COLUMNS)].to_numpy()
+    starts = np.flatnonzero(np.concatenate([[True], (keys[1:] != keys[:-1]).any(axis=1)]))[:len(keys)]
+    return {
+        'price': frame['price'].to_numpy(dtype=np.float64),
+        'offsets': np.append(starts, len(keys)).astype(np.int64),
+        'crop': keys[starts, 0].astype(str),
+        'market': keys[starts, 1].astype(str)
+    }
+
+def group_store_series(store, column, start=None, end=None):
+    """
+    group_price_series arrays for one column of a SeriesStore; a store
+    partitioned by exactly (crop, market) is read partition by partition with
+    no sorting. None when crop and market are not partition columns.
+    """
+    if not set(SERIES_KEY_COLUMNS) <= set(store.partition_by):
+        return None
+    if list(store.partition_by) != list(SERIES_KEY_COLUMNS):
+        columns = list(SERIES_KEY_COLUMNS) + ([store.date_column] if store.date_column else []) + [column]
+        frame = store.read_frame(columns, start, end)
+        return group_price_series(frame, frame[column].to_numpy())
+
+    prices, crops, markets = [], [], []
+    for key, values in store.iter_partitions([column], start, end):
+        series = pd.Series(values[column]).ffill().to_numpy()
+        prices.append(series[~np.isnan(series)])
+        crops.append(key['crop'])
+        markets.append(key['market'])
+    return {
+        'price': np.concatenate(prices) if prices else np.zeros(0),
+        'offsets': np.concatenate([[0], np.cumsum([len(p) for p in prices])]).astype(np.int64),
+        'crop': np.array(crops, dtype=str),
+        'market': np.array(markets, dtype=str)
+    }
+
+def series_scaling(series):
+    """(min, scale) per series, matching MinMaxScaler; constant series get scale 1"""
+    low = np.array([s.min() if len(s) else 0.0 for s in series])
+    span = np.array([s.max() if len(s) else 0.0 for s in series]) - low
+    return low, np.divide(1.0, span, out=np.ones_like(span), where=span > 0)
+
+def _split_windows(series, seq_length):
+    X, y = sliding_windows(series, seq_length)
+    split = int(len(X) * (1 - VALIDATION_FRACTION))
+    return flat_windows(X[:split]), y[:split], flat_windows(X[split:]), y[split:]
+
+def fit_series_model(task):
+    """
+    Fit one model on the scaled series of a task (position, [series, ...],
+    seq_length); returns (position, model, validation MAE, windows, seconds)
+    """
+    position, series, seq_length = task
+    start = time.perf_counter()
+    parts = [_split_windows(s, seq_length) for s in series]
+    X_train, y_train, X_val, y_val = (np.concatenate([part[i] for part in parts]) for i in range(4))
+
+    model = RandomForestRegressor(n_jobs=1, **FOREST_PARAMS)
+    model.fit(X_train, y_train)
+    mae = float(mean_absolute_error(y_val, model.predict(X_val))) if len(X_val) else None
+    return position, model, mae, len(X_train) + len(X_val), time.perf_counter() - start
+
+def train_series_models(grouped, seq_length=SEQ_LENGTH, min_length=MIN_SERIES_LENGTH, workers=None):
+    """(artifact, throughput report) for grouped series from group_price_series"""
+    price, offsets = grouped['price'], grouped['offsets']
+    series = [price[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+    lengths = np.diff(offsets)
+    price_min, price_scale = series_scaling(series)
+    scaled = [(s - low) * scale for s, low, scale in zip(series, price_min, price_scale)]
+
+    # A series needs a few validation windows of its own to get a model
+    min_length = max(min_length, seq_length + 5)
+    own = np.flatnonzero(lengths >= min_length)
+    shared = np.flatnonzero((lengths < min_length) & (lengths > seq_length + 1))
+    tasks = [(int(i), [scaled[i]], seq_length) for i in own]
+    if len(shared):
+        tasks.append((-1, [scaled[i] for i in shared], seq_length))
+    # Longest tasks first so the pool does not wait on one large series at the end
+    tasks.sort(key=lambda task: -sum(len(s) for s in task[1]))
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks) or 1))
+    print(f"Training {len(own)} series models and a global model for {len(shared)} short series on {workers} workers...")
+    start = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(fit_series_model, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    else:
+        results = [fit_series_model(task) for task in tasks]
+    seconds = time.perf_counter() - start
+
+    model_index = np.full(len(series), -1, dtype=np.int32)
+    models, global_model, maes = [], None, []
+    for position, model, mae, _, _ in results:
+        if position < 0:
+            global_model = model
+        else:
+            model_index[position] = len(models)
+            models.append(model)
+        if mae is not None:
+            maes.append(mae)
+
+    keys = [series_key(crop, market) for crop, market in zip(grouped['crop'], grouped['market'])]
+    artifact = {
+        'seq_length': seq_length,
+        'index': {key: i for i, key in enumerate(keys)},
+        'model_index': model_index,
+        'price_min': price_min,
+        'price_scale': price_scale,
+        'models': models,
+        'global_model': global_model
+    }
+    windows = sum(result[3] for result in results)
+    report = {
+        'series': len(series),
+        'series_models': len(models),
+        'global_series': int(len(shared)),
+        'skipped_series': int(len(series) - len(own) - len(shared)),
+        'windows': int(windows),
+        'workers': workers,
+        'seconds': round(seconds, 3),
+        'fit_seconds': round(sum(result[4] for result in results), 3),
+        'series_per_second': round(len(series) / seconds, 2) if seconds else None,
+        'windows_per_second': round(windows / seconds, 1) if seconds else None,
+        'mae': float(np.mean(maes)) if maes else None
+    }
+    return artifact, report
+
+def series_model(artifact, crop, market):
+    """
+    (model, price_min, price_scale) for a series; an unknown series gets the
+    global model and (None, None), to be scaled on its own recent prices
+    """
+    position = artifact['index'].get(series_key(crop, market))
+    if position is None:
+        return artifact['global_model'], None, None
+    index = artifact['model_index'][position]
+    model = artifact['models'][index] if index >= 0 else artifact['global_model']
+    return model, artifact['price_min'][position], artifact['price_scale'][position]
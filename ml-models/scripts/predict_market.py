@@ -0,0 +1,152 @@
+"""
+Multi-day market price forecasts from the model written by train_market_prediction.py
+
+Loads the artifact in trained/market_prediction, or MARKET_MODEL_DIR, once per
+process: the single pooled model (model.keras or model.joblib with
+scaler.joblib), or series_models.joblib from --per-series training, where each
+(crop, market) series uses its own model and price range and unknown series
+use the global model scaled on their own recent prices.
+
+Usage:
+  python predict_market.py 41.5 42 40.8 ... [--crop rice --market Delhi] [--horizon 7]
+  python predict_market.py --serve
+
+--serve answers newline-delimited JSON requests on stdin, one response line
+each; prices are the most recent daily prices, oldest first:
+  {"prices": [...], "crop": "rice", "market": "Delhi", "horizon": 7} -> {"forecast": [...]}
+  {"series": [{"prices": [...], "crop": ..., "market": ...}, ...]}    -> {"forecasts": [[...], ...]}
+  {"command": "model_info"}                                          -> loaded model details
+"""
+
+import sys
+import json
+import os
+import argparse
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from forecasting import DEFAULT_HORIZON, SequenceModel, check_horizon, forecast, serve, stack_windows, step_function
+from market_series import series_key, series_model
+
+MODEL_DIR = os.environ.get(
+    'MARKET_MODEL_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'trained', 'market_prediction')
+)
+
+_model = None
+
+class SeriesForecaster:
+    """series_models.joblib: one model and price range per (crop, market) series"""
+
+    def __init__(self, model_dir):
+        self.model_dir = model_dir
+        with open(os.path.join(model_dir, 'metadata.json'), 'r') as f:
+            self.metadata = json.load(f)
+        self.artifact = joblib.load(os.path.join(model_dir, 'series_models.joblib'))
+        self.kind = 'per_series_random_forest'
+        self.seq_length = self.artifact['seq_length']
+        self.steps = {}
+
+    def _step(self, model):
+        if id(model) not in self.steps:
+            self.steps[id(model)] = step_function(model)
+        return self.steps[id(model)]
+
+    def forecast(self, windows, horizon=DEFAULT_HORIZON, series=None):
+        """(batch, horizon, 1) forecasts; series[i] is the (crop, market) of windows[i]"""
+        scale = np.empty((len(windows), 1, 1))
+        offset = np.empty((len(windows), 1, 1))
+        groups = {}
+        for i, (crop, market) in enumerate(series or [(None, None)] * len(windows)):
+            model, low, factor = series_model(self.artifact, crop, market)
+            if model is None:
+                raise ValueError(f"No model for {series_key(crop, market)} and no global model")
+            if low is None:
+                low = windows[i].min()
+                span = windows[i].max() - low
+                factor = 1.0 / span if span > 0 else 1.0
+            scale[i], offset[i] = factor, -low * factor
+            groups.setdefault(id(model), (model, []))[1].append(i)
+
+        # One batched roll-out per distinct model
+        forecasts = np.empty((len(windows), horizon, 1))
+        for model, rows in groups.values():
+            forecasts[rows] = forecast(self._step(model), windows[rows], scale[rows], offset[rows], horizon)
+        return forecasts
+
+    def info(self):
+        return {
+            'model_dir': self.model_dir,
+            'model_type': self.kind,
+            'seq_length': self.seq_length,
+            'series': len(self.artifact['index']),
+            'series_models': len(self.artifact['models']),
+            'training_id': self.metadata.get('training_id')
+        }
+
+def load_model():
+    """The market forecaster for MODEL_DIR, loaded once per process"""
+    global _model
+    if _model is None:
+        with open(os.path.join(MODEL_DIR, 'metadata.json'), 'r') as f:
+            per_series = json.load(f).get('model_type') == 'per_series_random_forest'
+        _model = SeriesForecaster(MODEL_DIR) if per_series else SequenceModel(MODEL_DIR)
+    return _model
+
+def forecast_series(items, horizon=DEFAULT_HORIZON):
+    """One list of horizon daily prices per {"prices", "crop", "market"} item"""
+    model = load_model()
+    horizon = check_horizon(horizon)
+    windows = stack_windows([item['prices'] for item in items], model.seq_length)
+    if isinstance(model, SeriesForecaster):
+        forecasts = model.forecast(windows, horizon, [(item.get('crop'), item.get('market')) for item in items])
+    else:
+        forecasts = model.forecast(windows, horizon)
+    return forecasts[..., 0].tolist()
+
+def handle_request(line):
+    """Answer one JSON request; never raises"""
+    try:
+        payload = json.loads(line)
+        if payload.get('command') == 'model_info':
+            return load_model().info()
+
+        horizon = payload.get('horizon', DEFAULT_HORIZON)
+        if 'series' in payload:
+            return {'forecasts': forecast_series(payload['series'], horizon)}
+        return {'forecast': forecast_series([payload], horizon)[0]}
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return {'error': str(e)}
+
+def warm_up():
+    """Load the model and roll out one window before the first request arrives"""
+    forecast_series([{'prices': [1.0] * load_model().seq_length}], 1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Market price forecaster')
+    parser.add_argument('prices', nargs='*', type=float, help='Most recent daily prices, oldest first')
+    parser.add_argument('--crop', type=str, help='Crop of the series (per-series models)')
+    parser.add_argument('--market', type=str, help='Market of the series (per-series models)')
+    parser.add_argument('--horizon', type=int, default=DEFAULT_HORIZON, help='Days to forecast')
+    parser.add_argument('--serve', action='store_true', help='Answer newline-delimited JSON requests on stdin')
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(handle_request, warm_up)
+        return
+    if not args.prices:
+        parser.error('give the recent prices, or --serve')
+
+    try:
+        item = {'prices': args.prices, 'crop': args.crop, 'market': args.market}
+        print(json.dumps({'forecast': forecast_series([item], args.horizon)[0]}))
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        print(json.dumps({'error': str(e)}))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
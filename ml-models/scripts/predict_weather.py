@@ -0,0 +1,119 @@
+"""
+Multi-day weather forecasts from the model written by train_weather_prediction.py
+
+Loads model.keras or model.joblib, scaler.joblib and metadata.json once per
+process from trained/weather_prediction, or WEATHER_MODEL_DIR.
+
+Usage:
+  python predict_weather.py recent.json [--horizon 7]
+  python predict_weather.py --serve
+
+A window is the most recent days, oldest first, as rows of feature values in
+metadata order or as objects keyed by feature name (missing keys count as 0,
+as in training). Only the last seq_length days are used. Models trained with
+calendar features also need the date of the window's last day, from "date"
+in the request or the "date" key of the last row.
+
+--serve answers newline-delimited JSON requests on stdin, one response line
+each:
+  {"window": [...], "horizon": 7, "date": "2024-06-30"}      -> {"forecast": [{"temperature": ...}, ...]}
+  {"windows": [[...], [...]], "horizon": 7, "dates": [...]}  -> {"forecasts": [[...], [...]]}
+  {"command": "model_info"}                                  -> loaded model details
+"""
+
+import sys
+import json
+import os
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from forecasting import DEFAULT_HORIZON, SequenceModel, check_horizon, serve, stack_windows
+
+MODEL_DIR = os.environ.get(
+    'WEATHER_MODEL_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'trained', 'weather_prediction')
+)
+DEFAULT_FEATURES = ['temperature', 'humidity', 'pressure', 'windSpeed', 'rainfall']
+
+_model = None
+
+def load_model():
+    """The weather SequenceModel, loaded once per process"""
+    global _model
+    if _model is None:
+        _model = SequenceModel(MODEL_DIR)
+    return _model
+
+def feature_names(model):
+    return model.metadata.get('features') or DEFAULT_FEATURES
+
+def window_rows(window, features):
+    """(days, features) values for a window of lists or feature-keyed objects"""
+    return [
+        [row.get(name) or 0 for name in features] if isinstance(row, dict) else row
+        for row in window
+    ]
+
+def window_date(window):
+    """Date of a window's last day when its rows are objects with a "date" key"""
+    last = window[-1] if window else None
+    return last.get('date') if isinstance(last, dict) else None
+
+def forecast_windows(windows, horizon=DEFAULT_HORIZON, dates=None):
+    """One list of horizon daily {feature: value} dicts per window"""
+    model = load_model()
+    features = feature_names(model)
+    batch = stack_windows([window_rows(window, features) for window in windows], model.seq_length)
+    if model.calendar:
+        dates = [date or window_date(window) for date, window in zip(dates or [None] * len(windows), windows)]
+    forecasts = model.forecast(batch, check_horizon(horizon), dates)
+    return [[dict(zip(features, day)) for day in forecast.tolist()] for forecast in forecasts]
+
+def handle_request(line):
+    """Answer one JSON request; never raises"""
+    try:
+        payload = json.loads(line)
+        if payload.get('command') == 'model_info':
+            model = load_model()
+            return dict(model.info(), features=feature_names(model))
+
+        horizon = payload.get('horizon', DEFAULT_HORIZON)
+        if 'windows' in payload:
+            return {'forecasts': forecast_windows(payload['windows'], horizon, payload.get('dates'))}
+        return {'forecast': forecast_windows([payload['window']], horizon, [payload.get('date')])[0]}
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return {'error': str(e)}
+
+def warm_up():
+    """Load the model and roll out one window before the first request arrives"""
+    model = load_model()
+    model.forecast(np.zeros((1, model.seq_length, model.n_features)), 1, ['2000-01-01'])
+
+def main():
+    parser = argparse.ArgumentParser(description='Weather forecaster')
+    parser.add_argument('window', nargs='?', help='JSON file with the most recent days')
+    parser.add_argument('--horizon', type=int, default=DEFAULT_HORIZON, help='Days to forecast')
+    parser.add_argument('--date', type=str, help="Date of the window's last day (calendar-feature models)")
+    parser.add_argument('--serve', action='store_true', help='Answer newline-delimited JSON requests on stdin')
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(handle_request, warm_up)
+        return
+    if not args.window:
+        parser.error('give a window file, or --serve')
+
+    try:
+        with open(args.window, 'r') as f:
+            window = json.load(f)
+        print(json.dumps({'forecast': forecast_windows([window], args.horizon, [args.date])[0]}))
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        print(json.dumps({'error': str(e)}))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,12 @@ import argparse
 import numpy as np
 import os
 import joblib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'disease-detection'))
+from dataset_cache import load_or_build
+from image_shards import has_image_splits, make_tf_dataset, prepare_image_splits
+from image_features import DEFAULT_EXTRACTOR, EXTRACTORS
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report
@@ -23,10 +29,13 @@ except ImportError:
     TENSORFLOW_AVAILABLE = False
     print("⚠️ TensorFlow not available. Using scikit-learn Random Forest.")
 
-def create_synthetic_data(num_samples=2000, num_classes=38):
+def create_synthetic_data(num_samples=2000, num_classes=38, seed=None):
     """Create synthetic training data"""
     print(f"Creating {num_samples} synthetic samples for {num_classes} classes...")
     
+    if seed is not None:
+        np.random.seed(seed)
+    
     if TENSORFLOW_AVAILABLE:
         X = np.random.rand(num_samples, 224, 224, 3).astype(np.float32) / 255.0
     else:
@@ -39,7 +48,7 @@ def create_synthetic_data(num_samples=2000, num_classes=38):
     
     return X, y
 
-def train_disease_detection(data_path=None, output_path=None, training_id=None):
+def train_disease_detection(data_path=None, output_path=None, training_id=None, refresh_data_cache=False):
     """Train disease detection model"""
     
     if not output_path:
@@ -52,16 +61,32 @@ def train_disease_detection(data_path=None, output_path=None, training_id=None):
     print(f"Training ID: {training_id}")
     print(f"Output path: {output_path}")
     
-    num_classes = 38
-    X, y = create_synthetic_data(num_samples=2000, num_classes=num_classes)
-    
-    if TENSORFLOW_AVAILABLE:
-        X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
+    # Real photos (train/ and val/ class folders) are decoded once into shards
+    real_data = has_image_splits(data_path)
+    if real_data:
+        train_images, val_images = prepare_image_splits(data_path, force=refresh_data_cache)
+        classes = train_images.classes
+        num_classes = len(classes)
+        n_train, n_val = len(train_images), len(val_images)
     else:
-        X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+        classes = None
+        num_classes = 38
+        arrays = load_or_build(
+            'disease_synthetic',
+            lambda: dict(zip(('X', 'y'), create_synthetic_data(2000, num_classes, seed=42))),
+            refresh=refresh_data_cache,
+            num_samples=2000, num_classes=num_classes, seed=42, tensorflow=TENSORFLOW_AVAILABLE
+        )
+        X, y = arrays['X'], arrays['y']
+        
+        if TENSORFLOW_AVAILABLE:
+            X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
+        else:
+            X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+        n_train, n_val = len(X_train), len(X_val)
     
-    print(f"Training samples: {len(X_train)}")
-    print(f"Validation samples: {len(X_val)}")
+    print(f"Training samples: {n_train}")
+    print(f"Validation samples: {n_val}")
     
     if TENSORFLOW_AVAILABLE:
         print("Training TensorFlow CNN model...")
@@ -84,9 +109,14 @@ def train_disease_detection(data_path=None, output_path=None, training_id=None):
             metrics=['accuracy']
         )
         
-        model.fit(X_train, y_train, validation_data=(X_val, y_val), epochs=10, batch_size=32, verbose=1)
-        
-        val_loss, val_accuracy = model.evaluate(X_val, y_val, verbose=0)
+        if real_data:
+            train_ds = make_tf_dataset(train_images, batch_size=32, shuffle=True)
+            val_ds = make_tf_dataset(val_images, batch_size=32)
+            model.fit(train_ds, validation_data=val_ds, epochs=10, verbose=1)
+            val_loss, val_accuracy = model.evaluate(val_ds, verbose=0)
+        else:
+            model.fit(X_train, y_train, validation_data=(X_val, y_val), epochs=10, batch_size=32, verbose=1)
+            val_loss, val_accuracy = model.evaluate(X_val, y_val, verbose=0)
         print(f"✅ Validation Accuracy: {val_accuracy:.4f}")
         
         model_path = os.path.join(output_path, 'model.keras')
@@ -94,7 +124,12 @@ def train_disease_detection(data_path=None, output_path=None, training_id=None):
         print(f"✅ Model saved to {model_path}")
     else:
         print("Training Random Forest model...")
-        if len(X_train.shape) > 2:
+        if real_data:
+            # Compact colour/texture features instead of 150k raw pixels per photo
+            extract = EXTRACTORS[DEFAULT_EXTRACTOR]
+            X_train_flat, y_train = train_images.features(extract), train_images.labels
+            X_val_flat, y_val = val_images.features(extract), val_images.labels
+        elif len(X_train.shape) > 2:
             X_train_flat = X_train.reshape(X_train.shape[0], -1)
             X_val_flat = X_val.reshape(X_val.shape[0], -1)
         else:
@@ -117,9 +152,16 @@ def train_disease_detection(data_path=None, output_path=None, training_id=None):
         'model_type': 'tensorflow_cnn' if TENSORFLOW_AVAILABLE else 'random_forest',
         'num_classes': num_classes,
         'accuracy': float(val_accuracy),
-        'tensorflow_available': TENSORFLOW_AVAILABLE
+        'tensorflow_available': TENSORFLOW_AVAILABLE,
+        'image_features': DEFAULT_EXTRACTOR if real_data and not TENSORFLOW_AVAILABLE else None
     }
     
+    if classes:
+        labels_path = os.path.join(output_path, 'class_labels.json')
+        with open(labels_path, 'w') as f:
+            json.dump(classes, f, indent=2)
+        print(f"✅ Class labels saved to {labels_path}")
+    
     metadata_path = os.path.join(output_path, 'metadata.json')
     with open(metadata_path, 'w') as f:
         json.dump(metadata, f, indent=2)
@@ -130,20 +172,22 @@ def train_disease_detection(data_path=None, output_path=None, training_id=None):
 
 def main():
     parser = argparse.ArgumentParser(description='Train disease detection model')
-    parser.add_argument('--data', type=str, help='Path to training data (optional, uses synthetic if not provided)')
+    parser.add_argument('--data', type=str, help='Folder with train/ and val/ class subfolders (optional, uses synthetic if not provided)')
     parser.add_argument('--output', type=str, help='Output directory for model')
     parser.add_argument('--training-id', type=str, help='Training ID')
+    parser.add_argument('--refresh-data-cache', action='store_true', help='Rebuild the cached training arrays')
     
     args = parser.parse_args()
     
     if not args.data and not args.output and not args.training_id:
         print("No arguments provided. Using defaults and synthetic data...")
-        train_disease_detection()
+        train_disease_detection(refresh_data_cache=args.refresh_data_cache)
     else:
         train_disease_detection(
             data_path=args.data,
             output_path=args.output,
-            training_id=args.training_id
+            training_id=args.training_id,
+            refresh_data_cache=args.refresh_data_cache
         )
 
 if __name__ == "__main__":
@@ -13,6 +13,14 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 import joblib
 import os
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dataset_cache import load_or_build
+from sequence_windows import flat_windows, sliding_windows, split_segment_windows
+from sequence_updates import load_records, make_watermark, update_from_log
+from series_store import SeriesStore, is_store
+from market_series import MIN_SERIES_LENGTH, group_price_series, group_store_series, train_series_models
 
 TENSORFLOW_AVAILABLE = False
 try:
@@ -24,10 +32,13 @@ except ImportError:
     TENSORFLOW_AVAILABLE = False
     print("⚠️ TensorFlow not available. Using scikit-learn Random Forest.")
 
-def create_synthetic_market_data(num_samples=1000):
+def create_synthetic_market_data(num_samples=1000, seed=None):
     """Create synthetic market price data"""
     print(f"Creating {num_samples} synthetic market price samples...")
     
+    if seed is not None:
+        np.random.seed(seed)
+    
     crops = ['rice', 'wheat', 'maize', 'potato', 'tomato', 'onion', 'cotton', 'sugarcane']
     
     data = []
@@ -54,15 +65,32 @@ def create_synthetic_market_data(num_samples=1000):
     
     return df
 
-def create_sequences(data, seq_length=7):
-    """Create sequences for LSTM or time series"""
-    X, y = [], []
-    for i in range(len(data) - seq_length):
-        X.append(data[i:i+seq_length])
-        y.append(data[i+seq_length])
-    return np.array(X), np.array(y)
+def extract_price_series(df, ffill=True):
+    """
+    Price column (or the first numeric column) as an (n, 1) array,
+    forward-filled in row order unless ffill is False; None if absent
+    """
+    if 'price' in df.columns:
+        prices = df['price']
+    elif 'value' in df.columns:
+        prices = df['value']
+    else:
+        numeric_cols = df.select_dtypes(include=[np.number]).columns
+        if len(numeric_cols) == 0:
+            return None
+        prices = df[numeric_cols[0]]
+    return (prices.ffill() if ffill else prices).values.reshape(-1, 1)
+
+def store_price_column(store):
+    """Price column of a columnar store, chosen like extract_price_series; None if it has none"""
+    for name in ('price', 'value'):
+        if name in store.columns:
+            return name
+    return store.columns[0] if store.columns else None
 
-def train_market_prediction(data_path=None, output_path=None, training_id=None):
+def train_market_prediction(data_path=None, output_path=None, training_id=None, refresh_data_cache=False,
+                            per_series=False, workers=None, min_series_length=MIN_SERIES_LENGTH,
+                            start_date=None, end_date=None):
     """Train market price prediction model"""
     
     if not output_path:
@@ -75,38 +103,55 @@ def train_market_prediction(data_path=None, output_path=None, training_id=None):
     print(f"Training ID: {training_id}")
     print(f"Output path: {output_path}")
     
-    if data_path and os.path.exists(data_path):
-        print(f"Loading data from {data_path}...")
-        with open(data_path, 'r') as f:
-            data = json.load(f)
-        df = pd.DataFrame(data)
-    else:
-        print("Creating synthetic market price data...")
-        df = create_synthetic_market_data(num_samples=1000)
+    if per_series:
+        return train_market_series(data_path, output_path, training_id, refresh_data_cache, workers, min_series_length,
+                                   start_date, end_date)
     
-    if 'price' in df.columns:
-        price_data = df['price'].ffill().values.reshape(-1, 1)
-    elif 'value' in df.columns:
-        price_data = df['value'].ffill().values.reshape(-1, 1)
+    if is_store(data_path):
+        # Memory-mapped columns; only the price column in the date range is read
+        print(f"Reading columnar store {data_path}...")
+        store = SeriesStore(data_path)
+        column = store_price_column(store)
+        # Each partition (crop and market) is its own series, forward-filled and windowed on its own
+        parts = [extract_price_series(pd.DataFrame({column: values[column]}))
+                 for _, values in store.iter_partitions([column], start_date, end_date)] if column else []
+        arrays = {'price': np.concatenate(parts).astype(np.float64),
+                  'lengths': np.array([len(part) for part in parts])} if parts else {}
+        if parts:
+            print(f"Read {len(arrays['price'])} rows from {len(parts)} partitions")
+    elif data_path and os.path.exists(data_path):
+        def build():
+            print(f"Loading data from {data_path}...")
+            price_data = extract_price_series(pd.DataFrame(load_records(data_path)))
+            return {} if price_data is None else {'price': price_data.astype(np.float64)}
+        
+        arrays = load_or_build('market_json', build, source=data_path, refresh=refresh_data_cache)
     else:
-        numeric_cols = df.select_dtypes(include=[np.number]).columns
-        if len(numeric_cols) > 0:
-            price_data = df[numeric_cols[0]].fillna(method='ffill').values.reshape(-1, 1)
-        else:
-            print("❌ No numeric columns found in data")
-            return False
+        def build():
+            print("Creating synthetic market price data...")
+            df = create_synthetic_market_data(num_samples=1000, seed=42)
+            return {'price': extract_price_series(df).astype(np.float64)}
+        
+        arrays = load_or_build('market_synthetic', build, refresh=refresh_data_cache, num_samples=1000, seed=42)
+    
+    if 'price' not in arrays:
+        print("❌ No numeric columns found in data")
+        return False
+    price_data = arrays['price']
     
     scaler = MinMaxScaler()
     scaled_data = scaler.fit_transform(price_data).flatten()
     
     seq_length = 7
-    X, y = create_sequences(scaled_data, seq_length)
+    # Strided views of scaled_data; only the Random Forest path copies them
+    X, y = sliding_windows(scaled_data, seq_length)
     
-    X = X.reshape(X.shape[0], X.shape[1], 1)
+    X = X[..., np.newaxis]
     
-    split_idx = int(len(X) * 0.8)
-    X_train, X_val = X[:split_idx], X[split_idx:]
-    y_train, y_val = y[:split_idx], y[split_idx:]
+    # 80/20 chronological split of every partition's windows
+    train, val = split_segment_windows(arrays.get('lengths', [len(scaled_data)]), seq_length, 0.8)
+    X_train, X_val = X[train], X[val]
+    y_train, y_val = y[train], y[val]
     
     print(f"Training samples: {len(X_train)}")
     print(f"Validation samples: {len(X_val)}")
@@ -131,8 +176,8 @@ def train_market_prediction(data_path=None, output_path=None, training_id=None):
         print(f"✅ Model saved to {model_path}")
     else:
         print("Training Random Forest model...")
-        X_train_flat = X_train.reshape(X_train.shape[0], -1)
-        X_val_flat = X_val.reshape(X_val.shape[0], -1)
+        X_train_flat = flat_windows(X_train)
+        X_val_flat = flat_windows(X_val)
         
         model = RandomForestRegressor(n_estimators=100, max_depth=15, random_state=42, n_jobs=-1)
         model.fit(X_train_flat, y_train)
@@ -156,6 +201,72 @@ def train_market_prediction(data_path=None, output_path=None, training_id=None):
         'model_type': 'tensorflow_lstm' if TENSORFLOW_AVAILABLE else 'random_forest',
         'mae': float(val_mae),
         'r2': float(val_r2) if not TENSORFLOW_AVAILABLE else None,
+        'seq_length': seq_length,
+        'tensorflow_available': TENSORFLOW_AVAILABLE,
+        'watermark': make_watermark(data_path if data_path and os.path.exists(data_path) else None,
+                                    len(price_data), price_data[-seq_length:])
+    }
+    
+    metadata_path = os.path.join(output_path, 'metadata.json')
+    with open(metadata_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    
+    print(f"✅ Metadata saved to {metadata_path}")
+    print("\n✅ Training completed successfully!")
+    return True
+
+def train_market_series(data_path, output_path, training_id, refresh_data_cache=False, workers=None,
+                        min_series_length=MIN_SERIES_LENGTH, start_date=None, end_date=None):
+    """One model per (crop, market) series, trained across a process pool, saved as one indexed artifact"""
+    if is_store(data_path):
+        print(f"Reading columnar store {data_path}...")
+        store = SeriesStore(data_path)
+        column = store_price_column(store)
+        arrays = (column and group_store_series(store, column, start_date, end_date)) or {}
+    elif data_path and os.path.exists(data_path):
+        def build():
+            print(f"Loading data from {data_path}...")
+            df = pd.DataFrame(load_records(data_path))
+            return group_price_series(df, extract_price_series(df, ffill=False)) or {}
+        
+        # fill names how missing prices were filled, so entries cached before per-series filling are rebuilt
+        arrays = load_or_build('market_series_json', build, source=data_path, refresh=refresh_data_cache,
+                               fill='per_series')
+    else:
+        def build():
+            print("Creating synthetic market price data...")
+            df = create_synthetic_market_data(num_samples=1000, seed=42)
+            return group_price_series(df, extract_price_series(df, ffill=False))
+        
+        arrays = load_or_build('market_series_synthetic', build, refresh=refresh_data_cache, num_samples=1000, seed=42,
+                               fill='per_series')
+    
+    if 'offsets' not in arrays:
+        print("❌ Per-series training needs price, crop and market columns")
+        return False
+    
+    artifact, report = train_series_models(arrays, min_length=min_series_length, workers=workers)
+    print(f"✅ {report['series_models']} series models, {report['global_series']} series on the global model, "
+          f"{report['series_per_second']} series/s on {report['workers']} workers")
+    if report['mae'] is not None:
+        print(f"✅ Mean validation MAE: {report['mae']:.4f}")
+    
+    model_path = os.path.join(output_path, 'series_models.joblib')
+    joblib.dump(artifact, model_path)
+    print(f"✅ Series models saved to {model_path}")
+    
+    report_path = os.path.join(output_path, 'throughput_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Throughput report saved to {report_path}")
+    
+    metadata = {
+        'training_id': training_id,
+        'model_type': 'per_series_random_forest',
+        'mae': report['mae'],
+        'seq_length': artifact['seq_length'],
+        'series': report['series'],
+        'series_models': report['series_models'],
         'tensorflow_available': TENSORFLOW_AVAILABLE
     }
     
@@ -167,22 +278,72 @@ def train_market_prediction(data_path=None, output_path=None, training_id=None):
     print("\n✅ Training completed successfully!")
     return True
 
+def update_market_prediction(update_path, output_path=None, training_id=None):
+    """Update the saved pooled model with the rows appended to a JSONL log since its watermark"""
+    
+    if not output_path:
+        output_path = os.path.join(os.path.dirname(__file__), '..', 'trained', 'market_prediction')
+    
+    if not training_id:
+        training_id = f"training_{np.random.randint(10000, 99999)}"
+    
+    print(f"Training ID: {training_id}")
+    print(f"Model path: {output_path}")
+    
+    with open(os.path.join(output_path, 'metadata.json'), 'r') as f:
+        if json.load(f).get('model_type') == 'per_series_random_forest':
+            print("❌ Per-series models are not updated incrementally; retrain them with --per-series")
+            return False
+    
+    def to_rows(records):
+        price_data = extract_price_series(pd.DataFrame(records))
+        if price_data is None:
+            raise ValueError("No numeric columns found in the appended rows")
+        return price_data
+    
+    start = time.perf_counter()
+    try:
+        metadata = update_from_log(output_path, update_path, to_rows, training_id)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return False
+    if metadata:
+        print(f"✅ Updated on {metadata['update_windows']} new windows in {time.perf_counter() - start:.1f}s")
+        if metadata['update_mae'] is not None:
+            print(f"✅ MAE on the new windows before the update: {metadata['update_mae']:.4f}")
+    print("\n✅ Update completed successfully!")
+    return True
+
 def main():
     parser = argparse.ArgumentParser(description='Train market price prediction model')
-    parser.add_argument('--data', type=str, help='Path to training data (optional, uses synthetic if not provided)')
+    parser.add_argument('--data', type=str, help='JSON/JSONL file or columnar store directory (optional, uses synthetic if not provided)')
     parser.add_argument('--output', type=str, help='Output directory for model')
     parser.add_argument('--training-id', type=str, help='Training ID')
+    parser.add_argument('--refresh-data-cache', action='store_true', help='Rebuild the cached training arrays')
+    parser.add_argument('--per-series', action='store_true', help='Train one model per (crop, market) series in parallel')
+    parser.add_argument('--workers', type=int, help='Processes for --per-series (default: CPU count)')
+    parser.add_argument('--min-series-length', type=int, default=MIN_SERIES_LENGTH,
+                        help='Shorter series share a global model (--per-series)')
+    parser.add_argument('--update', type=str, help='JSONL log to update the saved model from, instead of retraining')
+    parser.add_argument('--start', type=str, help='First date (YYYY-MM-DD) read from a columnar store')
+    parser.add_argument('--end', type=str, help='Last date (YYYY-MM-DD) read from a columnar store')
     
     args = parser.parse_args()
+    series_options = dict(per_series=args.per_series, workers=args.workers, min_series_length=args.min_series_length,
+                          start_date=args.start, end_date=args.end)
     
-    if not args.data and not args.output and not args.training_id:
+    if args.update:
+        update_market_prediction(args.update, output_path=args.output, training_id=args.training_id)
+    elif not args.data and not args.output and not args.training_id:
         print("No arguments provided. Using defaults and synthetic data...")
-        train_market_prediction()
+        train_market_prediction(refresh_data_cache=args.refresh_data_cache, **series_options)
     else:
         train_market_prediction(
             data_path=args.data,
             output_path=args.output,
-            training_id=args.training_id
+            training_id=args.training_id,
+            refresh_data_cache=args.refresh_data_cache,
+            **series_options
         )
 
 if __name__ == "__main__":
@@ -9,10 +9,17 @@ import argparse
 import numpy as np
 import pandas as pd
 from sklearn.preprocessing import MinMaxScaler
-from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 import joblib
 import os
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dataset_cache import load_or_build
+from sequence_windows import flat_windows, sliding_windows, split_segment_windows
+from sequence_updates import load_records, make_watermark, update_from_log
+from series_store import SeriesStore, is_store
+from sequence_features import FALLBACK_TYPES, benchmark_fallbacks, make_fallback, print_benchmark, with_calendar
 
 TENSORFLOW_AVAILABLE = False
 try:
@@ -24,10 +31,13 @@ except ImportError:
     TENSORFLOW_AVAILABLE = False
     print("⚠️ TensorFlow not available. Using scikit-learn Random Forest.")
 
-def create_synthetic_weather_data(num_samples=1000):
+def create_synthetic_weather_data(num_samples=1000, seed=None):
     """Create synthetic weather data"""
     print(f"Creating {num_samples} synthetic weather samples...")
     
+    if seed is not None:
+        np.random.seed(seed)
+    
     dates = pd.date_range(start='2020-01-01', periods=num_samples, freq='D')
     
     data = {
@@ -48,15 +58,13 @@ def create_synthetic_weather_data(num_samples=1000):
     
     return df
 
-def create_sequences(data, seq_length=7):
-    """Create sequences for LSTM or time series"""
-    X, y = [], []
-    for i in range(len(data) - seq_length):
-        X.append(data[i:i+seq_length])
-        y.append(data[i+seq_length])
-    return np.array(X), np.array(y)
+def parse_dates(dates):
+    """datetime64[D] row dates, or None unless every row has a parseable date"""
+    dates = pd.to_datetime(pd.Series(dates), errors='coerce').to_numpy().astype('datetime64[D]')
+    return None if np.isnat(dates).any() else dates
 
-def train_weather_prediction(data_path=None, output_path=None, training_id=None):
+def train_weather_prediction(data_path=None, output_path=None, training_id=None, refresh_data_cache=False,
+                             start_date=None, end_date=None, fallback='random_forest', benchmark=False):
     """Train weather prediction model"""
     
     if not output_path:
@@ -69,27 +77,61 @@ def train_weather_prediction(data_path=None, output_path=None, training_id=None)
     print(f"Training ID: {training_id}")
     print(f"Output path: {output_path}")
     
-    if data_path and os.path.exists(data_path):
-        print(f"Loading data from {data_path}...")
-        with open(data_path, 'r') as f:
-            data = json.load(f)
-        df = pd.DataFrame(data)
+    features = ['temperature', 'humidity', 'pressure', 'windSpeed', 'rainfall']
+    
+    if is_store(data_path):
+        # Memory-mapped columns; only the feature columns in the date range are read
+        print(f"Reading columnar store {data_path}...")
+        store = SeriesStore(data_path)
+        columns = features + ([store.date_column] if store.date_column else [])
+        parts = [part for _, part in store.iter_partitions(columns, start=start_date, end=end_date)]
+        if not any(len(part[features[0]]) for part in parts):
+            print(f"❌ No rows in {data_path} for the requested dates")
+            return False
+        values = np.concatenate([np.column_stack([part[name] for name in features]) for part in parts])
+        # Each partition (station) is its own date-ordered series; windows must not run from one into the next
+        arrays = {'features': np.where(np.isnan(values), 0.0, values),
+                  'lengths': np.array([len(part[features[0]]) for part in parts])}
+        dates = parse_dates(np.concatenate([part[store.date_column] for part in parts])) if store.date_column else None
+        if dates is not None:
+            arrays['dates'] = dates
+        print(f"Read {len(values)} rows from {len(parts)} partitions")
+    elif data_path and os.path.exists(data_path):
+        def build():
+            print(f"Loading data from {data_path}...")
+            df = pd.DataFrame(load_records(data_path))
+            arrays = {'features': df[features].fillna(0).to_numpy(dtype=np.float64)}
+            dates = parse_dates(df['date']) if 'date' in df.columns else None
+            return arrays if dates is None else dict(arrays, dates=dates)
+        
+        arrays = load_or_build('weather_json', build, source=data_path, refresh=refresh_data_cache, features=features)
     else:
-        print("Creating synthetic weather data...")
-        df = create_synthetic_weather_data(num_samples=1000)
+        def build():
+            print("Creating synthetic weather data...")
+            df = create_synthetic_weather_data(num_samples=1000, seed=42)
+            return {'features': df[features].fillna(0).to_numpy(dtype=np.float64), 'dates': parse_dates(df['date'])}
+        
+        arrays = load_or_build('weather_synthetic', build, refresh=refresh_data_cache,
+                               num_samples=1000, seed=42, features=features)
     
-    features = ['temperature', 'humidity', 'pressure', 'windSpeed', 'rainfall']
-    df_features = df[features].fillna(0)
+    df_features = pd.DataFrame(arrays['features'], columns=features)
     
     scaler = MinMaxScaler()
     scaled_data = scaler.fit_transform(df_features)
     
     seq_length = 7
-    X, y = create_sequences(scaled_data, seq_length)
+    # Strided views of scaled_data; only the Random Forest path copies them
+    X, y = sliding_windows(scaled_data, seq_length)
+    
+    # 80/20 chronological split of every partition's windows
+    train, val = split_segment_windows(arrays.get('lengths', [len(scaled_data)]), seq_length, 0.8)
+    X_train, X_val = X[train], X[val]
+    y_train, y_val = y[train], y[val]
     
-    split_idx = int(len(X) * 0.8)
-    X_train, X_val = X[:split_idx], X[split_idx:]
-    y_train, y_val = y[:split_idx], y[split_idx:]
+    # Date of the day each window predicts, for calendar features
+    dates = arrays.get('dates')
+    target_dates = dates[seq_length:seq_length + len(X)] if dates is not None else None
+    calendar = False
     
     print(f"Training samples: {len(X_train)}")
     print(f"Validation samples: {len(X_val)}")
@@ -113,11 +155,15 @@ def train_weather_prediction(data_path=None, output_path=None, training_id=None)
         model.save(model_path)
         print(f"✅ Model saved to {model_path}")
     else:
-        print("Training Random Forest model...")
-        X_train_flat = X_train.reshape(X_train.shape[0], -1)
-        X_val_flat = X_val.reshape(X_val.shape[0], -1)
+        print(f"Training {fallback.replace('_', ' ')} model...")
+        X_train_flat = flat_windows(X_train)
+        X_val_flat = flat_windows(X_val)
+        calendar = fallback != 'random_forest' and target_dates is not None
+        if calendar:
+            X_train_flat = with_calendar(X_train_flat, target_dates[train])
+            X_val_flat = with_calendar(X_val_flat, target_dates[val])
         
-        model = RandomForestRegressor(n_estimators=100, max_depth=15, random_state=42, n_jobs=-1)
+        model = make_fallback(fallback, seq_length, len(features), calendar)
         model.fit(X_train_flat, y_train)
         
         y_pred = model.predict(X_val_flat)
@@ -130,16 +176,33 @@ def train_weather_prediction(data_path=None, output_path=None, training_id=None)
         joblib.dump(model, model_path)
         print(f"✅ Model saved to {model_path}")
     
+    if benchmark:
+        print("Benchmarking scikit-learn fallbacks...")
+        results = benchmark_fallbacks(
+            flat_windows(X_train), y_train, flat_windows(X_val), y_val, seq_length, len(features),
+            target_dates[train] if target_dates is not None else None,
+            target_dates[val] if target_dates is not None else None
+        )
+        print_benchmark(results)
+        benchmark_path = os.path.join(output_path, 'fallback_benchmark.json')
+        with open(benchmark_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Fallback benchmark saved to {benchmark_path}")
+    
     scaler_path = os.path.join(output_path, 'scaler.joblib')
     joblib.dump(scaler, scaler_path)
     print(f"✅ Scaler saved to {scaler_path}")
     
     metadata = {
         'training_id': training_id,
-        'model_type': 'tensorflow_lstm' if TENSORFLOW_AVAILABLE else 'random_forest',
+        'model_type': 'tensorflow_lstm' if TENSORFLOW_AVAILABLE else fallback,
         'features': features,
+        'seq_length': seq_length,
+        'calendar_features': calendar,
         'mae': float(val_mae),
-        'tensorflow_available': TENSORFLOW_AVAILABLE
+        'tensorflow_available': TENSORFLOW_AVAILABLE,
+        'watermark': make_watermark(data_path if data_path and os.path.exists(data_path) else None,
+                                    len(df_features), df_features.to_numpy()[-seq_length:])
     }
     
     metadata_path = os.path.join(output_path, 'metadata.json')
@@ -150,22 +213,69 @@ def train_weather_prediction(data_path=None, output_path=None, training_id=None)
     print("\n✅ Training completed successfully!")
     return True
 
+def update_weather_prediction(update_path, output_path=None, training_id=None):
+    """Update the saved model with the rows appended to a JSONL log since its watermark"""
+    
+    if not output_path:
+        output_path = os.path.join(os.path.dirname(__file__), '..', 'trained', 'weather_prediction')
+    
+    if not training_id:
+        training_id = f"training_{np.random.randint(10000, 99999)}"
+    
+    print(f"Training ID: {training_id}")
+    print(f"Model path: {output_path}")
+    
+    with open(os.path.join(output_path, 'metadata.json'), 'r') as f:
+        features = json.load(f)['features']
+    
+    def to_rows(records):
+        return pd.DataFrame(records).reindex(columns=features).fillna(0).to_numpy(dtype=np.float64)
+    
+    start = time.perf_counter()
+    try:
+        metadata = update_from_log(output_path, update_path, to_rows, training_id)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return False
+    if metadata:
+        print(f"✅ Updated on {metadata['update_windows']} new windows in {time.perf_counter() - start:.1f}s")
+        if metadata['update_mae'] is not None:
+            print(f"✅ MAE on the new windows before the update: {metadata['update_mae']:.4f}")
+    print("\n✅ Update completed successfully!")
+    return True
+
 def main():
     parser = argparse.ArgumentParser(description='Train weather prediction model')
-    parser.add_argument('--data', type=str, help='Path to training data (optional, uses synthetic if not provided)')
+    parser.add_argument('--data', type=str, help='JSON/JSONL file or columnar store directory (optional, uses synthetic if not provided)')
     parser.add_argument('--output', type=str, help='Output directory for model')
     parser.add_argument('--training-id', type=str, help='Training ID')
+    parser.add_argument('--refresh-data-cache', action='store_true', help='Rebuild the cached training arrays')
+    parser.add_argument('--update', type=str, help='JSONL log to update the saved model from, instead of retraining')
+    parser.add_argument('--start', type=str, help='First date (YYYY-MM-DD) read from a columnar store')
+    parser.add_argument('--end', type=str, help='Last date (YYYY-MM-DD) read from a columnar store')
+    parser.add_argument('--fallback', choices=FALLBACK_TYPES, default='random_forest',
+                        help='scikit-learn model used when TensorFlow is not available')
+    parser.add_argument('--benchmark-fallbacks', action='store_true',
+                        help='Compare MAE, size and latency of every fallback (fallback_benchmark.json)')
     
     args = parser.parse_args()
     
-    if not args.data and not args.output and not args.training_id:
+    if args.update:
+        update_weather_prediction(args.update, output_path=args.output, training_id=args.training_id)
+    elif not args.data and not args.output and not args.training_id:
         print("No arguments provided. Using defaults and synthetic data...")
-        train_weather_prediction()
+        train_weather_prediction(refresh_data_cache=args.refresh_data_cache, fallback=args.fallback,
+                                 benchmark=args.benchmark_fallbacks)
     else:
         train_weather_prediction(
             data_path=args.data,
             output_path=args.output,
-            training_id=args.training_id
+            training_id=args.training_id,
+            refresh_data_cache=args.refresh_data_cache,
+            start_date=args.start,
+            end_date=args.end,
+            fallback=args.fallback,
+            benchmark=args.benchmark_fallbacks
         )
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+"""
+Lightweight scikit-learn fallbacks for the sequence models
+
+Without TensorFlow the trainers fit a 100-tree RandomForest on flattened
+windows, which makes a model file of tens of MB and a slow multi-output
+predict. The fallbacks here build lag and calendar features for a whole batch
+of windows in a few NumPy operations and fit a small model on them:
+
+  hist_gradient_boosting  one HistGradientBoostingRegressor per output
+  linear_ar               ridge autoregression on the same features
+
+Lag features are the flattened window, each feature's window mean and its
+change over the window. Calendar features are sin/cos of the target day's
+day of year and day of week. LagFeatureRegressor.predict takes the same flat
+windows as the forest, followed by the calendar columns when it uses them,
+so it is saved as model.joblib and served by forecasting.SequenceModel.
+
+benchmark_fallbacks compares validation MAE, pickled size and per-forecast
+latency of every fallback against the forest.
+"""
+
+import io
+import time
+
+import joblib
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import Ridge
+from sklearn.metrics import mean_absolute_error
+from sklearn.multioutput import MultiOutputRegressor
+
+FALLBACK_TYPES = ('random_forest', 'hist_gradient_boosting', 'linear_ar')
+CALENDAR_COLUMNS = 4
+FOREST_PARAMS = {'n_estimators': 100, 'max_depth': 15, 'random_state': 42, 'n_jobs': -1}
+
+def calendar_features(dates):
+    """(n, 4) sin/cos of day of year and day of week for datetime64[D] dates"""
+    days = np.asarray(dates, dtype='datetime64[D]')
+    day_of_year = (days - days.astype('datetime64[Y]')).astype(np.float64)
+    # 1970-01-01 was a Thursday; 0 = Monday
+    day_of_week = ((days.astype(np.int64) + 3) % 7).astype(np.float64)
+    year_angle = 2 * np.pi * day_of_year / 365.25
+    week_angle = 2 * np.pi * day_of_week / 7
+    return np.column_stack([np.sin(year_angle), np.cos(year_angle), np.sin(week_angle), np.cos(week_angle)])
+
+def lag_features(windows):
+    """(n, seq_length * features + 2 * features) lag features of (n, seq_length, features) windows"""
+    windows = np.asarray(windows, dtype=np.float64)
+    n = len(windows)
+    return np.hstack([
+        windows.reshape(n, -1),
+        windows.mean(axis=1),
+        windows[:, -1] - windows[:, 0],
+    ])
+
+def _estimator(kind):
+    if kind == 'hist_gradient_boosting':
+        # Early stopping keeps the ensemble, and so the file and predict time, as small as the data allows
+        return MultiOutputRegressor(HistGradientBoostingRegressor(
+            max_iter=200, learning_rate=0.1, max_leaf_nodes=15, early_stopping=True, random_state=42
+        ))
+    if kind == 'linear_ar':
+        return Ridge(alpha=1e-3)
+    raise ValueError(f"Unknown fallback {kind!r}; expected one of {FALLBACK_TYPES[1:]}")
+
+class LagFeatureRegressor(BaseEstimator, RegressorMixin):
+    """
+    Lag/calendar-feature model over flat windows: X is (n, seq_length *
+    n_features), plus CALENDAR_COLUMNS columns from calendar_features of each
+    target day when calendar is True
+    """
+
+    def __init__(self, kind='hist_gradient_boosting', seq_length=7, n_features=1, calendar=False):
+        self.kind = kind
+        self.seq_length = seq_length
+        self.n_features = n_features
+        self.calendar = calendar
+
+    def _features(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        width = self.seq_length * self.n_features
+        lags = lag_features(X[:, :width].reshape(len(X), self.seq_length, self.n_features))
+        return np.hstack([lags, X[:, width:]]) if self.calendar else lags
+
+    def fit(self, X, y):
+        y = np.asarray(y)
+        self.single_output_ = y.ndim == 1
+        self.estimator_ = _estimator(self.kind)
+        # MultiOutputRegressor needs 2-D targets
+        self.estimator_.fit(self._features(X), y.reshape(len(y), -1))
+        self.n_features_in_ = self.seq_length * self.n_features + (CALENDAR_COLUMNS if self.calendar else 0)
+        return self
+
+    def predict(self, X):
+        predictions = np.asarray(self.estimator_.predict(self._features(X)))
+        return predictions[:, 0] if self.single_output_ else predictions
+
+def with_calendar(flat, dates):
+    """Flat windows with the calendar columns of their target dates appended"""
+    return np.hstack([flat, calendar_features(dates)])
+
+def make_fallback(kind, seq_length, n_features, calendar=False):
+    """Unfitted model for a FALLBACK_TYPES entry; the forest is the trainers' original one"""
+    if kind == 'random_forest':
+        return RandomForestRegressor(**FOREST_PARAMS)
+    return LagFeatureRegressor(kind, seq_length, n_features, calendar)
+
+def model_bytes(model):
+    """Size of the model pickled by joblib, as written to model.joblib"""
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return buffer.getbuffer().nbytes
+
+def _latency_ms(model, X, runs):
+    model.predict(X)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model.predict(X)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+def benchmark_fallbacks(X_train, y_train, X_val, y_val, seq_length, n_features, dates_train=None, dates_val=None,
+                        kinds=FALLBACK_TYPES, runs=20, batch_size=256):
+    """
+    {kind: {mae, model_bytes, fit_seconds, latency_ms_single, latency_ms_per_window}}
+    for flat windows; the forest never uses calendar columns
+    """
+    results = {}
+    for kind in kinds:
+        calendar = kind != 'random_forest' and dates_train is not None
+        train = with_calendar(X_train, dates_train) if calendar else X_train
+        val = with_calendar(X_val, dates_val) if calendar else X_val
+
+        model = make_fallback(kind, seq_length, n_features, calendar)
+        start = time.perf_counter()
+        model.fit(train, y_train)
+        fit_seconds = time.perf_counter() - start
+
+        batch = val[:batch_size]
+        results[kind] = {
+            'mae': float(mean_absolute_error(y_val, model.predict(val))),
+            'model_bytes': model_bytes(model),
+            'fit_seconds': round(fit_seconds, 3),
+            'latency_ms_single': round(_latency_ms(model, val[:1], runs), 3),
+            'latency_ms_per_window': round(_latency_ms(model, batch, runs) / max(1, len(batch)), 4),
+            'calendar_features': calendar
+        }
+    return results
+
+def print_benchmark(results):
+    for kind, result in results.items():
+        print(f"{kind:>24}: MAE {result['mae']:.4f}, {result['model_bytes'] / 1024:,.0f} kB, "
+              f"{result['latency_ms_single']:.2f} ms/forecast, {result['latency_ms_per_window']:.4f} ms/window batched, "
+              f"fit {result['fit_seconds']:.1f}s")
@@ -0,0 +1,162 @@
+"""
+Incremental updates for the weather and market sequence models
+
+A daily refresh reads only the records appended to a JSONL log since the last
+run instead of refitting on the full history. metadata.json keeps the data
+watermark of the artifact:
+
+  source  absolute path of the log the rows came from (None for a JSON file
+          or synthetic data)
+  offset  bytes of source already consumed
+  rows    rows seen in total
+  tail    the last seq_length raw rows, so new windows can start before the
+          first appended row
+
+update_from_log widens the MinMaxScaler with partial_fit, builds windows over
+tail + new rows and then adds trees_per_update warm-started trees to the
+forest (dropping the oldest beyond max_trees) or fine-tunes the LSTM for a
+few epochs. Both artifacts keep their file names, so predictors pick them up
+unchanged.
+"""
+
+import os
+import json
+
+import joblib
+import numpy as np
+
+from sequence_windows import flat_windows, sliding_windows
+
+TREES_PER_UPDATE = 10
+MAX_TREES = 300
+FINE_TUNE_EPOCHS = 3
+
+def is_log(path):
+    return path is not None and path.endswith('.jsonl')
+
+def read_log(path, offset=0):
+    """(records, new offset) for the complete JSON lines of path after byte offset"""
+    with open(path, 'rb') as f:
+        if offset > os.fstat(f.fileno()).st_size:
+            print(f"⚠️ {path} is shorter than its watermark; reading it from the start")
+            offset = 0
+        f.seek(offset)
+        data = f.read()
+    # A line still being written has no newline yet; leave it for the next run
+    end = data.rfind(b'\n') + 1
+    records = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+    return records, offset + end
+
+def load_records(path):
+    """Records of a JSON array file or a JSONL log"""
+    if is_log(path):
+        return read_log(path)[0]
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def make_watermark(source, rows, tail):
+    """Watermark after training on all of source (a JSONL log, else nothing to resume)"""
+    log = is_log(source)
+    return {
+        'source': os.path.abspath(source) if log else None,
+        'offset': read_log(source)[1] if log else 0,
+        'rows': int(rows),
+        'tail': np.asarray(tail, dtype=np.float64).tolist()
+    }
+
+def _targets(y):
+    y = y.reshape(len(y), -1)
+    return y[:, 0] if y.shape[1] == 1 else y
+
+def update_model(model_dir, metadata, scaler, rows, trees_per_update=TREES_PER_UPDATE, max_trees=MAX_TREES,
+                 epochs=FINE_TUNE_EPOCHS):
+    """
+    Fit the model in model_dir on windows ending in the new raw (n, features)
+    rows; returns (windows, MAE of the old model on them in scaled units)
+    """
+    seq_length = metadata['seq_length']
+    tail = np.asarray(metadata['watermark']['tail'], dtype=np.float64).reshape(-1, rows.shape[1])
+
+    # DataFrame-fitted scalers warn on plain arrays
+    names = getattr(scaler, 'feature_names_in_', None)
+    if names is not None:
+        import pandas as pd
+        scaler.partial_fit(pd.DataFrame(rows, columns=names))
+    else:
+        scaler.partial_fit(rows)
+
+    history = np.vstack([tail, rows])
+    X, y = sliding_windows(history * scaler.scale_ + scaler.min_, seq_length)
+    y = _targets(y)
+    if not len(X):
+        return 0, None
+
+    if metadata.get('model_type') == 'tensorflow_lstm':
+        from tensorflow import keras
+
+        model_path = os.path.join(model_dir, 'model.keras')
+        model = keras.models.load_model(model_path)
+        before = float(np.mean(np.abs(model.predict(X, verbose=0).reshape(y.shape) - y)))
+        model.fit(X, y, epochs=epochs, batch_size=32, verbose=0)
+        model.save(model_path)
+    else:
+        model_path = os.path.join(model_dir, 'model.joblib')
+        model = joblib.load(model_path)
+        X_flat = flat_windows(X)
+        before = float(np.mean(np.abs(model.predict(X_flat).reshape(y.shape) - y)))
+        model.set_params(warm_start=True, n_estimators=len(model.estimators_) + trees_per_update)
+        model.fit(X_flat, y)
+        if len(model.estimators_) > max_trees:
+            # The oldest trees saw the oldest data
+            model.estimators_ = model.estimators_[-max_trees:]
+            model.n_estimators = max_trees
+        joblib.dump(model, model_path)
+    return len(X), before
+
+def update_from_log(model_dir, log_path, to_rows, training_id, **options):
+    """
+    Update the artifact in model_dir with the records appended to log_path
+    since its watermark; to_rows turns records into raw (n, features) rows.
+    Returns the new metadata, or None when there was nothing to read.
+    """
+    metadata_path = os.path.join(model_dir, 'metadata.json')
+    with open(metadata_path, 'r') as f:
+        metadata = json.load(f)
+    if 'watermark' not in metadata or 'seq_length' not in metadata:
+        raise ValueError(f"{model_dir} has no data watermark; train it once without --update")
+    if metadata.get('model_type') not in ('random_forest', 'tensorflow_lstm'):
+        raise ValueError(f"{metadata.get('model_type')} models are not updated incrementally; retrain without --update")
+
+    watermark = metadata['watermark']
+    source = os.path.abspath(log_path)
+    offset = watermark['offset'] if watermark.get('source') == source else 0
+    records, new_offset = read_log(log_path, offset)
+    if not records:
+        print(f"No new rows in {log_path} since training {metadata.get('training_id')}")
+        return None
+    rows = np.asarray(to_rows(records), dtype=np.float64)
+    print(f"Updating with {len(rows)} new rows from {log_path} (bytes {offset}-{new_offset})...")
+
+    scaler_path = os.path.join(model_dir, 'scaler.joblib')
+    scaler = joblib.load(scaler_path)
+    windows, before = update_model(model_dir, metadata, scaler, rows, **options)
+    joblib.dump(scaler, scaler_path)
+
+    seq_length = metadata['seq_length']
+    tail = np.vstack([np.asarray(watermark['tail'], dtype=np.float64).reshape(-1, rows.shape[1]), rows])
+    metadata.update({
+        'previous_training_id': metadata.get('training_id'),
+        'training_id': training_id,
+        'updates': metadata.get('updates', 0) + 1,
+        'update_windows': windows,
+        'update_mae': before,
+        'watermark': {
+            'source': source,
+            'offset': new_offset,
+            'rows': watermark['rows'] + len(rows),
+            'tail': tail[-seq_length:].tolist()
+        }
+    })
+    with open(metadata_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
@@ -0,0 +1,74 @@
+"""
+Zero-copy sliding windows shared by the weather and market sequence trainers
+
+sliding_windows returns (inputs, targets) as read-only strided views of the
+series, so building the training set for years of daily readings across many
+stations or mandis costs no memory beyond the series itself:
+
+  inputs   (n, seq_length[, features])  data[i*stride : i*stride + seq_length]
+  targets  (n, horizon[, features])     the next horizon rows after each window;
+                                        (n[, features]) when horizon is 1
+
+Views are copied only where a model needs contiguous rows, e.g.
+flat_windows for the scikit-learn regressors, and only for the rows passed in.
+
+For several series stored back to back (one per station or market),
+split_segment_windows picks the windows that do not cross from one series
+into the next.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+def window_count(length, seq_length, horizon=1, stride=1):
+    """Number of complete (input, target) windows in a series of this length"""
+    return max(0, (length - seq_length - horizon) // stride + 1)
+
+def _windows(data, size, count, stride):
+    # sliding_window_view appends the window axis last; move it next to the sample axis
+    view = np.moveaxis(sliding_window_view(data, size, axis=0), -1, 1)
+    return view[:(count - 1) * stride + 1:stride]
+
+def sliding_windows(data, seq_length, horizon=1, stride=1):
+    """Read-only (inputs, targets) window views over a 1-D or (time, features) series"""
+    if seq_length < 1 or horizon < 1 or stride < 1:
+        raise ValueError("seq_length, horizon and stride must be positive")
+    data = np.asarray(data)
+    count = window_count(len(data), seq_length, horizon, stride)
+    if count == 0:
+        inputs = np.empty((0, seq_length) + data.shape[1:], dtype=data.dtype)
+        targets = np.empty((0, horizon) + data.shape[1:], dtype=data.dtype)
+    else:
+        inputs = _windows(data, seq_length, count, stride)
+        targets = _windows(data[seq_length:], horizon, count, stride)
+    if horizon == 1:
+        targets = targets[:, 0]
+    return inputs, targets
+
+def flat_windows(windows, dtype=np.float32):
+    """(n, seq_length * features) contiguous copy of window views for a scikit-learn model"""
+    # Tree models work in float32 internally, so this is the only copy they make
+    return np.ascontiguousarray(windows, dtype=dtype).reshape(len(windows), -1)
+
+def split_segment_windows(lengths, seq_length, train_fraction, horizon=1):
+    """
+    (train, validation) indices into sliding_windows of consecutive segments
+    (stations, markets, ...) of these lengths, keeping only the windows that
+    lie inside one segment and splitting each segment chronologically. A
+    single segment gets plain slices, so the windows stay views.
+    """
+    lengths = [int(length) for length in lengths]
+    if len(lengths) == 1:
+        count = window_count(lengths[0], seq_length, horizon)
+        split = int(count * train_fraction)
+        return slice(0, split), slice(split, count)
+
+    train, validation = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    offset = 0
+    for length in lengths:
+        starts = offset + np.arange(window_count(length, seq_length, horizon), dtype=np.int64)
+        split = int(len(starts) * train_fraction)
+        train.append(starts[:split])
+        validation.append(starts[split:])
+        offset += length
+    return np.concatenate(train), np.concatenate(validation)
@@ -0,0 +1,208 @@
+"""
+Columnar time-series store for the weather and market trainers
+
+A store is a directory with one sub-directory per partition (per crop and
+market, per station, ...) holding one .npy file per numeric column, rows
+sorted by date:
+
+  <store>/index.json             columns, partition keys, rows and date range of each partition
+  <store>/part-00000/date.npy    (n,) datetime64[D]
+  <store>/part-00000/price.npy   (n,) float64
+
+SeriesStore memory-maps the columns. read() prunes partitions on their keys
+and date ranges using index.json alone, then binary-searches the sorted date
+column of each remaining partition, so only the requested rows of the
+requested columns are read from disk. Non-numeric columns other than the
+partition keys are not stored.
+
+Build a store from JSON or JSONL records:
+  python series_store.py prices.jsonl [more.jsonl ...] --output mandi_store --partition-by crop,market
+"""
+
+import os
+import json
+import shutil
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from sequence_updates import load_records
+
+STORE_FORMAT_VERSION = 1
+INDEX_NAME = 'index.json'
+DATE_COLUMN = 'date'
+
+def is_store(path):
+    """True when path is a store directory written by write_store"""
+    return bool(path) and os.path.isfile(os.path.join(path, INDEX_NAME))
+
+def _date_range(dates):
+    dates = dates[~np.isnat(dates)]
+    return (str(dates.min()), str(dates.max())) if len(dates) else (None, None)
+
+def write_store(df, store_dir, partition_by=(), date_column=DATE_COLUMN):
+    """Write a DataFrame as a store partitioned by the partition_by columns; returns the index"""
+    partition_by = list(partition_by)
+    missing = [column for column in partition_by if column not in df.columns]
+    if missing:
+        raise ValueError(f"Partition columns not in the data: {missing}")
+
+    columns = [c for c in df.select_dtypes(include=[np.number]).columns if c not in partition_by and c != date_column]
+    frame = df[columns].astype(np.float64)
+    if date_column in df.columns:
+        frame[date_column] = pd.to_datetime(df[date_column], errors='coerce').to_numpy().astype('datetime64[D]')
+    else:
+        date_column = None
+    groups = frame.groupby([df[c].astype(str) for c in partition_by], sort=True) if partition_by else [((), frame)]
+
+    tmp_dir = store_dir.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    partitions = []
+    try:
+        for i, (key, part) in enumerate(groups):
+            if date_column:
+                # NaT sorts last, matching numpy's order for searchsorted
+                part = part.sort_values(date_column, kind='stable')
+            name = f'part-{i:05d}'
+            os.makedirs(os.path.join(tmp_dir, name))
+            for column in part.columns:
+                values = part[column].to_numpy()
+                if column == date_column:
+                    values = values.astype('datetime64[D]')
+                np.save(os.path.join(tmp_dir, name, f'{column}.npy'), values, allow_pickle=False)
+
+            entry = {'dir': name, 'key': dict(zip(partition_by, key if isinstance(key, tuple) else (key,))), 'rows': len(part)}
+            if date_column:
+                entry['date_min'], entry['date_max'] = _date_range(part[date_column].to_numpy().astype('datetime64[D]'))
+            partitions.append(entry)
+
+        index = {
+            'format': STORE_FORMAT_VERSION,
+            'partition_by': partition_by,
+            'columns': columns,
+            'date_column': date_column,
+            'rows': int(sum(p['rows'] for p in partitions)),
+            'partitions': partitions
+        }
+        with open(os.path.join(tmp_dir, INDEX_NAME), 'w') as f:
+            json.dump(index, f, indent=2)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    shutil.rmtree(store_dir, ignore_errors=True)
+    os.replace(tmp_dir, store_dir)
+    return index
+
+def _day(value):
+    return None if value is None else np.datetime64(str(value)[:10], 'D')
+
+class SeriesStore:
+    """Memory-mapped reader for a store written by write_store"""
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, INDEX_NAME), 'r') as f:
+            index = json.load(f)
+        if index.get('format') != STORE_FORMAT_VERSION:
+            raise ValueError(f"{store_dir} has store format {index.get('format')}, expected {STORE_FORMAT_VERSION}")
+        self.partition_by = index['partition_by']
+        self.columns = index['columns']
+        self.date_column = index['date_column']
+        self.rows = index['rows']
+        self.partitions = index['partitions']
+
+    def __len__(self):
+        return self.rows
+
+    def _load(self, partition, column):
+        return np.load(os.path.join(self.store_dir, partition['dir'], f'{column}.npy'), mmap_mode='r', allow_pickle=False)
+
+    def select(self, start=None, end=None, **where):
+        """
+        Partitions whose keys match where (a value or a list of values per
+        partition column) and whose date range overlaps [start, end], from
+        index.json alone
+        """
+        unknown = set(where) - set(self.partition_by)
+        if unknown:
+            raise ValueError(f"Not partition columns of {self.store_dir}: {sorted(unknown)}")
+        wanted = {k: {str(v) for v in (values if isinstance(values, (list, tuple, set)) else [values])}
+                  for k, values in where.items()}
+        start, end = _day(start), _day(end)
+
+        selected = []
+        for partition in self.partitions:
+            if any(partition['key'][k] not in values for k, values in wanted.items()):
+                continue
+            if self.date_column and (start is not None or end is not None):
+                if partition['date_min'] is None:
+                    continue
+                if end is not None and _day(partition['date_min']) > end:
+                    continue
+                if start is not None and _day(partition['date_max']) < start:
+                    continue
+            selected.append(partition)
+        return selected
+
+    def _row_slice(self, partition, start, end):
+        if not self.date_column or (start is None and end is None):
+            return slice(0, partition['rows'])
+        dates = self._load(partition, self.date_column)
+        low = 0 if start is None else np.searchsorted(dates, start, side='left')
+        if end is None:
+            # Undated rows sort last and are outside every date range
+            high = np.searchsorted(dates, np.datetime64('NaT'), side='left')
+        else:
+            high = np.searchsorted(dates, end, side='right')
+        return slice(int(low), int(high))
+
+    def _parts(self, columns, start, end, where):
+        unknown = [c for c in columns if c not in self.columns and c != self.date_column and c not in self.partition_by]
+        if unknown:
+            raise ValueError(f"Columns not in {self.store_dir}: {unknown}")
+        stored = [c for c in columns if c not in self.partition_by]
+        for partition in self.select(start, end, **where):
+            rows = self._row_slice(partition, _day(start), _day(end))
+            yield partition['key'], rows.stop - rows.start, {c: self._load(partition, c)[rows] for c in stored}
+
+    def iter_partitions(self, columns, start=None, end=None, **where):
+        """(partition key, {column: memory-mapped rows in [start, end]}) for each matching partition"""
+        for key, _, values in self._parts(columns, start, end, where):
+            yield key, values
+
+    def read(self, columns, start=None, end=None, **where):
+        """{column: array} over all matching partitions; partition key columns are repeated per row"""
+        parts = list(self._parts(columns, start, end, where))
+        result = {}
+        for column in columns:
+            if column in self.partition_by:
+                keys = np.array([key[column] for key, _, _ in parts], dtype=str)
+                result[column] = np.repeat(keys, [rows for _, rows, _ in parts])
+            elif parts:
+                result[column] = np.concatenate([values[column] for _, _, values in parts])
+            else:
+                result[column] = np.zeros(0, dtype='datetime64[D]' if column == self.date_column else np.float64)
+        return result
+
+    def read_frame(self, columns, start=None, end=None, **where):
+        return pd.DataFrame(self.read(columns, start, end, **where), columns=columns)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a columnar time-series store from JSON or JSONL records')
+    parser.add_argument('inputs', nargs='+', help='JSON array or JSONL files')
+    parser.add_argument('--output', required=True, help='Store directory to write')
+    parser.add_argument('--partition-by', type=str, default='', help='Comma-separated partition columns, e.g. crop,market')
+    parser.add_argument('--date-column', type=str, default=DATE_COLUMN, help='Column the rows are sorted and filtered on')
+    args = parser.parse_args()
+
+    df = pd.concat([pd.DataFrame(load_records(path)) for path in args.inputs], ignore_index=True)
+    partition_by = [column for column in args.partition_by.split(',') if column]
+    index = write_store(df, args.output, partition_by, args.date_column)
+    print(f"✅ Wrote {index['rows']} rows in {len(index['partitions'])} partitions "
+          f"({', '.join(index['columns'])}) to {args.output}")
+
+if __name__ == "__main__":
+    main()